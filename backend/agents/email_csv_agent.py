@@ -3,7 +3,7 @@ import io
 import time
 import pandas as pd
 from modules.email_module import EmailModule
-from modules.database_module import DatabaseModule
+from modules.database_module import get_database
 from dotenv import load_dotenv
 from datetime import datetime
 
@@ -18,7 +18,7 @@ class EmailCSVAgent:
     """
     def __init__(self):
         self.email_module = EmailModule()
-        self.db_module = DatabaseModule()
+        self.db_module = get_database()
 
     def wait_and_sync(self, poll_interval=30, max_wait=600):
         """
@@ -1,18 +1,23 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, BackgroundTasks, Depends, Header
-from sqlalchemy import text
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, BackgroundTasks, Depends, Header, Request
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 from modules.email_module import EmailModule
 from modules.scrubbing_engine import ScrubbingEngine
 from modules.alerting_system import AlertingSystem
-from modules.upload_handler import UploadHandler
-from modules.database_module import DatabaseModule
+from modules.upload_handler import UploadHandler, BodyPipe
+from modules.database_module import get_database, result_set_query, parse_result_set_reference
+from modules.async_db import AsyncDatabase, run_cpu
+from modules import result_export
+from modules.campaign_launch import create_campaign_launch, run_campaign_launch
+from modules.feed_ingestion import ingest_feed
+from modules.retention import run_retention
 from agents.obd_prompt_agent import OBDPromptAgent
 from agents.email_csv_agent import EmailCSVAgent
 from modules.voip_module import voip_module
 from modules.logging_system import logger
+from modules.scrub_jobs import submit_scrub_job_stream, run_streaming_scrub_job
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, Response
+from fastapi.responses import HTMLResponse, Response, StreamingResponse, FileResponse
 import jwt
 import os
 import threading
@@ -47,6 +52,7 @@ async def lifespan(app: FastAPI):
         ngrok.kill()
         print("DEBUG: NGROK Tunnel stopped.")
     
+    await adb.close()
     from modules.load_distributor import load_distributor
     load_distributor.shutdown()
     print("DEBUG: Application shutdown. LoadDistributor stopped.")
@@ -90,6 +96,14 @@ def get_current_username(authorization: str = Header(None)):
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
 
+# Users allowed to change exclusion lists (feed ingestion), run retention and read any results
+ADMIN_USERNAMES = {u.strip() for u in os.getenv("ADMIN_USERNAMES", "admin,admin@vocal-sync.com").split(",") if u.strip()}
+
+
+def is_admin(username: str) -> bool:
+    return username in ADMIN_USERNAMES
+
+
 # Enable CORS
 app.add_middleware(
     CORSMiddleware,
@@ -109,7 +123,8 @@ scrubbing_engine = ScrubbingEngine()
 alerting_system = AlertingSystem()
 upload_handler = UploadHandler()
 prompt_agent = OBDPromptAgent()
-db = DatabaseModule()
+db = get_database()
+adb = AsyncDatabase(db)
 
 @app.get("/ai-status")
 async def get_ai_status():
@@ -152,6 +167,7 @@ class ScheduleRequest(BaseModel):
 
 class ProcessRequest(BaseModel):
     msisdn_list: Optional[List[str]] = []
+    upload_id: Optional[str] = None
     operator: Optional[str] = None
     email_context: Optional[str] = None
     options: Optional[Dict[str, bool]] = None
@@ -192,7 +208,7 @@ async def fetch_request():
 
 @app.post("/login")
 async def login(request: LoginRequest):
-    if db.verify_admin_user(request.username, request.password):
+    if await adb.verify_admin_user(request.username, request.password):
         token = create_token(request.username)
         return {"status": "success", "token": token, "username": request.username}
     raise HTTPException(status_code=401, detail="Invalid username or password")
@@ -203,66 +219,208 @@ async def auth_me(username: str = Depends(get_current_username)):
 
 @app.post("/create-user")
 async def create_user(request: LoginRequest):
-    if db.create_admin_user(request.username, request.password):
+    # bcrypt hashing is CPU-bound; keep it off the event loop
+    if await run_cpu(db.create_admin_user, request.username, request.password):
         return {"status": "success", "message": f"User {request.username} successfully created in database"}
     raise HTTPException(status_code=500, detail="Failed to create user or user already exists")
 
+SCRUB_BODY_SPOOL_BYTES = 1024 * 1024
+
+
+def _submit_scrub_body(body, content_type, content_encoding, username, operator=None, options=None):
+    """
+    Parses a spooled /scrub body and streams its MSISDNs into a new scrub job.
+    Blocking; runs in a worker thread.
+    """
+    import itertools
+    import json
+    try:
+        meta, blocks = upload_handler.open_request_body(body, content_type, content_encoding)
+        if operator is not None:
+            meta.setdefault("operator", operator)
+        if options:
+            meta.setdefault("options", json.loads(options))
+        request = ProcessRequest(**meta)
+        if request.upload_id:
+            blocks = upload_handler.iter_upload(request.upload_id)
+        blocks = (b for b in blocks if b)
+        first = next(blocks, None)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=400, detail=f"Unknown upload: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid scrub request body: {e}")
+    if first is None:
+        raise HTTPException(status_code=400, detail="Empty MSISDN list")
+
+    return submit_scrub_job_stream(
+        db, scrubbing_engine, username, itertools.chain([first], blocks),
+        request.operator, request.options or {},
+    )
+
+
 @app.post("/scrub")
-async def scrub_base(request: ProcessRequest, current_username: str = Depends(get_current_username)):
+async def scrub_base(
+    request: Request,
+    operator: Optional[str] = None,
+    options: Optional[str] = None,
+    current_username: str = Depends(get_current_username),
+):
     """
     Creates a scrub job for the provided MSISDN list with specific options.
     Heavy scrubbing is handled asynchronously by a worker.
+
+    The body is spooled (to disk past 1 MB) and parsed incrementally straight
+    into the job inputs, never as one Python list. Accepted bodies:
+    - application/json: ProcessRequest shape; upload_id may reference a base
+      already parsed by /upload so the browser never re-sends it
+    - text/plain or application/x-ndjson: one MSISDN per line
+    - application/octet-stream: packed little-endian int64 MSISDNs
+    Any of them may be sent with Content-Encoding: gzip. For non-JSON bodies
+    operator and options (JSON object) are taken from the query string.
     """
+    import tempfile
+    body = tempfile.SpooledTemporaryFile(max_size=SCRUB_BODY_SPOOL_BYTES)
     try:
-        msisdns = request.msisdn_list or []
-        if not msisdns:
-            raise HTTPException(status_code=400, detail="Empty MSISDN list")
-
-        # Determine logical username from auth token
-        username = current_username
-
-        # 1. Create job metadata
-        job_id = db.create_scrub_job(
-            username=username,
-            total_input=len(msisdns),
-            operator=request.operator,
-            options=request.options or {},
+        async for chunk in request.stream():
+            body.write(chunk)
+        body.seek(0)
+        # Body parsing is CPU-bound; it shares the bounded CPU pool with /upload
+        return await run_cpu(
+            _submit_scrub_body, body,
+            request.headers.get("content-type"), request.headers.get("content-encoding"),
+            current_username, operator, options,
         )
-        if not job_id:
-            raise HTTPException(status_code=500, detail="Failed to create scrub job")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.log("backend", "error", f"Scrub job creation error: {e}", "scrub")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        body.close()
+
+@app.post("/scrub-stream")
+async def scrub_stream(
+    request: Request,
+    filename: str = "upload.csv",
+    operator: Optional[str] = None,
+    options: Optional[str] = None,
+    current_username: str = Depends(get_current_username),
+):
+    """
+    Scrub-while-uploading: the raw request body is the base file itself
+    (.csv, .txt, optionally .gz; filename picks the format). Chunks are
+    parsed, scrubbed and their survivors stored while the rest of the body
+    is still arriving, and the finished job is returned. Progress is
+    visible through /scrub-jobs while the upload runs.
+    """
+    import io
+    import json
+    try:
+        scrub_options = ProcessRequest(options=json.loads(options) if options else None).options or {}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid options: {e}")
 
-        # 2. Persist raw inputs for chunked processing
-        if not db.add_scrub_job_inputs(job_id, msisdns):
-            raise HTTPException(status_code=500, detail="Failed to persist job inputs")
+    pipe = BodyPipe()
 
-        # 3. Enqueue for background processing (Redis or in-process worker will pick it up)
+    def run_pipeline():
         try:
-            from modules.cache_engine import cache_engine
-            queue_key = "scrub_jobs_queue"
-            existing = cache_engine.get(queue_key) or []
-            existing.append(job_id)
-            cache_engine.set(queue_key, existing, expire=None)
-        except Exception as qe:
-            print(f"Queue Enqueue Warning: {qe}")
+            return run_streaming_scrub_job(
+                db, scrubbing_engine, upload_handler, current_username,
+                io.BufferedReader(pipe, buffer_size=1024 * 1024), filename, operator, scrub_options,
+            )
+        finally:
+            pipe.abort()
+
+    job = asyncio.create_task(asyncio.to_thread(run_pipeline))
+    try:
+        async for chunk in request.stream():
+            if chunk and not await asyncio.to_thread(pipe.feed, chunk):
+                break  # pipeline stopped early; its error is raised below
+        await asyncio.to_thread(pipe.feed, None)
+    except Exception as e:
+        await asyncio.to_thread(pipe.fail, e)
 
-        logger.log(
-            "backend",
-            "info",
-            f"Scrub job {job_id} created for user {username} with {len(msisdns)} records",
-            "scrub",
-        )
+    try:
+        return await job
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.log("backend", "error", f"Streaming scrub error: {e}", "scrub")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        return {
-            "job_id": job_id,
-            "status": "QUEUED",
-            "total_input": len(msisdns),
-        }
-    except HTTPException:
-        raise
+@app.post("/ingest-feed/{feed}")
+async def ingest_feed_endpoint(
+    feed: str,
+    request: Request,
+    filename: str = "feed.csv",
+    mode: str = "delta",
+    service_id: str = "PROMO",
+    status: str = "ACTIVE",
+    current_username: str = Depends(get_current_username),
+):
+    """
+    Bulk-loads an operator feed into an exclusion list (feed: dnd / sub /
+    unsub). The raw request body is the feed file (.csv, .txt, optionally
+    .gz; filename picks the format) and is staged while it arrives.
+    mode=delta adds new numbers (and overwrites subscription status),
+    mode=replace makes the list match the feed. ADMIN_USERNAMES only: the
+    exclusion lists gate every campaign.
+    """
+    import io
+    if not is_admin(current_username):
+        raise HTTPException(status_code=403, detail="Feed ingestion requires admin privileges")
+    pipe = BodyPipe()
+
+    def run_ingestion():
+        try:
+            return ingest_feed(
+                db, upload_handler, feed, io.BufferedReader(pipe, buffer_size=1024 * 1024), filename,
+                mode=mode, service_id=service_id, status=status, username=current_username,
+            )
+        finally:
+            pipe.abort()
+
+    run = asyncio.create_task(asyncio.to_thread(run_ingestion))
+    try:
+        async for chunk in request.stream():
+            if chunk and not await asyncio.to_thread(pipe.feed, chunk):
+                break  # ingestion stopped early; its error is raised below
+        await asyncio.to_thread(pipe.feed, None)
+    except Exception as e:
+        await asyncio.to_thread(pipe.fail, e)
+
+    try:
+        return await run
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.log("backend", "error", f"Scrub job creation error: {e}", "scrub")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/feed-ingestions")
+async def list_feed_ingestions(current_username: str = Depends(get_current_username)):
+    """Recent feed ingestion runs with their row counts."""
+    runs = await adb.execute_query("SELECT * FROM feed_ingestion_runs ORDER BY created_at DESC LIMIT 50")
+    for run in runs:
+        for k, v in run.items():
+            if hasattr(v, 'isoformat'):
+                run[k] = v.isoformat()
+    return {"status": "success", "data": runs}
+
+@app.post("/retention/run")
+async def run_retention_endpoint(dry_run: bool = True, current_username: str = Depends(get_current_username)):
+    """
+    One retention pass (see modules.retention): purges old job inputs,
+    archives and drops expired results, compacts the exclusion change log.
+    Defaults to a dry run that only reports what would be reclaimed.
+    ADMIN_USERNAMES only.
+    """
+    if not is_admin(current_username):
+        raise HTTPException(status_code=403, detail="Retention runs require admin privileges")
+    report = await adb.run_sync(run_retention, db, dry_run)
+    if report is None:
+        raise HTTPException(status_code=409, detail="A retention run is already in progress")
+    return {"status": "success", "data": report}
+
 def post_scrub_processing(final_base, report):
     """Heavy I/O tasks run in background to prevent UI timeouts."""
     import time
@@ -311,8 +469,11 @@ def post_scrub_processing(final_base, report):
     logger.log("backend", "success", f"Post-scrub processing completed ({duration:.2f}s)", "post_scrub")
 
 class LaunchRequest(BaseModel):
-    msisdn_list: List[str]
+    msisdn_list: Optional[List[str]] = None
     project_name: str = "default"
+    # Launch straight from stored results instead of posting the list back
+    job_id: Optional[int] = None
+    results_table: Optional[str] = None
 
 class VOIPRequest(BaseModel):
     msisdn: str
@@ -323,37 +484,295 @@ class VOIPRequest(BaseModel):
 @app.get("/scrub-job/{job_id}")
 async def get_scrub_job(job_id: int, current_username: str = Depends(get_current_username)):
     """Returns metadata for a single scrub job."""
-    job = db.get_scrub_job(job_id, username=current_username)
+    job = await adb.get_scrub_job(job_id, username=current_username)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     return {"job": job}
 
+class SavedAudienceRequest(BaseModel):
+    name: str
+    msisdn_list: Optional[List[str]] = []
+    job_id: Optional[int] = None
+    operator: Optional[str] = None
+    options: Optional[Dict[str, bool]] = None
+
+@app.post("/saved-audiences")
+async def create_saved_audience(request: SavedAudienceRequest, current_username: str = Depends(get_current_username)):
+    """
+    Stores a base once (normalized) with its scrub outcome so later re-scrubs
+    only process exclusion-list changes. The base comes from msisdn_list or
+    from the inputs of an existing scrub job.
+    """
+    msisdns = request.msisdn_list or []
+    operator, options = request.operator, request.options
+    if request.job_id:
+        job = await adb.get_scrub_job(request.job_id, username=current_username)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        msisdns = await adb.run_sync(
+            lambda: [m for chunk in db.load_scrub_job_inputs(request.job_id) for m in chunk]
+        )
+        operator = operator or job.get("operator")
+        if options is None:
+            import json
+            options = json.loads(job.get("options_json") or "{}")
+    if not msisdns:
+        raise HTTPException(status_code=400, detail="Empty MSISDN list")
+    try:
+        result = await asyncio.to_thread(
+            scrubbing_engine.create_saved_audience,
+            current_username, request.name, msisdns, operator, options,
+        )
+        logger.log(
+            "backend",
+            "success",
+            f"Saved audience {result['audience_id']} '{request.name}' stored: {result['final_count']}/{result['unique_count']} pass",
+            "saved_audience",
+        )
+        return result
+    except Exception as e:
+        logger.log("backend", "error", f"Saved audience creation error: {e}", "saved_audience")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/saved-audiences")
+async def list_saved_audiences(current_username: str = Depends(get_current_username)):
+    """Lists the saved audiences of the current user."""
+    audiences = await adb.execute_query(
+        "SELECT * FROM saved_audiences WHERE username = :username ORDER BY created_at DESC",
+        {"username": current_username},
+    )
+    return {"audiences": audiences}
+
+@app.post("/saved-audiences/{audience_id}/rescrub")
+async def rescrub_saved_audience(audience_id: int, save_results: bool = False, current_username: str = Depends(get_current_username)):
+    """Delta re-scrub of a saved audience against exclusion-list changes since its watermark."""
+    try:
+        report = await asyncio.to_thread(
+            scrubbing_engine.rescrub_saved_audience, audience_id, current_username, save_results
+        )
+    except Exception as e:
+        logger.log("backend", "error", f"Saved audience {audience_id} re-scrub error: {e}", "saved_audience")
+        raise HTTPException(status_code=500, detail=str(e))
+    if report is None:
+        raise HTTPException(status_code=404, detail="Saved audience not found")
+    logger.log(
+        "backend",
+        "success",
+        f"Saved audience {audience_id} re-scrubbed: {report['members_checked']} checked, "
+        f"{report['members_updated']} updated, final {report['final_count']}",
+        "saved_audience",
+    )
+    return report
+
+RESULTS_PAGE_MAX = 50000
+
+
+async def _load_results(reference, limit=10000, cursor=None):
+    """One keyset page of a result set; next_cursor is null on the last page."""
+    limit = max(1, min(int(limit), RESULTS_PAGE_MAX))
+    try:
+        query, params = result_set_query(reference, limit, after=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        rows = await adb.fetch_all(query, params)
+        total = None
+        set_id = parse_result_set_reference(reference)
+        if set_id is not None:
+            row = await adb.fetch_one("SELECT row_count FROM scrub_result_sets WHERE id = :id", {"id": set_id})
+            total = row["row_count"] if row else None
+        return {
+            "msisdns": [r['msisdn'] for r in rows],
+            "count": len(rows),
+            "total": total if total is not None else len(rows),
+            "next_cursor": rows[-1]["cursor"] if len(rows) == limit else None,
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _stream_results(reference, name, fmt="csv", gzip=False):
+    """
+    Streams a whole result set as CSV or NDJSON (optionally gzip) from a
+    server-side cursor; memory stays flat for any result size.
+    """
+    import zlib
+    from json.encoder import encode_basestring as quote
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    try:
+        result_set_query(reference)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def body():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+        if fmt == "csv":
+            head = "msisdn\n"
+            yield compressor.compress(head.encode()) if compressor else head.encode()
+        for block in db.iter_result_set(reference):
+            if fmt == "csv":
+                chunk = "\n".join(block) + "\n"
+            else:
+                chunk = "".join(['{"msisdn": ' + quote(m) + '}\n' for m in block])
+            data = chunk.encode()
+            yield compressor.compress(data) if compressor else data
+        if compressor:
+            yield compressor.flush()
+
+    filename = f"{name}.{fmt}" + (".gz" if gzip else "")
+    media_type = "application/gzip" if gzip else ("text/csv" if fmt == "csv" else "application/x-ndjson")
+    return StreamingResponse(
+        body(), media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+async def _complete_reference(reference):
+    """
+    The reference itself if its results can be served whole: a result set
+    still being written (streaming job running) or left behind by a failed
+    writer has no closed_at and gets a 409 instead of a partial page or file.
+    Results expired by modules.retention get a 410 naming their archive.
+    """
+    archived = await adb.fetch_one(
+        "SELECT path, archived_at FROM retention_archives WHERE reference = :reference", {"reference": reference}
+    )
+    if archived:
+        raise HTTPException(
+            status_code=410,
+            detail=f"Results {reference} expired and were archived to {archived['path']} on {archived['archived_at']:%Y-%m-%d}",
+        )
+    set_id = parse_result_set_reference(reference)
+    if set_id is None:
+        return reference
+    row = await adb.fetch_one("SELECT closed_at FROM scrub_result_sets WHERE id = :id", {"id": set_id})
+    if not row:
+        raise HTTPException(status_code=404, detail="Result set not found")
+    if row["closed_at"] is None:
+        raise HTTPException(status_code=409, detail=f"Result set {reference} is incomplete (still running or failed)")
+    return reference
+
+async def _owned_reference(reference, username):
+    """
+    _complete_reference for a results reference named directly: it must be
+    the results of one of the caller's completed jobs (admins may read any,
+    e.g. email CSV result sets), else 404 before anything else is revealed.
+    """
+    if not is_admin(username):
+        owned = await adb.fetch_one(
+            "SELECT 1 AS owned FROM scrub_jobs WHERE username = :username AND results_table = :reference "
+            "AND status = 'COMPLETED' LIMIT 1",
+            {"username": username, "reference": reference},
+        )
+        if not owned:
+            raise HTTPException(status_code=404, detail="Results not found")
+    return await _complete_reference(reference)
+
+async def _job_results_reference(job_id, username):
+    job = await adb.get_scrub_job(job_id, username=username)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.get("status") != "COMPLETED" or not job.get("results_table"):
+        raise HTTPException(status_code=409, detail=f"Job is {job.get('status')}; no results yet")
+    return await _complete_reference(job["results_table"])
+
 @app.get("/scrub-results/{table_name}")
-async def get_scrub_results(table_name: str, current_username: str = Depends(get_current_username)):
-    """Fetches verified MSISDNs from a completed scrub results table."""
-    # Basic safety check to ensure it's a scrub results table
-    if not table_name.startswith("scrub_results_") and not table_name.startswith("email_csv_"):
-        raise HTTPException(status_code=400, detail="Invalid results table name")
-    
+async def get_scrub_results(table_name: str, limit: int = 10000, cursor: Optional[str] = None, current_username: str = Depends(get_current_username)):
+    """Keyset-paginated MSISDNs of a result set (result_set_<id>) or a legacy results table."""
+    return await _load_results(await _owned_reference(table_name, current_username), limit, cursor)
+
+@app.get("/scrub-results/{table_name}/download")
+async def download_scrub_results(table_name: str, format: str = "csv", gzip: bool = False, current_username: str = Depends(get_current_username)):
+    """Streams a complete result set as CSV / NDJSON (gzip optional)."""
+    return _stream_results(await _owned_reference(table_name, current_username), table_name, format, gzip)
+
+@app.get("/scrub-job/{job_id}/results")
+async def get_scrub_job_results(job_id: int, limit: int = 10000, cursor: Optional[str] = None, current_username: str = Depends(get_current_username)):
+    """Keyset-paginated verified MSISDNs of a completed scrub job (or the job it reused)."""
+    return await _load_results(await _job_results_reference(job_id, current_username), limit, cursor)
+
+@app.get("/scrub-job/{job_id}/results/download")
+async def download_scrub_job_results(job_id: int, format: str = "csv", gzip: bool = False, current_username: str = Depends(get_current_username)):
+    """Streams every verified MSISDN of a completed scrub job as CSV / NDJSON (gzip optional)."""
+    reference = await _job_results_reference(job_id, current_username)
+    return _stream_results(reference, f"scrub_job_{job_id}", format, gzip)
+
+
+async def _export_response(reference, name, fmt):
+    """Columnar export (Parquet / Arrow IPC) of a result set, built on first request."""
+    if not result_export.available():
+        raise HTTPException(status_code=501, detail="Columnar exports need pyarrow on the server")
     try:
-        rows = db.execute_query(f"SELECT msisdn FROM {table_name} LIMIT 10000")
-        msisdns = [r['msisdn'] for r in rows]
-        return {"msisdns": msisdns, "total": len(msisdns)}
+        path = await adb.run_sync(result_export.ensure_export, db, reference, fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return FileResponse(
+        path,
+        media_type=result_export.EXPORT_MEDIA_TYPES[fmt],
+        filename=f"{name}.{result_export.EXPORT_EXTENSIONS[fmt]}",
+    )
+
+@app.get("/scrub-results/{table_name}/export")
+async def export_scrub_results(table_name: str, format: str = "parquet", current_username: str = Depends(get_current_username)):
+    """Result set as a compressed Parquet or Arrow IPC file (int64 msisdn, operator)."""
+    return await _export_response(await _owned_reference(table_name, current_username), table_name, format)
+
+@app.get("/scrub-job/{job_id}/results/export")
+async def export_scrub_job_results(job_id: int, format: str = "parquet", current_username: str = Depends(get_current_username)):
+    """Final base of a completed scrub job as a compressed Parquet or Arrow IPC file."""
+    reference = await _job_results_reference(job_id, current_username)
+    return await _export_response(reference, f"scrub_job_{job_id}", format)
 
 
 @app.get("/scrub-jobs")
 async def list_scrub_jobs(current_username: str = Depends(get_current_username)):
     """Lists recent scrub jobs for a user."""
-    jobs = db.list_scrub_jobs(username=current_username)
+    jobs = await adb.list_scrub_jobs(username=current_username)
     return {"jobs": jobs}
 
 @app.post("/launch-campaign")
-async def launch_campaign(request: LaunchRequest):
-    """Saves verified MSISDNs into a single project table."""
+async def launch_campaign(request: LaunchRequest, background_tasks: BackgroundTasks, current_username: str = Depends(get_current_username)):
+    """
+    Saves verified MSISDNs into a single project table. With a job_id or
+    results_table (of one of the caller's completed jobs) the targets are
+    copied database-side in the background; poll /launch-campaign/{launch_id}
+    for progress.
+    """
+    if request.job_id is not None or request.results_table:
+        if request.job_id is not None:
+            reference = await _job_results_reference(request.job_id, current_username)
+        else:
+            owned = await adb.fetch_one(
+                "SELECT 1 AS owned FROM scrub_jobs WHERE username = :username AND results_table = :reference "
+                "AND status = 'COMPLETED' LIMIT 1",
+                {"username": current_username, "reference": request.results_table},
+            )
+            if not owned:
+                raise HTTPException(status_code=404, detail="Results not found")
+            reference = await _complete_reference(request.results_table)
+        try:
+            launch_id = await adb.run_sync(
+                create_campaign_launch, db, request.project_name, reference,
+                job_id=request.job_id, username=current_username,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        background_tasks.add_task(run_campaign_launch, db, launch_id)
+        return {
+            "status": "accepted",
+            "launch_id": launch_id,
+            "message": f"Launch {launch_id} started: copying {reference} into project '{request.project_name}'",
+        }
+    if request.msisdn_list is None:
+        raise HTTPException(status_code=400, detail="Provide msisdn_list, job_id or results_table")
     try:
-        success, message = db.save_campaign_targets_project(
+        success, message = await adb.run_sync(
+            db.save_campaign_targets_project,
             request.msisdn_list, 
             request.project_name
         )
@@ -365,11 +784,25 @@ async def launch_campaign(request: LaunchRequest):
         print(f"DEBUG: Launch error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/launch-campaign/{launch_id}")
+async def get_launch_status(launch_id: int, current_username: str = Depends(get_current_username)):
+    """Progress of one of the caller's server-side campaign launches."""
+    launch = await adb.fetch_one(
+        "SELECT * FROM campaign_launches WHERE id = :id AND username = :username",
+        {"id": launch_id, "username": current_username},
+    )
+    if not launch:
+        raise HTTPException(status_code=404, detail="Launch not found")
+    for k, v in launch.items():
+        if hasattr(v, 'isoformat'):
+            launch[k] = v.isoformat()
+    return {"status": "success", "launch": launch}
+
 @app.post("/log-scrub-entry")
 async def log_scrub_entry(request: LogScrubRequest):
     """Logs the scrub statistics explicitly via button click."""
     try:
-        success, message = db.log_scrub_history(request.model_dump())
+        success, message = await adb.run_sync(db.log_scrub_history, request.model_dump())
         if success:
             return {"status": "success", "message": message}
         else:
@@ -382,7 +815,7 @@ async def log_scrub_entry(request: LogScrubRequest):
 async def get_scrub_history():
     """Fetches all scrub history log entries."""
     try:
-        entries = db.get_scrub_history()
+        entries = await adb.execute_query("SELECT * FROM scrub_history_log ORDER BY logged_at DESC LIMIT 50")
         # Convert datetime objects to string for JSON serialization
         for entry in entries:
             for k, v in entry.items():
@@ -411,38 +844,68 @@ async def verify_email():
         raise HTTPException(status_code=500, detail=f"Email Verification Failed: {message}")
 
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...), account: str = Form("")):
-    """Handles MSISDN file uploads with optional account tagging."""
+async def upload_file(
+    file: UploadFile = File(...),
+    account: str = Form(""),
+    include_msisdns: Optional[bool] = Form(None),
+    create_job: bool = Form(False),
+    operator: Optional[str] = Form(None),
+    options: Optional[str] = Form(None),
+    authorization: str = Header(None),
+):
+    """
+    Handles MSISDN file uploads with optional account tagging.
+    The spooled upload is parsed incrementally in fixed-size blocks into a
+    parsed upload (upload_id); only counts and a preview are returned unless
+    include_msisdns is set (legacy clients, default when no job is created).
+    With create_job=true (authenticated), the scrub job is created directly
+    from the parsed upload and only job_id, counts and a preview come back.
+    """
     try:
-        content = await file.read()
-        extension = os.path.splitext(file.filename)[1]
-        msisdns = upload_handler.process_file(content, extension)
+        username = get_current_username(authorization) if create_job else None
+        # pandas/pyarrow parsing runs on the bounded CPU pool
+        result = await run_cpu(upload_handler.ingest_file, file.file, file.filename)
+        count = result["count"]
         
         # Log upload metadata to database
-        if account and db.engine:
+        if account and adb.available:
             try:
-                with db.engine.connect() as conn:
-                    conn.execute(text("""
-                        CREATE TABLE IF NOT EXISTS upload_history (
-                            id SERIAL PRIMARY KEY,
-                            account VARCHAR(100) NOT NULL,
-                            filename VARCHAR(255),
-                            msisdn_count INT DEFAULT 0,
-                            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        )
-                    """))
-                    conn.execute(
-                        text("INSERT INTO upload_history (account, filename, msisdn_count) VALUES (:account, :filename, :count)"),
-                        {"account": account, "filename": file.filename, "count": len(msisdns)}
-                    )
-                    conn.commit()
-                    print(f"DEBUG: Upload logged for account '{account}': {file.filename} ({len(msisdns)} records)")
+                await adb.execute(
+                    "INSERT INTO upload_history (account, filename, msisdn_count) VALUES (:account, :filename, :count)",
+                    {"account": account, "filename": file.filename, "count": count}
+                )
+                print(f"DEBUG: Upload logged for account '{account}': {file.filename} ({count} records)")
             except Exception as db_err:
                 print(f"DEBUG: Upload history log warning (non-fatal): {db_err}")
 
-        res_data = {"count": len(msisdns), "msisdns": msisdns, "total": len(msisdns), "account": account}
+        res_data = {
+            "upload_id": result["upload_id"],
+            "count": count,
+            "total": count,
+            "raw_count": result["raw_count"],
+            "invalid_count": result["invalid_count"],
+            "duplicate_count": result["duplicate_count"],
+            "timings": result["timings"],
+            "preview": result["preview"],
+            "account": account,
+        }
+        if create_job and count:
+            import json
+            job = await asyncio.to_thread(
+                submit_scrub_job_stream, db, scrubbing_engine, username,
+                upload_handler.iter_upload(result["upload_id"]), operator,
+                json.loads(options) if options else {},
+            )
+            job.pop("preview", None)
+            res_data.update(job)
+        if include_msisdns is None:
+            include_msisdns = not create_job
+        if include_msisdns:
+            res_data["msisdns"] = [m for block in upload_handler.iter_upload(result["upload_id"]) for m in block]
         print(f"DEBUG: Returning response with total: {res_data['total']}, account: {account}")
         return res_data
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"DEBUG: Upload error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -450,23 +913,21 @@ async def upload_file(file: UploadFile = File(...), account: str = Form("")):
 @app.get("/upload-history")
 async def get_upload_history(account: str = None):
     """Fetches upload history, optionally filtered by account."""
-    if not db.engine:
+    if not adb.available:
         return {"data": []}
     try:
-        with db.engine.connect() as conn:
-            if account:
-                rows = conn.execute(
-                    text("SELECT * FROM upload_history WHERE account = :account ORDER BY uploaded_at DESC LIMIT 50"),
-                    {"account": account}
-                )
-            else:
-                rows = conn.execute(text("SELECT * FROM upload_history ORDER BY uploaded_at DESC LIMIT 50"))
-            data = [dict(r) for r in rows.mappings()]
-            for entry in data:
-                for k, v in entry.items():
-                    if hasattr(v, 'isoformat'):
-                        entry[k] = v.isoformat()
-            return {"data": data}
+        if account:
+            data = await adb.fetch_all(
+                "SELECT * FROM upload_history WHERE account = :account ORDER BY uploaded_at DESC LIMIT 50",
+                {"account": account}
+            )
+        else:
+            data = await adb.fetch_all("SELECT * FROM upload_history ORDER BY uploaded_at DESC LIMIT 50")
+        for entry in data:
+            for k, v in entry.items():
+                if hasattr(v, 'isoformat'):
+                    entry[k] = v.isoformat()
+        return {"data": data}
     except Exception as e:
         print(f"DEBUG: Upload history error: {e}")
         return {"data": []}
@@ -640,31 +1101,26 @@ async def generate_content(request: ProcessRequest):
     flow = prompt_agent.generate_flow_mermaid(context)
     return {"prompts": prompts, "flow": flow}
 
-@app.get("/db-stats")
-async def get_db_stats():
-    """Returns counts with Cache integration to avoid overloading."""
-    from modules.cache_engine import cache_engine
-    cached_stats = cache_engine.get("db_stats")
-    if cached_stats:
-        return cached_stats
+# Default /db-stats mode: exact (trigger counters) or estimate (planner statistics)
+DB_STATS_MODE = os.getenv("DB_STATS_MODE", "exact")
 
-    if not db.engine:
+@app.get("/db-stats")
+async def get_db_stats(mode: str = DB_STATS_MODE):
+    """
+    Exclusion list sizes from the trigger-maintained counters (mode=exact)
+    or the planner's statistics (mode=estimate); neither scans the lists.
+    """
+    if not adb.available:
         return {"dnd_count": "DB_NOT_INIT", "sub_count": "DB_NOT_INIT", "unsub_count": "DB_NOT_INIT"}
         
     try:
-        with db.engine.connect() as conn:
-            dnd_res = conn.execute(text("SELECT COUNT(*) AS cnt FROM dnd_list")).mappings().first()
-            sub_res = conn.execute(text("SELECT COUNT(*) AS cnt FROM subscriptions WHERE status = 'ACTIVE'")).mappings().first()
-            unsub_res = conn.execute(text("SELECT COUNT(*) AS cnt FROM unsubscriptions")).mappings().first()
-            
-            stats = {
-                "dnd_count": dnd_res['cnt'] if dnd_res else 0,
-                "sub_count": sub_res['cnt'] if sub_res else 0,
-                "unsub_count": unsub_res['cnt'] if unsub_res else 0,
-            }
-            # Cache for 5 minutes
-            cache_engine.set("db_stats", stats, expire=300)
-            return stats
+        counts = await adb.get_exclusion_list_counts(estimate=(mode == "estimate"))
+        return {
+            "dnd_count": counts.get("dnd_list", {}).get("row_count", 0),
+            "sub_count": counts.get("subscriptions", {}).get("active_count", 0),
+            "unsub_count": counts.get("unsubscriptions", {}).get("row_count", 0),
+            "mode": "estimate" if mode == "estimate" else "exact",
+        }
     except Exception as e:
         print(f"DB Stats Error: {e}")
         return {"dnd_count": f"ERR: {str(e)}", "sub_count": "ERR", "unsub_count": "ERR"}
@@ -673,7 +1129,7 @@ async def get_db_stats():
 async def schedule_promotion(request: ScheduleRequest):
     """Saves scheduling details for a promotion."""
     try:
-        success = db.save_scheduling_details(request.model_dump())
+        success = await adb.run_sync(db.save_scheduling_details, request.model_dump())
         if success:
             return {"status": "success", "message": "Promotion scheduled successfully"}
         else:
@@ -689,11 +1145,11 @@ async def health_check():
     db_status = "Disconnected"
     db_host = "N/A"
     try:
-        if db.engine:
-            with db.engine.connect() as conn:
-                db_status = "Connected"
-                # Extract host safely for diagnostic display
-                db_host = str(db.engine.url.host) if db.engine.url else "unknown"
+        if adb.available:
+            await adb.ping()
+            db_status = "Connected"
+            # Extract host safely for diagnostic display
+            db_host = str(db.engine.url.host) if db.engine and db.engine.url else "unknown"
     except Exception as e:
         db_status = f"Error: {str(e)}"
 
@@ -729,6 +1185,19 @@ async def add_frontend_log(level: str = Form("info"), message: str = Form(...)):
     logger.log("frontend", level, message, "browser")
     return {"status": "logged"}
 
+@app.get("/cache-stats")
+async def get_cache_stats():
+    """Returns CacheEngine hit/miss/eviction counters, latency histograms and backend health."""
+    from modules.cache_engine import cache_engine
+    return await asyncio.to_thread(cache_engine.get_metrics)
+
+@app.post("/cache-stats/reset")
+async def reset_cache_stats(current_username: str = Depends(get_current_username)):
+    """Resets the in-process cache counters (the cached data itself is untouched)."""
+    from modules.cache_engine import cache_engine
+    cache_engine.metrics.reset()
+    return {"status": "reset"}
+
 @app.get("/logging-dashboard", response_class=HTMLResponse)
 async def logging_dashboard():
     """Serves the logging dashboard."""
@@ -1,6 +1,10 @@
 import os
 import sys
-from sqlalchemy import create_engine, text
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime
+from sqlalchemy import create_engine, inspect, text
 from dotenv import load_dotenv
 
 # Add the current directory to path so we can import modules if needed
@@ -8,82 +12,203 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 load_dotenv()
 
-def migrate():
-    # 1. Source Connection (Local MySQL)
+TABLES = ["dnd_list", "subscriptions", "unsubscriptions", "obdscheduling_details"]
+# Integer primary key the source is walked on; its last copied value is the resume point
+KEY_COLUMN = "id"
+BATCH_ROWS = int(os.getenv("MIGRATE_BATCH_ROWS", "50000"))
+PARALLEL_TABLES = int(os.getenv("MIGRATE_JOBS", "4"))
+
+
+def _source_url():
+    # Local MySQL unless SOURCE_DATABASE_URL points somewhere else
+    source_url = os.getenv("SOURCE_DATABASE_URL")
+    if source_url:
+        return source_url
     mysql_user = os.getenv("DB_USER", "root")
     mysql_pass = os.getenv("DB_PASS", "shan2001")
     mysql_host = os.getenv("DB_HOST", "localhost")
     mysql_name = os.getenv("DB_NAME", "obd_db")
-    mysql_url = f"mysql+mysqlconnector://{mysql_user}:{mysql_pass}@{mysql_host}/{mysql_name}"
-    
+    return f"mysql+mysqlconnector://{mysql_user}:{mysql_pass}@{mysql_host}/{mysql_name}"
+
+
+def _copy_value(value):
+    """COPY text form of a source value (None stays NULL)."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime, date)):
+        return value.isoformat(sep=" ") if isinstance(value, datetime) else value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return str(value)
+
+
+def _checkpoint(pg_conn, table):
+    row = pg_conn.execute(
+        text("SELECT last_key, rows_copied FROM data_migration_checkpoints WHERE table_name = :t"), {"t": table}
+    ).first()
+    return (row[0], row[1] or 0) if row else (None, 0)
+
+
+def migrate_table(source_engine, db, table, batch_rows=BATCH_ROWS, fresh=False):
+    """
+    Copies one table in primary-key order. Each batch is read with a keyset
+    query (WHERE id > last ORDER BY id LIMIT n), COPYed into a staging table
+    and merged with ON CONFLICT DO NOTHING; the checkpoint is committed in the
+    same transaction, so an interrupted run resumes exactly after the last
+    committed batch. Returns a stats dict for the throughput report.
+    """
+    from modules.database_module import copy_rows
+
+    stats = {"table": table, "rows": 0, "seconds": 0.0, "resumed_from": None, "error": None}
+    start = time.perf_counter()
+
+    source_columns = [c["name"] for c in inspect(source_engine).get_columns(table)]
+    target_columns = {c["name"] for c in inspect(db.engine).get_columns(table)}
+    columns = [c for c in source_columns if c in target_columns]
+    if KEY_COLUMN not in columns:
+        raise ValueError(f"{table} has no '{KEY_COLUMN}' column to migrate on")
+    key_index = columns.index(KEY_COLUMN)
+    col_list = ", ".join(columns)
+
+    with db.engine.connect() as pg_conn:
+        if fresh:
+            print(f"  🧹 [{table}] Cleaning remote table for a fresh migration...")
+            # TRUNCATE, not DROP: the triggers and indexes belong to the schema migrations
+            pg_conn.execute(text(f"TRUNCATE TABLE {table} RESTART IDENTITY CASCADE"))
+            pg_conn.execute(text("DELETE FROM data_migration_checkpoints WHERE table_name = :t"), {"t": table})
+            pg_conn.commit()
+        last_key, copied_before = _checkpoint(pg_conn, table)
+        stats["resumed_from"] = last_key
+
+    if last_key is not None:
+        print(f"  ⏩ [{table}] Resuming after {KEY_COLUMN}={last_key} ({copied_before} rows already copied)")
+
+    read_batch = text(
+        f"SELECT {col_list} FROM {table} WHERE {KEY_COLUMN} > :last ORDER BY {KEY_COLUMN} LIMIT :limit"
+    )
+    with db.raw_connection() as raw_conn:
+        cursor = raw_conn.cursor()
+        staging = f"_migrate_{table}"
+        cursor.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {staging} ON COMMIT DELETE ROWS AS "
+            f"SELECT {col_list} FROM {table} WITH NO DATA"
+        )
+        raw_conn.commit()
+        with source_engine.connect() as source_conn:
+            while True:
+                rows = source_conn.execute(
+                    read_batch, {"last": last_key if last_key is not None else -1, "limit": batch_rows}
+                ).fetchall()
+                source_conn.rollback()  # no long-lived snapshot on the source
+                if not rows:
+                    break
+                copy_rows(cursor, staging, columns, ([_copy_value(v) for v in row] for row in rows))
+                cursor.execute(
+                    f"INSERT INTO {table} ({col_list}) SELECT {col_list} FROM {staging} ON CONFLICT DO NOTHING"
+                )
+                last_key = rows[-1][key_index]
+                stats["rows"] += len(rows)
+                cursor.execute(
+                    """
+                    INSERT INTO data_migration_checkpoints (table_name, last_key, rows_copied, updated_at)
+                    VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+                    ON CONFLICT (table_name) DO UPDATE
+                    SET last_key = EXCLUDED.last_key, rows_copied = EXCLUDED.rows_copied, updated_at = EXCLUDED.updated_at
+                    """,
+                    (table, last_key, copied_before + stats["rows"]),
+                )
+                raw_conn.commit()
+                elapsed = time.perf_counter() - start
+                print(f"  📥 [{table}] {stats['rows']} rows ({stats['rows'] / max(elapsed, 1e-9):,.0f} rows/s)")
+                if len(rows) < batch_rows:
+                    break
+
+        # Explicit ids were copied; move the SERIAL sequence past them
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, %s), GREATEST((SELECT MAX({KEY_COLUMN}) FROM {table}), 1))",
+            (table, KEY_COLUMN),
+        )
+        raw_conn.commit()
+        cursor.close()
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def _report(results, wall_seconds):
+    print("\n📊 Throughput report")
+    print(f"  {'table':<24}{'rows':>12}{'seconds':>10}{'rows/s':>12}  status")
+    total = 0
+    for s in results:
+        rate = s["rows"] / s["seconds"] if s["seconds"] else 0
+        status = f"❌ {s['error']}" if s["error"] else ("resumed" if s["resumed_from"] is not None else "ok")
+        print(f"  {s['table']:<24}{s['rows']:>12,}{s['seconds']:>10.1f}{rate:>12,.0f}  {status}")
+        total += s["rows"]
+    print(f"  {'TOTAL':<24}{total:>12,}{wall_seconds:>10.1f}{total / wall_seconds if wall_seconds else 0:>12,.0f}")
+
+
+def migrate(tables=None, jobs=PARALLEL_TABLES, batch_rows=BATCH_ROWS, fresh=False):
+    tables = tables or TABLES
+    # 1. Source Connection (Local MySQL)
+    source_url = _source_url()
+
     # 2. Destination Connection (Supabase PostgreSQL)
     pg_url = os.getenv("DATABASE_URL")
-    
+
     if not pg_url:
         print("❌ ERROR: DATABASE_URL not found in .env. Please add your Supabase connection string.")
-        return
+        return False
 
     print("🚀 Starting Migration...")
-    
+
     try:
-        mysql_engine = create_engine(mysql_url)
-        pg_engine = create_engine(pg_url)
-        
-        # Verify connections
-        mysql_engine.connect()
-        print("✅ Connected to Local MySQL")
-        pg_engine.connect()
-        print("✅ Connected to Supabase PostgreSQL")
+        source_engine = create_engine(source_url, pool_size=max(jobs, 1), pool_pre_ping=True)
+        with source_engine.connect():
+            print("✅ Connected to source database")
+        # Shared destination engine; constructing it applies pending schema migrations
+        from modules.database_module import get_database
+        db = get_database()
+        if not db.engine:
+            raise RuntimeError(db.init_error or "no engine")
+        with db.engine.connect():
+            print("✅ Connected to Supabase PostgreSQL (schema initialized)")
     except Exception as e:
         print(f"❌ Connection Error: {e}")
-        return
-
-    tables = ["dnd_list", "subscriptions", "unsubscriptions", "obdscheduling_details"]
-    
-    for table in tables:
-        print(f"\n📦 Migrating table: {table}...")
-        try:
-            # Fetch from MySQL
-            with mysql_engine.connect() as conn:
-                result = conn.execute(text(f"SELECT * FROM {table}"))
-                rows = [dict(row) for row in result.mappings()]
-            
-            if not rows:
-                print(f"  ℹ️  No records found in local {table}. Skipping.")
-                continue
-
-            print(f"  📥 Found {len(rows)} records locally.")
-
-            # Insert into PostgreSQL
-            # We use a simple loop. For massive lists, we might want chunking.
-            with pg_engine.connect() as conn:
-                # First, ensure table exists in PG (Schema Initialization)
-                from modules.database_module import DatabaseModule
-                db = DatabaseModule() 
-                
-                # Force drop and recreate for clean migration
-                print(f"  🧹 Cleaning remote {table} for fresh migration...")
-                conn.execute(text(f"DROP TABLE IF EXISTS {table} CASCADE"))
-                conn.commit()
-                
-                db._initialize_tables()
-                print(f"  🛠️  Ensured remote schema is initialized.")
-
-                # Insert data
-                # We build the column list dynamically
-                cols = ", ".join(rows[0].keys())
-                placeholders = ", ".join([f":{k}" for k in rows[0].keys()])
-                insert_query = text(f"INSERT INTO {table} ({cols}) VALUES ({placeholders}) ON CONFLICT DO NOTHING")
-                
-                # Execute in batches
-                conn.execute(insert_query, rows)
-                conn.commit()
-                print(f"  ✅ Successfully migrated {len(rows)} records to Supabase.")
-
-        except Exception as e:
-            print(f"  ❌ Error migrating {table}: {e}")
-
-    print("\n✨ Migration Complete!")
+        return False
+
+    # Tables are independent: copy them in parallel, each on its own connections
+    start = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(tables)))) as pool:
+        futures = {pool.submit(migrate_table, source_engine, db, t, batch_rows, fresh): t for t in tables}
+        for future in as_completed(futures):
+            table = futures[future]
+            try:
+                stats = future.result()
+                print(f"  ✅ [{table}] Migrated {stats['rows']} records in {stats['seconds']:.1f}s.")
+            except Exception as e:
+                stats = {"table": table, "rows": 0, "seconds": 0.0, "resumed_from": None, "error": str(e)}
+                print(f"  ❌ Error migrating {table}: {e} (rerun to resume from the last checkpoint)")
+            results.append(stats)
+
+    _report(sorted(results, key=lambda s: tables.index(s["table"])), time.perf_counter() - start)
+    ok = not any(s["error"] for s in results)
+    print("\n✨ Migration Complete!" if ok else "\n⚠️ Migration finished with errors.")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Copy tables from the local MySQL database to PostgreSQL.")
+    parser.add_argument("tables", nargs="*", help=f"tables to migrate (default: {' '.join(TABLES)})")
+    parser.add_argument("--fresh", action="store_true", help="truncate targets and forget checkpoints first")
+    parser.add_argument("--jobs", type=int, default=PARALLEL_TABLES, help="tables migrated in parallel")
+    parser.add_argument("--batch-size", type=int, default=BATCH_ROWS, help="rows per COPY batch / checkpoint")
+    args = parser.parse_args(argv)
+    ok = migrate(args.tables or None, jobs=args.jobs, batch_rows=args.batch_size, fresh=args.fresh)
+    return 0 if ok else 1
+
 
 if __name__ == "__main__":
-    migrate()
+    sys.exit(main())
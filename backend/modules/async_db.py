@@ -0,0 +1,190 @@
+"""
+Non-blocking data access for the FastAPI request path.
+
+AsyncDatabase runs request-path queries on an async SQLAlchemy engine
+(asyncpg) so a slow query only suspends its own request. When asyncpg is
+not installed, or the URL is not PostgreSQL, the same calls run on the
+shared sync engine inside a bounded "db" thread pool instead of on the
+event loop.
+
+CPU-heavy work (bcrypt, pandas parsing) goes through run_cpu(), a second
+bounded pool, so bursts of uploads or logins cannot starve the loop or
+the database threads.
+"""
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from sqlalchemy import text
+
+from .lookup_scheduler import DB_POOL_SIZE, DB_MAX_OVERFLOW
+from .database_module import exclusion_counts_query
+
+try:
+    import asyncpg  # noqa: F401
+    from sqlalchemy.ext.asyncio import create_async_engine
+except ImportError:
+    create_async_engine = None
+
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", str(DB_POOL_SIZE)))
+ASYNC_DB_MAX_OVERFLOW = int(os.getenv("ASYNC_DB_MAX_OVERFLOW", str(DB_MAX_OVERFLOW)))
+DB_THREADS = int(os.getenv("DB_THREADS", str(DB_POOL_SIZE)))
+CPU_THREADS = int(os.getenv("CPU_THREADS", str(min(4, os.cpu_count() or 1))))
+
+_cpu_pool = ThreadPoolExecutor(max_workers=CPU_THREADS, thread_name_prefix="cpu")
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """Runs a CPU-bound callable (hashing, parsing) on the bounded CPU pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_cpu_pool, functools.partial(fn, *args, **kwargs))
+
+
+def _async_url(url):
+    """
+    Turns a libpq-style URL into (asyncpg URL, connect_args). asyncpg does not
+    understand sslmode and friends, so they are stripped and mapped.
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.split("+", 1)[0]
+    if scheme not in ("postgresql", "postgres"):
+        return None, {}
+    query = dict(parse_qsl(parts.query))
+    connect_args = {}
+    sslmode = query.pop("sslmode", None)
+    if sslmode in ("require", "verify-ca", "verify-full") or "supabase" in url or "render" in url:
+        connect_args["ssl"] = "require"
+    for unsupported in ("prepare_threshold", "connect_timeout", "application_name", "options"):
+        query.pop(unsupported, None)
+    # Transaction-mode poolers (Supabase :6543 / pgbouncer) cannot keep prepared statements
+    if "pooler" in (parts.hostname or "") or parts.port == 6543:
+        connect_args["statement_cache_size"] = 0
+        query["prepared_statement_cache_size"] = "0"
+    async_url = urlunsplit(("postgresql+asyncpg", parts.netloc, parts.path, urlencode(query), parts.fragment))
+    return async_url, connect_args
+
+
+class AsyncDatabase:
+    """Async front for DatabaseModule on the request path."""
+
+    def __init__(self, db):
+        self.db = db
+        self.engine = None
+        self.executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
+        if create_async_engine and db.url:
+            async_url, connect_args = _async_url(db.url)
+            if async_url:
+                try:
+                    self.engine = create_async_engine(
+                        async_url,
+                        pool_pre_ping=True,
+                        pool_recycle=300,
+                        pool_timeout=30,
+                        pool_size=ASYNC_DB_POOL_SIZE,
+                        max_overflow=ASYNC_DB_MAX_OVERFLOW,
+                        connect_args=connect_args,
+                    )
+                except Exception as e:
+                    print(f"WARNING: Async DB engine unavailable ({e}); using the bounded thread pool.")
+        mode = "asyncpg" if self.engine else f"thread pool ({DB_THREADS})"
+        print(f"DEBUG: AsyncDatabase initialized ({mode}).")
+
+    @property
+    def available(self) -> bool:
+        return bool(self.engine or self.db.engine)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        """Runs a blocking DatabaseModule call (bulk COPY paths etc.) on the bounded DB pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def fetch_all(self, query, params=None):
+        """Runs a SELECT and returns its rows as dicts. Raises on error."""
+        statement = text(query) if isinstance(query, str) else query
+        if self.engine:
+            async with self.engine.connect() as conn:
+                result = await conn.execute(statement, params or {})
+                return [dict(row) for row in result.mappings()]
+
+        def _fetch():
+            with self.db.engine.connect() as conn:
+                return [dict(row) for row in conn.execute(statement, params or {}).mappings()]
+        return await self.run_sync(_fetch)
+
+    async def fetch_one(self, query, params=None):
+        rows = await self.fetch_all(query, params)
+        return rows[0] if rows else None
+
+    async def execute(self, query, params=None):
+        """Runs a write statement in its own transaction and returns the rowcount. Raises on error."""
+        statement = text(query) if isinstance(query, str) else query
+        if self.engine:
+            async with self.engine.begin() as conn:
+                result = await conn.execute(statement, params or {})
+                return result.rowcount
+
+        def _execute():
+            with self.db.engine.begin() as conn:
+                return conn.execute(statement, params or {}).rowcount
+        return await self.run_sync(_execute)
+
+    async def ping(self):
+        await self.fetch_all("SELECT 1")
+        return True
+
+    async def execute_query(self, query, params=None):
+        """Async counterpart of DatabaseModule.execute_query: [] on error."""
+        if not self.available:
+            return []
+        try:
+            return await self.fetch_all(query, params)
+        except Exception as e:
+            print(f"Query Error: {e}")
+            return []
+
+    async def get_scrub_job(self, job_id: int, username: str | None = None):
+        """Fetches a single scrub job, optionally asserting ownership by username."""
+        query = "SELECT * FROM scrub_jobs WHERE id = :job_id"
+        params = {"job_id": job_id}
+        if username:
+            query += " AND username = :username"
+            params["username"] = username
+        try:
+            return await self.fetch_one(query, params)
+        except Exception as e:
+            print(f"Get Scrub Job Error: {e}")
+            return None
+
+    async def list_scrub_jobs(self, username: str, limit: int = 20):
+        """Lists recent scrub jobs for a given user."""
+        return await self.execute_query(
+            "SELECT * FROM scrub_jobs WHERE username = :username ORDER BY created_at DESC LIMIT :limit",
+            {"username": username, "limit": limit},
+        )
+
+    async def get_exclusion_list_counts(self, estimate: bool = False):
+        """Async counterpart of DatabaseModule.get_exclusion_list_counts (O(1), no scans). Raises on error."""
+        rows = await self.fetch_all(exclusion_counts_query(estimate))
+        return {row["list_name"]: {"row_count": int(row["row_count"]), "active_count": int(row["active_count"])} for row in rows}
+
+    async def verify_admin_user(self, username, password):
+        """Looks the hash up asynchronously and runs bcrypt on the CPU pool."""
+        import bcrypt
+        try:
+            row = await self.fetch_one(
+                "SELECT password_hash FROM user_details WHERE username = :u", {"u": username}
+            )
+        except Exception as e:
+            print("Verify user error:", e)
+            return False
+        if not row:
+            return False
+        return await run_cpu(bcrypt.checkpw, password.encode("utf-8"), row["password_hash"].encode("utf-8"))
+
+    async def close(self):
+        if self.engine:
+            await self.engine.dispose()
+        self.executor.shutdown(wait=False)
+        _cpu_pool.shutdown(wait=False)
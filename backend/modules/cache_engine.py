@@ -2,11 +2,278 @@ import os
 import time
 import pickle
 import hashlib
+import operator
 import functools
 import threading
-from typing import Any, Optional, Union, Callable
+from collections import OrderedDict
+from typing import Any, Optional, Callable
 from diskcache import Cache
 
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# --- CONTENT-ADDRESSED KEY HASHING ---
+# Arguments are fed to the hasher incrementally and type-aware, so a 1M-element
+# MSISDN list never gets rendered into one huge repr() string. xxh3 is used when
+# installed, otherwise BLAKE2b from the standard library.
+_MASK_64 = (1 << 64) - 1
+# Same encoding as _item_digest, so a lone surrogate never raises on the fast path
+_encode_str = operator.methodcaller("encode", "utf-8", "surrogatepass")
+
+
+def _new_hasher():
+    return xxhash.xxh3_128() if xxhash else hashlib.blake2b(digest_size=16)
+
+
+# Element digests are 64-bit; strings and tagged encodings of other types are
+# hashed in separate domains (seed / personalization) so "1" never equals 1.
+if xxhash:
+    _str_bytes_digest = xxhash.xxh3_64_intdigest
+
+    def _encoded_digest(data: bytes) -> int:
+        return xxhash.xxh3_64_intdigest(data, seed=1)
+else:
+    def _str_bytes_digest(data: bytes) -> int:
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8, person=b"str").digest(), "little")
+
+    def _encoded_digest(data: bytes) -> int:
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8, person=b"obj").digest(), "little")
+
+
+class _BufferHasher:
+    """Collects a tagged encoding so nested elements can be digested in one call."""
+    def __init__(self):
+        self.parts = []
+
+    def update(self, data):
+        self.parts.append(bytes(data))
+
+
+def _item_digest(value) -> int:
+    """64-bit digest of a single collection element."""
+    if type(value) is str:
+        return _str_bytes_digest(value.encode("utf-8", "surrogatepass"))
+    buf = _BufferHasher()
+    _hash_into(buf, value)
+    return _encoded_digest(b"".join(buf.parts))
+
+
+def _unordered_digest(items) -> tuple:
+    """
+    Order-insensitive multiset digest: the sum of per-element digests.
+    [a, b] and [b, a] hash the same, while duplicates still count.
+    """
+    if not isinstance(items, (list, tuple)):
+        items = list(items)
+    if all(type(item) is str for item in items):
+        # Fast path for MSISDN-style lists: encoding and hashing stay in C.
+        total = sum(map(_str_bytes_digest, map(_encode_str, items)))
+    else:
+        total = sum(map(_item_digest, items))
+    return len(items), total & _MASK_64
+
+
+class UnorderedDigest:
+    """
+    Incrementally built multiset digest. Hashing one gives the same result as
+    hashing a list/set holding every item passed to update(), so bases that
+    arrive in blocks can be fingerprinted without materializing them.
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+
+    def update(self, items):
+        count, total = _unordered_digest(items)
+        self.count += count
+        self.total = (self.total + total) & _MASK_64
+
+
+def _hash_into(hasher, obj):
+    """Feeds a canonical, type-tagged encoding of obj into hasher."""
+    if obj is None:
+        hasher.update(b"N;")
+    elif isinstance(obj, bool):
+        hasher.update(b"T;" if obj else b"F;")
+    elif isinstance(obj, int):
+        hasher.update(b"I%d;" % obj)
+    elif isinstance(obj, float):
+        hasher.update(b"D" + repr(obj).encode() + b";")
+    elif isinstance(obj, str):
+        data = obj.encode("utf-8", "surrogatepass")
+        hasher.update(b"S%d:" % len(data))
+        hasher.update(data)
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        view = memoryview(obj).cast("B")
+        hasher.update(b"B%d:" % view.nbytes)
+        hasher.update(view)
+    elif np is not None and isinstance(obj, np.ndarray) and obj.dtype != object:
+        # Arrays are hashed by their raw buffer: dtype + shape + bytes.
+        arr = np.ascontiguousarray(obj)
+        hasher.update(b"A" + arr.dtype.str.encode() + repr(arr.shape).encode() + b":")
+        hasher.update(memoryview(arr).cast("B"))
+    elif isinstance(obj, dict):
+        count, total = _unordered_digest(obj.items())
+        hasher.update(b"M%d:" % count + total.to_bytes(8, "little"))
+    elif isinstance(obj, UnorderedDigest):
+        hasher.update(b"L%d:" % obj.count + obj.total.to_bytes(8, "little"))
+    elif isinstance(obj, (list, set, frozenset)) or (np is not None and isinstance(obj, np.ndarray)):
+        count, total = _unordered_digest(obj)
+        hasher.update(b"L%d:" % count + total.to_bytes(8, "little"))
+    elif isinstance(obj, tuple):
+        hasher.update(b"(%d:" % len(obj))
+        for item in obj:
+            _hash_into(hasher, item)
+        hasher.update(b")")
+    elif hasattr(obj, "to_numpy"):
+        # pandas Series / Index
+        _hash_into(hasher, obj.to_numpy())
+    else:
+        data = repr(obj).encode("utf-8", "surrogatepass")
+        hasher.update(b"R" + type(obj).__qualname__.encode() + b"%d:" % len(data))
+        hasher.update(data)
+
+
+def content_digest(*values) -> str:
+    """Hex digest of the given values, using the same encoding as cache keys."""
+    hasher = _new_hasher()
+    for value in values:
+        _hash_into(hasher, value)
+    return hasher.hexdigest()
+
+
+class CacheMetrics:
+    """
+    Thread-safe, per-process cache counters.
+    Tracks hits/misses/evictions per key prefix, get/set latency histograms
+    and serialized payload sizes so TTLs can be tuned from real data.
+    """
+    LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+    MAX_PREFIXES = 100
+    MAX_TRACKED_KEYS = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.prefixes = {}
+            self.errors = {"get": 0, "set": 0, "delete": 0, "clear": 0}
+            self.last_error = None
+            # Keys written by this process -> prefix. A later miss on one of
+            # these (without an explicit delete) means it expired or was evicted.
+            self._tracked_keys = OrderedDict()
+
+    @staticmethod
+    def _new_histogram():
+        return [0] * (len(CacheMetrics.LATENCY_BUCKETS_MS) + 1)
+
+    @staticmethod
+    def _observe(histogram, elapsed_ms):
+        for i, bound in enumerate(CacheMetrics.LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                histogram[i] += 1
+                return
+        histogram[-1] += 1
+
+    def _prefix_stats(self, key: str):
+        prefix = key.split(":", 1)[0] if ":" in key else key
+        if prefix not in self.prefixes and len(self.prefixes) >= self.MAX_PREFIXES:
+            prefix = "other"
+        stats = self.prefixes.get(prefix)
+        if stats is None:
+            stats = {
+                "hits": 0, "misses": 0, "evictions": 0, "sets": 0, "deletes": 0,
+                "bytes_written": 0, "bytes_read": 0, "max_item_bytes": 0,
+                "get_latency_ms": self._new_histogram(),
+                "set_latency_ms": self._new_histogram(),
+                "get_time_ms": 0.0, "set_time_ms": 0.0,
+            }
+            self.prefixes[prefix] = stats
+        return prefix, stats
+
+    def record_get(self, key: str, hit: bool, elapsed_ms: float, size: Optional[int] = None):
+        with self._lock:
+            _, stats = self._prefix_stats(key)
+            self._observe(stats["get_latency_ms"], elapsed_ms)
+            stats["get_time_ms"] += elapsed_ms
+            if hit:
+                stats["hits"] += 1
+                if size:
+                    stats["bytes_read"] += size
+            else:
+                stats["misses"] += 1
+                if self._tracked_keys.pop(key, None) is not None:
+                    stats["evictions"] += 1
+
+    def record_set(self, key: str, elapsed_ms: float, size: int):
+        with self._lock:
+            prefix, stats = self._prefix_stats(key)
+            self._observe(stats["set_latency_ms"], elapsed_ms)
+            stats["set_time_ms"] += elapsed_ms
+            stats["sets"] += 1
+            stats["bytes_written"] += size
+            stats["max_item_bytes"] = max(stats["max_item_bytes"], size)
+            self._tracked_keys[key] = prefix
+            self._tracked_keys.move_to_end(key)
+            while len(self._tracked_keys) > self.MAX_TRACKED_KEYS:
+                self._tracked_keys.popitem(last=False)
+
+    def record_delete(self, key: str):
+        with self._lock:
+            _, stats = self._prefix_stats(key)
+            stats["deletes"] += 1
+            self._tracked_keys.pop(key, None)
+
+    def record_clear(self):
+        with self._lock:
+            self._tracked_keys.clear()
+
+    def record_error(self, op: str, error: Exception):
+        with self._lock:
+            self.errors[op] = self.errors.get(op, 0) + 1
+            self.last_error = {"op": op, "error": str(error), "at": time.time()}
+
+    def snapshot(self):
+        """Returns a JSON-serializable copy of all counters."""
+        with self._lock:
+            prefixes = {}
+            totals = {"hits": 0, "misses": 0, "evictions": 0, "sets": 0}
+            for prefix, stats in self.prefixes.items():
+                lookups = stats["hits"] + stats["misses"]
+                entry = {k: (list(v) if isinstance(v, list) else v) for k, v in stats.items()}
+                entry["get_time_ms"] = round(stats["get_time_ms"], 3)
+                entry["set_time_ms"] = round(stats["set_time_ms"], 3)
+                entry["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else None
+                entry["avg_get_ms"] = round(stats["get_time_ms"] / lookups, 3) if lookups else None
+                entry["avg_set_ms"] = round(stats["set_time_ms"] / stats["sets"], 3) if stats["sets"] else None
+                entry["avg_item_bytes"] = stats["bytes_written"] // stats["sets"] if stats["sets"] else None
+                prefixes[prefix] = entry
+                for k in totals:
+                    totals[k] += stats[k]
+            lookups = totals["hits"] + totals["misses"]
+            totals["hit_rate"] = round(totals["hits"] / lookups, 4) if lookups else None
+            return {
+                "since": self.started_at,
+                "uptime_s": round(time.time() - self.started_at, 1),
+                "latency_buckets_ms": list(self.LATENCY_BUCKETS_MS) + ["inf"],
+                "totals": totals,
+                "prefixes": prefixes,
+                "errors": dict(self.errors),
+                "last_error": self.last_error,
+            }
+
+
 class CacheEngine:
     """
     Unified Cache Engine supporting:
@@ -32,6 +299,8 @@ class CacheEngine:
         
         self.use_redis = False
         self.redis_client = None
+        self.fallback_reason = None
+        self.metrics = CacheMetrics()
         
         # Try Redis if available
         if self.redis_url:
@@ -42,6 +311,7 @@ class CacheEngine:
                 self.use_redis = True
                 print(f"DEBUG: CacheEngine initialized with REDIS at {self.redis_url}")
             except Exception as e:
+                self.fallback_reason = str(e)
                 print(f"WARNING: Redis connection failed, falling back to DiskCache: {e}")
 
         # Fallback to DiskCache (multi-process safe)
@@ -53,25 +323,40 @@ class CacheEngine:
 
     def get(self, key: str) -> Any:
         """Retrieves an item from cache."""
+        start = time.perf_counter()
         try:
+            # Both backends hold the pickled bytes written by set()
             if self.use_redis:
                 val = self.redis_client.get(key)
-                return pickle.loads(val) if val else None
             else:
-                return self.disk_cache.get(key)
+                val = self.disk_cache.get(key)
+            if val is None or isinstance(val, bytes):
+                size = len(val) if val else None
+                result = pickle.loads(val) if val else None
+            else:
+                # DiskCache entry written before payloads were stored pickled
+                size, result = None, val
+            self.metrics.record_get(key, result is not None, (time.perf_counter() - start) * 1000, size)
+            return result
         except Exception as e:
+            self.metrics.record_error("get", e)
             print(f"CACHE ERROR (get): {e}")
             return None
 
     def set(self, key: str, value: Any, expire: Optional[int] = None):
         """Stores an item in cache with optional expiration (seconds)."""
         ttl = expire if expire is not None else self.default_ttl
+        start = time.perf_counter()
         try:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
             if self.use_redis:
-                self.redis_client.setex(key, ttl, pickle.dumps(value))
+                self.redis_client.setex(key, ttl, payload)
             else:
-                self.disk_cache.set(key, value, expire=ttl)
+                # bytes are stored as-is by diskcache: no second serialization
+                self.disk_cache.set(key, payload, expire=ttl)
+            self.metrics.record_set(key, (time.perf_counter() - start) * 1000, len(payload))
         except Exception as e:
+            self.metrics.record_error("set", e)
             print(f"CACHE ERROR (set): {e}")
 
     def delete(self, key: str):
@@ -81,7 +366,9 @@ class CacheEngine:
                 self.redis_client.delete(key)
             else:
                 self.disk_cache.delete(key)
+            self.metrics.record_delete(key)
         except Exception as e:
+            self.metrics.record_error("delete", e)
             print(f"CACHE ERROR (delete): {e}")
 
     def clear(self):
@@ -91,13 +378,57 @@ class CacheEngine:
                 self.redis_client.flushdb()
             else:
                 self.disk_cache.clear()
+            self.metrics.record_clear()
         except Exception as e:
+            self.metrics.record_error("clear", e)
             print(f"CACHE ERROR (clear): {e}")
 
+    def backend_health(self) -> dict:
+        """Reports which backend is active and whether it is reachable."""
+        health = {
+            "backend": "redis" if self.use_redis else "diskcache",
+            "redis_configured": bool(self.redis_url),
+            "fallback_reason": self.fallback_reason,
+            "default_ttl": self.default_ttl,
+        }
+        start = time.perf_counter()
+        try:
+            if self.use_redis:
+                self.redis_client.ping()
+                info = self.redis_client.info()
+                health.update({
+                    "used_memory_bytes": info.get("used_memory"),
+                    "keys": self.redis_client.dbsize(),
+                    "server_evicted_keys": info.get("evicted_keys"),
+                    "server_expired_keys": info.get("expired_keys"),
+                })
+            else:
+                health.update({
+                    "cache_dir": self.cache_dir,
+                    "volume_bytes": self.disk_cache.volume(),
+                    "keys": len(self.disk_cache),
+                })
+            health["healthy"] = True
+        except Exception as e:
+            health["healthy"] = False
+            health["error"] = str(e)
+        health["ping_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        return health
+
+    def get_metrics(self) -> dict:
+        """Counters plus backend health, as exposed on /cache-stats."""
+        stats = self.metrics.snapshot()
+        stats["backend"] = self.backend_health()
+        return stats
+
     def generate_key(self, prefix: str, *args, **kwargs) -> str:
-        """Generates a stable MD5 hash key for any input data."""
-        data = f"{prefix}:{args}:{kwargs}"
-        return hashlib.md5(data.encode()).hexdigest()
+        """
+        Generates a stable, content-addressed key for any input data.
+        Positional args keep their order; lists, sets and dicts are digested
+        order-insensitively and arrays by buffer, so keys for large bases are
+        cheap and independent of list ordering.
+        """
+        return content_digest(prefix, args, kwargs)
 
 def cached(prefix: str, ttl: int = 3600):
     """Decorator for caching function results."""
@@ -0,0 +1,136 @@
+"""
+Server-side campaign launches.
+
+A launch copies the verified targets of a completed scrub job (or any
+results reference) into the campaign table obd_d1_<project> with
+INSERT ... SELECT, so the numbers never travel through the browser or the
+API process. The copy runs in key-range batches of about
+CAMPAIGN_LAUNCH_BATCH_ROWS rows, each committed on its own; progress is
+recorded in campaign_launches for pollers of /launch-campaign/{id}.
+"""
+import os
+import math
+from datetime import datetime
+
+from sqlalchemy import text
+
+from .database_module import campaign_table_name, ensure_campaign_table, parse_result_set_reference, result_set_query
+from .logging_system import logger
+
+CAMPAIGN_LAUNCH_BATCH_ROWS = int(os.getenv("CAMPAIGN_LAUNCH_BATCH_ROWS", "1000000"))
+
+
+def create_campaign_launch(db, project_name: str, reference: str, job_id: int | None = None, username: str | None = None):
+    """Records a PENDING launch of `reference` into the project's table and returns its id."""
+    result_set_query(reference)  # ValueError for anything that is not a results reference
+    with db.engine.connect() as conn:
+        launch_id = conn.execute(
+            text("""
+                INSERT INTO campaign_launches (username, project_name, target_table, source_reference, job_id, status)
+                VALUES (:username, :project_name, :target_table, :reference, :job_id, 'PENDING')
+                RETURNING id
+            """),
+            {
+                "username": username,
+                "project_name": project_name,
+                "target_table": campaign_table_name(project_name),
+                "reference": reference,
+                "job_id": job_id,
+            },
+        ).scalar()
+        conn.commit()
+        return launch_id
+
+
+def get_campaign_launch(db, launch_id: int):
+    with db.engine.connect() as conn:
+        row = conn.execute(
+            text("SELECT * FROM campaign_launches WHERE id = :id"), {"id": launch_id}
+        ).mappings().first()
+        return dict(row) if row else None
+
+
+def _update_launch(conn, launch_id, status, **fields):
+    fields["status"] = status
+    if status in ("COMPLETED", "FAILED"):
+        fields["completed_at"] = datetime.utcnow()
+    assignments = ", ".join(f"{name} = :{name}" for name in fields)
+    conn.execute(text(f"UPDATE campaign_launches SET {assignments} WHERE id = :launch_id"), {**fields, "launch_id": launch_id})
+    conn.commit()
+
+
+def _launch_source(conn, reference):
+    """
+    (table, key column, filter, params, low, high, total) for the rows of a
+    results reference. Result sets are split on msisdn_key (indexed per set,
+    and the created_on filter prunes to one partition); legacy per-run tables
+    on their id.
+    """
+    result_set_id = parse_result_set_reference(reference)
+    if result_set_id is not None:
+        info = conn.execute(
+            text("SELECT created_on, row_count FROM scrub_result_sets WHERE id = :id"), {"id": result_set_id}
+        ).first()
+        if not info:
+            raise ValueError(f"Unknown result set: {reference}")
+        table, column = "scrub_results", "msisdn_key"
+        where = "result_set_id = :id AND created_on = :day"
+        params = {"id": result_set_id, "day": info[0]}
+        total = info[1] or 0
+        low, high = conn.execute(text(f"SELECT MIN({column}), MAX({column}) FROM {table} WHERE {where}"), params).first()
+    else:
+        table, column, where, params = reference, "id", "TRUE", {}
+        low, high, total = conn.execute(text(f"SELECT MIN(id), MAX(id), COUNT(*) FROM {table}")).first()
+    return table, column, where, params, low, high, total
+
+
+def run_campaign_launch(db, launch_id: int):
+    """
+    Executes a PENDING launch. Blocking; call from a background thread.
+    A failed launch keeps the batches it already committed (see copied_rows).
+    """
+    with db.engine.connect() as conn:
+        # Claim the launch so a duplicate run is a no-op
+        launch = conn.execute(
+            text("""
+                UPDATE campaign_launches SET status = 'RUNNING', started_at = :now
+                WHERE id = :id AND status = 'PENDING'
+                RETURNING target_table, source_reference
+            """),
+            {"id": launch_id, "now": datetime.utcnow()},
+        ).mappings().first()
+        conn.commit()
+        if not launch:
+            return
+        target = launch["target_table"]
+        try:
+            table, column, where, params, low, high, total = _launch_source(conn, launch["source_reference"])
+            _update_launch(conn, launch_id, "RUNNING", total_rows=total)
+            ensure_campaign_table(conn, target)
+            conn.commit()
+
+            copied = 0
+            if low is not None:
+                batches = max(1, math.ceil(total / CAMPAIGN_LAUNCH_BATCH_ROWS))
+                step = max(1, math.ceil((high - low + 1) / batches))
+                insert = text(f"""
+                    INSERT INTO {target} (msisdn, scheduled)
+                    SELECT msisdn, TRUE FROM {table}
+                    WHERE {where} AND {column} >= :low AND {column} < :high
+                """)
+                for start in range(low, high + 1, step):
+                    copied += conn.execute(insert, {**params, "low": start, "high": start + step}).rowcount
+                    conn.commit()
+                    _update_launch(conn, launch_id, "RUNNING", copied_rows=copied)
+
+            _update_launch(conn, launch_id, "COMPLETED", copied_rows=copied)
+            logger.log(
+                "backend",
+                "success",
+                f"Campaign launch {launch_id}: {copied} targets copied into {target} from {launch['source_reference']}",
+                "campaign",
+            )
+        except Exception as e:
+            conn.rollback()
+            _update_launch(conn, launch_id, "FAILED", error_message=str(e))
+            logger.log("backend", "error", f"Campaign launch {launch_id} failed: {e}", "campaign")
@@ -1,11 +1,81 @@
 import os
+import re
+import threading
+import time
+from contextlib import contextmanager
 from sqlalchemy import create_engine, text, bindparam
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from .lookup_scheduler import lookup_scheduler, DB_POOL_SIZE, DB_MAX_OVERFLOW
+
+# Process-wide engine registry: URL -> Engine, and URLs whose schema is initialized
+_ENGINES = {}
+_SCHEMA_READY = set()
+_REGISTRY_LOCK = threading.RLock()
+_SHARED_DB = None
+
+# Attempts per exclusion chunk query before the lookup (and its job) fails
+CHUNK_QUERY_ATTEMPTS = int(os.getenv("CHUNK_QUERY_ATTEMPTS", "3"))
+
+
+def _run_chunk_query(label, run):
+    """
+    Runs one chunk query, retrying transient failures. The last error is
+    re-raised: an unchecked chunk must never read as "no matches".
+    """
+    for attempt in range(1, CHUNK_QUERY_ATTEMPTS + 1):
+        try:
+            return run()
+        except Exception as e:
+            print(f"Chunk Query Error on {label} (attempt {attempt}/{CHUNK_QUERY_ATTEMPTS}): {e}")
+            if attempt >= CHUNK_QUERY_ATTEMPTS:
+                raise
+            time.sleep(0.2 * attempt)
+
+
+def _build_engine(url):
+    """Creates the SQLAlchemy engine for a database URL (None if no URL)."""
+    # Handle PostgreSQL Connectors (Supabase/Render/Postgres)
+    if url and ("postgresql" in url or "postgres" in url):
+        # Ensure SQLAlchemy uses the psycopg2 driver explicitly
+        if "://" in url and not url.startswith("postgresql+psycopg2"):
+            url = url.replace("://", "+psycopg2://", 1)
+        
+        # Ensure sslmode=require for cloud services
+        if "supabase" in url or "render" in url:
+            if "sslmode" not in url:
+                if "?" not in url: url += "?sslmode=require"
+                else: url += "&sslmode=require"
+        
+        return create_engine(
+            url, 
+            pool_pre_ping=True,
+            pool_recycle=300, # Recycle connections every 5 mins
+            pool_timeout=30,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            connect_args={"sslmode": "require"} if "sslmode=require" in url else {}
+        )
+    elif url:
+        return create_engine(url)
+    return None
+
+
+def get_database():
+    """Returns the process-wide DatabaseModule, creating it on first use."""
+    global _SHARED_DB
+    with _REGISTRY_LOCK:
+        if _SHARED_DB is None:
+            _SHARED_DB = DatabaseModule()
+        return _SHARED_DB
+
 class DatabaseModule:
+    # Scrub option key -> exclusion list table
+    EXCLUSION_TABLES = {"dnd": "dnd_list", "sub": "subscriptions", "unsub": "unsubscriptions"}
+
     def __init__(self):
         self.db_type = os.getenv("DB_TYPE", "postgresql") 
         # Consolidate URL and Handle Fallbacks
@@ -32,184 +102,136 @@ class DatabaseModule:
             dbname = os.getenv("DB_NAME", "postgres")
             self.url = f"postgresql://{user}:{password}@{host}:{port}/{dbname}"
         
-        url = self.url
         self.init_error = ""
-            
+        # Engines (and their pools) are shared per process and per URL: building
+        # another DatabaseModule is cheap and never re-runs the schema checks.
+        with _REGISTRY_LOCK:
+            self.engine = _ENGINES.get(self.url)
+            if self.engine is None:
+                try:
+                    self.engine = _build_engine(self.url)
+                except Exception as e:
+                    self.init_error = str(e)
+                    print(f"❌ DATABASE INITIALIZATION ERROR: {e}")
+                if self.engine is not None:
+                    _ENGINES[self.url] = self.engine
+
+            if self.engine:
+                self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+                if self.url not in _SCHEMA_READY:
+                    try:
+                        # Test connection with a strict timeout to avoid hanging the app
+                        print(f"DEBUG: Testing DB connection to {self.engine.url.host}...")
+                        with self.engine.connect() as conn:
+                            conn.execute(text("SELECT 1"))
+                        print("DEBUG: DB Connection Successful.")
+                        if self._initialize_tables():
+                            _SCHEMA_READY.add(self.url)
+                    except Exception as e:
+                        self.init_error = f"Conn Test Failed: {str(e)}"
+                        print(f"❌ DATABASE CONNECTION ERROR: {e}")
+                        # We don't set engine to None here, we might want to retry later or show error in UI
+
+    @contextmanager
+    def raw_connection(self):
+        """
+        Borrows a pooled DBAPI (psycopg2) connection for bulk paths such as
+        COPY and execute_values. Rolls back on error; the connection always
+        goes back to the engine pool.
+        """
+        raw_conn = self.engine.raw_connection()
         try:
-            # Handle PostgreSQL Connectors (Supabase/Render/Postgres)
-            if url and ("postgresql" in url or "postgres" in url):
-                # Ensure SQLAlchemy uses the psycopg2 driver explicitly
-                if "://" in url and not url.startswith("postgresql+psycopg2"):
-                    url = url.replace("://", "+psycopg2://", 1)
-                
-                # Ensure sslmode=require for cloud services
-                if "supabase" in url or "render" in url:
-                    if "sslmode" not in url:
-                        if "?" not in url: url += "?sslmode=require"
-                        else: url += "&sslmode=require"
-                
-                self.engine = create_engine(
-                    url, 
-                    pool_pre_ping=True,
-                    pool_recycle=300, # Recycle connections every 5 mins
-                    pool_timeout=30,
-                    connect_args={"sslmode": "require"} if "sslmode=require" in url else {}
-                )
-            elif url:
-                self.engine = create_engine(url)
-            else:
-                self.engine = None
-        except Exception as e:
-            self.init_error = str(e)
-            print(f"❌ DATABASE INITIALIZATION ERROR: {e}")
-            self.engine = None
-            
-        if self.engine:
+            yield raw_conn
+        except Exception:
             try:
-                # Test connection with a strict timeout to avoid hanging the app
-                print(f"DEBUG: Testing DB connection to {self.engine.url.host}...")
-                with self.engine.connect() as conn:
-                    conn.execute(text("SELECT 1"))
-                print("DEBUG: DB Connection Successful.")
-                self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
-                self._initialize_tables()
-            except Exception as e:
-                self.init_error = f"Conn Test Failed: {str(e)}"
-                print(f"❌ DATABASE CONNECTION ERROR: {e}")
-                # We don't set engine to None here, we might want to retry later or show error in UI
+                raw_conn.rollback()
+            except:
+                pass
+            raise
+        finally:
+            try:
+                raw_conn.close()
+            except:
+                pass
 
     def _initialize_tables(self):
-        """Creates the necessary tables if they don't exist (PostgreSQL syntax)."""
-        # PostgreSQL uses SERIAL for auto-increment and different table creation checks
-        queries = [
-            """
-            CREATE TABLE IF NOT EXISTS obdscheduling_details (
-                id SERIAL PRIMARY KEY,
-                obd_name VARCHAR(255) NOT NULL,
-                flow_name VARCHAR(255) NOT NULL,
-                msc_ip VARCHAR(50) NOT NULL,
-                cli VARCHAR(50) NOT NULL,
-                scheduled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS dnd_list (
-                id SERIAL PRIMARY KEY,
-                msisdn VARCHAR(20) UNIQUE NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS subscriptions (
-                id SERIAL PRIMARY KEY,
-                msisdn VARCHAR(20) NOT NULL,
-                service_id VARCHAR(50) NOT NULL,
-                status VARCHAR(20) DEFAULT 'ACTIVE',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS unsubscriptions (
-                id SERIAL PRIMARY KEY,
-                msisdn VARCHAR(20) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS campaign_targets (
-                id SERIAL PRIMARY KEY,
-                msisdn VARCHAR(20) NOT NULL,
-                status VARCHAR(20) DEFAULT 'scheduled',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS user_details (
-                id SERIAL PRIMARY KEY,
-                username VARCHAR(50) UNIQUE NOT NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """,
-            "CREATE INDEX IF NOT EXISTS idx_dnd_msisdn ON dnd_list(msisdn);",
-            "CREATE INDEX IF NOT EXISTS idx_subs_msisdn ON subscriptions(msisdn);",
-            "CREATE INDEX IF NOT EXISTS idx_unsubs_msisdn ON unsubscriptions(msisdn);",
-            "CREATE INDEX IF NOT EXISTS idx_camp_msisdn ON campaign_targets(msisdn);",
-            """
-            CREATE TABLE IF NOT EXISTS email_sync_log (
-                id SERIAL PRIMARY KEY,
-                email_uid VARCHAR(255) UNIQUE NOT NULL,
-                filename VARCHAR(255),
-                synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS email_sourced_targets (
-                id SERIAL PRIMARY KEY,
-                msisdn VARCHAR(20) NOT NULL,
-                email_uid VARCHAR(255) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS scrub_jobs (
-                id SERIAL PRIMARY KEY,
-                username VARCHAR(50) NOT NULL,
-                status VARCHAR(20) DEFAULT 'PENDING',
-                operator VARCHAR(50),
-                options_json TEXT,
-                total_input BIGINT DEFAULT 0,
-                final_count BIGINT DEFAULT 0,
-                results_table VARCHAR(255),
-                error_message TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                started_at TIMESTAMP,
-                completed_at TIMESTAMP
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS scrub_job_inputs (
-                id SERIAL PRIMARY KEY,
-                job_id INTEGER REFERENCES scrub_jobs(id) ON DELETE CASCADE,
-                msisdn VARCHAR(20) NOT NULL
-            )
-            """
-        ]
+        """
+        Brings the schema up to date through modules.migrations: one version
+        query when current, otherwise the pending migrations are applied by
+        whichever process takes the migration lock first, up to the first
+        deploy-only migration (migrations.DEPLOY_ONLY_VERSIONS). Set
+        SCHEMA_AUTO_MIGRATE=0 when migrations run as a deploy step only.
+        """
+        from . import migrations
+        try:
+            if not migrations.is_current(self.engine):
+                if os.getenv("SCHEMA_AUTO_MIGRATE", "1") != "1":
+                    # Left to the deploy step (`python -m modules.migrations`)
+                    return False
+                applied = migrations.migrate(self.engine, deploy_only=False)
+                if applied:
+                    print(f"DEBUG: Applied schema migrations: {', '.join(f'{v:04d}_{n}' for v, n in applied)}")
+            self.ensure_default_users()
+            return True
+        except Exception as e:
+            print(f"Table Initialization Error: {e}")
+            return False
+
+    def ensure_default_users(self):
+        """Creates the default admin users on an empty user_details table."""
         try:
-            with self.engine.connect() as connection:
-                for query in queries:
-                    connection.execute(text(query))
-                connection.commit()
-                
-            # Create a default user if empty
             with self.engine.connect() as connection:
                 count = connection.execute(text("SELECT COUNT(*) FROM user_details")).scalar()
-                if count == 0:
-                    self.create_admin_user("admin", "admin123")
-                    self.create_admin_user("admin@vocal-sync.com", "admin")
+            if count == 0:
+                self.create_admin_user("admin", "admin123")
+                self.create_admin_user("admin@vocal-sync.com", "admin")
         except Exception as e:
-            print(f"Table Initialization Error: {e}")
+            print(f"Default User Error: {e}")
 
-    def create_scrub_job(self, username: str, total_input: int, operator: str | None, options: dict | None):
-        """Creates a scrub job metadata entry and returns its ID."""
+    def create_scrub_job(
+        self,
+        username: str,
+        total_input: int,
+        operator: str | None,
+        options: dict | None,
+        fingerprint: str | None = None,
+    ):
+        """
+        Creates a scrub job metadata entry and returns its ID. Fingerprint
+        reuse happens once the inputs are known (modules.scrub_jobs).
+        """
         from datetime import datetime
         import json
+        now = datetime.utcnow()
+        params = {
+            "username": username,
+            "status": "PENDING",
+            "operator": operator,
+            "options_json": json.dumps(options or {}),
+            "total_input": int(total_input or 0),
+            "created_at": now,
+            "fingerprint": fingerprint,
+            "final_count": None,
+            "results_table": None,
+            "source_job_id": None,
+            "started_at": None,
+            "completed_at": None,
+        }
         try:
             with self.engine.connect() as conn:
                 result = conn.execute(
                     text("""
-                        INSERT INTO scrub_jobs (username, status, operator, options_json, total_input, created_at)
-                        VALUES (:username, :status, :operator, :options_json, :total_input, :created_at)
+                        INSERT INTO scrub_jobs (
+                            username, status, operator, options_json, total_input, created_at,
+                            fingerprint, final_count, results_table, source_job_id, started_at, completed_at
+                        )
+                        VALUES (
+                            :username, :status, :operator, :options_json, :total_input, :created_at,
+                            :fingerprint, COALESCE(:final_count, 0), :results_table, :source_job_id, :started_at, :completed_at
+                        )
                         RETURNING id
                     """),
-                    {
-                        "username": username,
-                        "status": "PENDING",
-                        "operator": operator,
-                        "options_json": json.dumps(options or {}),
-                        "total_input": int(total_input or 0),
-                        "created_at": datetime.utcnow(),
-                    },
+                    params,
                 )
                 job_id = result.scalar()
                 conn.commit()
@@ -226,44 +248,27 @@ class DatabaseModule:
         
         # Use smaller chunks for execute_values to stay within query size limits
         chunk_size = 50000
-        msisdn_chunks = [msisdns[i:i + chunk_size] for i in range(0, len(msisdns), chunk_size)]
-        
-        raw_conn = None
         try:
-            raw_conn = self.engine.raw_connection()
-            cursor = raw_conn.cursor()
-            from psycopg2.extras import execute_values
-            
-            for chunk in msisdn_chunks:
-                data = [(job_id, str(m)) for m in chunk if m]
-                if not data:
-                    continue
-                execute_values(
-                    cursor,
-                    "INSERT INTO scrub_job_inputs (job_id, msisdn) VALUES %s",
-                    data,
-                    page_size=10000,
-                )
-                raw_conn.commit()
-            
-            cursor.close()
+            with ScrubJobInputWriter(self, job_id) as writer:
+                for i in range(0, len(msisdns), chunk_size):
+                    writer.write(msisdns[i:i + chunk_size])
             return True
         except Exception as e:
             err_msg = f"Failed to persist scrub job inputs: {str(e)}"
             self.last_error = err_msg
             print(f"ERROR: {err_msg}")
-            if raw_conn:
-                try:
-                    raw_conn.rollback()
-                except:
-                    pass
             return False
-        finally:
-            if raw_conn:
-                try:
-                    raw_conn.close()
-                except:
-                    pass
+
+    def delete_scrub_job_inputs(self, job_id: int):
+        """Drops the stored inputs of a job (e.g. once it was satisfied by reuse)."""
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text("DELETE FROM scrub_job_inputs WHERE job_id = :job_id"), {"job_id": job_id})
+                conn.commit()
+                return True
+        except Exception as e:
+            print(f"Delete Scrub Job Inputs Error: {e}")
+            return False
 
     def load_scrub_job_inputs(self, job_id: int, chunk_size: int = 100000):
         """Generator yielding MSISDN chunks for a job to avoid loading entire base in memory."""
@@ -296,8 +301,16 @@ class DatabaseModule:
         results_table: str | None = None,
         error_message: str | None = None,
         mark_started: bool = False,
+        fingerprint: str | None = None,
+        source_job_id: int | None = None,
+        total_input: int | None = None,
+        duplicate_count: int | None = None,
+        clear_fingerprint: bool = False,
     ):
-        """Updates status and optional metadata of a scrub job."""
+        """
+        Updates status and optional metadata of a scrub job. clear_fingerprint
+        withdraws the job's results from fingerprint reuse.
+        """
         from datetime import datetime
         fields = ["status = :status"]
         params = {"job_id": job_id, "status": status}
@@ -310,6 +323,20 @@ class DatabaseModule:
         if error_message is not None:
             fields.append("error_message = :error_message")
             params["error_message"] = error_message
+        if total_input is not None:
+            fields.append("total_input = :total_input")
+            params["total_input"] = int(total_input)
+        if duplicate_count is not None:
+            fields.append("duplicate_count = :duplicate_count")
+            params["duplicate_count"] = int(duplicate_count)
+        if clear_fingerprint:
+            fields.append("fingerprint = NULL")
+        elif fingerprint is not None:
+            fields.append("fingerprint = :fingerprint")
+            params["fingerprint"] = fingerprint
+        if source_job_id is not None:
+            fields.append("source_job_id = :source_job_id")
+            params["source_job_id"] = int(source_job_id)
         if mark_started:
             fields.append("started_at = :started_at")
             params["started_at"] = datetime.utcnow()
@@ -354,6 +381,312 @@ class DatabaseModule:
             print(f"Get Scrub Job Error: {e}")
             return None
 
+    def find_completed_scrub_job(self, fingerprint: str):
+        """Returns the most recent COMPLETED job with the given fingerprint, if any."""
+        if not self.engine or not fingerprint:
+            return None
+        try:
+            with self.engine.connect() as conn:
+                row = conn.execute(
+                    text(
+                        """
+                        SELECT * FROM scrub_jobs
+                        WHERE fingerprint = :fingerprint AND status = 'COMPLETED'
+                          AND results_table IS NOT NULL
+                        ORDER BY completed_at DESC
+                        LIMIT 1
+                        """
+                    ),
+                    {"fingerprint": fingerprint},
+                ).mappings().first()
+                return dict(row) if row else None
+        except Exception as e:
+            print(f"Find Completed Scrub Job Error: {e}")
+            return None
+
+    def get_exclusion_list_versions(self, tables=None):
+        """
+        Returns {table: version} for the exclusion lists. Versions are bumped
+        by a statement-level trigger on every write, so they change whenever
+        the list content may have changed.
+        """
+        tables = list(tables or self.EXCLUSION_TABLES.values())
+        versions = {t: 0 for t in tables}
+        if not self.engine or not tables:
+            return versions
+        try:
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    text("SELECT list_name, version FROM exclusion_list_versions WHERE list_name IN :tables")
+                    .bindparams(bindparam("tables", expanding=True)),
+                    {"tables": tables},
+                ).fetchall()
+                for name, version in rows:
+                    versions[name] = int(version)
+        except Exception as e:
+            print(f"Exclusion Version Error: {e}")
+        return versions
+
+    def get_exclusion_list_counts(self, estimate: bool = False):
+        """
+        Returns {table: {"row_count", "active_count"}} for the exclusion lists
+        without scanning them: exact counters kept by statement triggers, or
+        with estimate=True the planner's statistics (as fresh as the last
+        ANALYZE). active_count is ACTIVE subscriptions; all rows elsewhere.
+        """
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(exclusion_counts_query(estimate))).mappings().all()
+        return {row["list_name"]: {"row_count": int(row["row_count"]), "active_count": int(row["active_count"])} for row in rows}
+
+    def bump_exclusion_list_version(self, table: str):
+        """Explicitly bumps an exclusion list version (e.g. after an out-of-band reload)."""
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(
+                    text("""
+                        INSERT INTO exclusion_list_versions (list_name, version, updated_at)
+                        VALUES (:table, 1, CURRENT_TIMESTAMP)
+                        ON CONFLICT (list_name) DO UPDATE
+                        SET version = exclusion_list_versions.version + 1, updated_at = CURRENT_TIMESTAMP
+                    """),
+                    {"table": table},
+                )
+                conn.commit()
+                return True
+        except Exception as e:
+            self.last_error = f"Bump Exclusion Version Error: {str(e)}"
+            print(self.last_error)
+            return False
+
+    # --- SAVED AUDIENCES (incremental re-scrub) ---
+
+    def get_exclusion_change_watermark(self):
+        """
+        Returns the id of the newest exclusion_list_changes row such that every
+        change with a lower id is committed. Taking the advisory lock exclusively
+        waits out in-flight writers, which hold it shared inside the trigger.
+        """
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('exclusion_list_changes'))"))
+            head = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM exclusion_list_changes")).scalar()
+            conn.commit()
+            return int(head or 0)
+
+    def get_exclusion_changes(self, after_id: int, upto_id: int, tables):
+        """
+        Returns {table: set(8-digit suffixes)} touched in (after_id, upto_id].
+        A table mapped to None was truncated and needs a full re-check.
+        """
+        changes = {t: set() for t in tables}
+        if not tables or upto_id <= after_id:
+            return changes
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text("""
+                    SELECT DISTINCT list_name, RIGHT(TRIM(msisdn), 8) AS suffix
+                    FROM exclusion_list_changes
+                    WHERE id > :after_id AND id <= :upto_id AND list_name IN :tables
+                """).bindparams(bindparam("tables", expanding=True)),
+                {"after_id": after_id, "upto_id": upto_id, "tables": list(tables)},
+            )
+            for list_name, suffix in rows:
+                if changes.get(list_name) is None:
+                    continue
+                if suffix == "*":
+                    changes[list_name] = None
+                else:
+                    changes[list_name].add(suffix)
+        return changes
+
+    def compact_exclusion_changes(self, settled_before, batch_rows: int = 20000, pause: float = 0.0, dry_run: bool = False):
+        """
+        Deletes exclusion_list_changes rows no saved audience still needs: ids
+        at or below the lowest audience watermark, or every row when there are
+        no audiences. Only rows logged before settled_before go, so an audience
+        whose full check is still running (watermark read, row not yet stored)
+        keeps its delta. Deletes in batches of batch_rows.
+        Returns {"cutoff": id, "rows": deleted (or deletable on dry_run)}.
+        """
+        with self.engine.connect() as conn:
+            cutoff = conn.execute(text("""
+                SELECT COALESCE(
+                    (SELECT MIN(change_watermark) FROM saved_audiences),
+                    (SELECT MAX(id) FROM exclusion_list_changes),
+                    0
+                )
+            """)).scalar()
+            params = {"cutoff": int(cutoff or 0), "settled": settled_before, "limit": int(batch_rows)}
+            if dry_run:
+                rows = conn.execute(
+                    text("SELECT COUNT(*) FROM exclusion_list_changes WHERE id <= :cutoff AND changed_at < :settled"),
+                    params,
+                ).scalar()
+                return {"cutoff": params["cutoff"], "rows": int(rows or 0)}
+
+            delete_batch = text("""
+                DELETE FROM exclusion_list_changes WHERE id IN (
+                    SELECT id FROM exclusion_list_changes
+                    WHERE id <= :cutoff AND changed_at < :settled
+                    ORDER BY id LIMIT :limit
+                )
+            """)
+            deleted = 0
+            while True:
+                batch = conn.execute(delete_batch, params).rowcount
+                conn.commit()
+                deleted += batch
+                if batch < params["limit"]:
+                    break
+                time.sleep(pause)
+        return {"cutoff": params["cutoff"], "rows": deleted}
+
+    def create_saved_audience(self, username, name, operator, options, members, watermark):
+        """
+        Stores a normalized audience with its scrub outcome.
+        members: iterable of (msisdn, suffix, operator_ok, in_dnd, in_sub, in_unsub).
+        """
+        import json
+        members = list(members)
+        try:
+            with self.raw_connection() as raw_conn:
+                cursor = raw_conn.cursor()
+                cursor.execute(
+                    """
+                    INSERT INTO saved_audiences (username, name, operator, options_json, total_input, change_watermark, last_scrubbed_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+                    RETURNING id
+                    """,
+                    (username, name, operator, json.dumps(options or {}), len(members), watermark),
+                )
+                audience_id = cursor.fetchone()[0]
+
+                from psycopg2.extras import execute_values
+                chunk_size = 50000
+                for i in range(0, len(members), chunk_size):
+                    execute_values(
+                        cursor,
+                        """
+                        INSERT INTO saved_audience_members
+                        (audience_id, msisdn, suffix, operator_ok, in_dnd, in_sub, in_unsub) VALUES %s
+                        ON CONFLICT (audience_id, msisdn) DO NOTHING
+                        """,
+                        [(audience_id,) + tuple(m) for m in members[i:i + chunk_size]],
+                        page_size=10000,
+                    )
+                raw_conn.commit()
+                cursor.close()
+                return audience_id
+        except Exception as e:
+            self.last_error = f"Create Saved Audience Error: {str(e)}"
+            print(self.last_error)
+            return None
+
+    def get_saved_audience(self, audience_id: int, username: str | None = None):
+        """Fetches a saved audience, optionally asserting ownership by username."""
+        query = "SELECT * FROM saved_audiences WHERE id = :id"
+        params = {"id": audience_id}
+        if username:
+            query += " AND username = :username"
+            params["username"] = username
+        rows = self.execute_query(query, params)
+        return rows[0] if rows else None
+
+    def list_saved_audiences(self, username: str):
+        """Lists saved audiences for a user (without members)."""
+        return self.execute_query(
+            "SELECT * FROM saved_audiences WHERE username = :username ORDER BY created_at DESC",
+            {"username": username},
+        )
+
+    def get_saved_audience_members(self, audience_id: int, suffixes=None):
+        """Returns member rows, restricted to the given suffixes when provided."""
+        query = """
+            SELECT msisdn, suffix, operator_ok, in_dnd, in_sub, in_unsub
+            FROM saved_audience_members WHERE audience_id = :audience_id
+        """
+        if suffixes is None:
+            return self.execute_query(query, {"audience_id": audience_id})
+        suffixes = list(suffixes)
+        rows = []
+        chunk_size = 30000
+        for i in range(0, len(suffixes), chunk_size):
+            rows.extend(self.execute_query(
+                text(query + " AND suffix IN :suffixes").bindparams(bindparam("suffixes", expanding=True)),
+                {"audience_id": audience_id, "suffixes": suffixes[i:i + chunk_size]},
+            ))
+        return rows
+
+    def apply_saved_audience_delta(self, audience_id: int, updates, final_count_delta: int, watermark: int):
+        """
+        Writes recomputed member flags and moves the audience watermark forward.
+        updates: list of (msisdn, in_dnd, in_sub, in_unsub).
+        """
+        try:
+            with self.raw_connection() as raw_conn:
+                cursor = raw_conn.cursor()
+                if updates:
+                    from psycopg2.extras import execute_values
+                    execute_values(
+                        cursor,
+                        f"""
+                        UPDATE saved_audience_members AS m
+                        SET in_dnd = v.in_dnd, in_sub = v.in_sub, in_unsub = v.in_unsub
+                        FROM (VALUES %s) AS v (msisdn, in_dnd, in_sub, in_unsub)
+                        WHERE m.audience_id = {int(audience_id)} AND m.msisdn = v.msisdn
+                        """,
+                        updates,
+                        page_size=10000,
+                    )
+                cursor.execute(
+                    """
+                    UPDATE saved_audiences
+                    SET final_count = final_count + %s, change_watermark = %s, last_scrubbed_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                    RETURNING final_count
+                    """,
+                    (int(final_count_delta), int(watermark), audience_id),
+                )
+                final_count = cursor.fetchone()[0]
+                raw_conn.commit()
+                cursor.close()
+                return final_count
+        except Exception as e:
+            self.last_error = f"Saved Audience Update Error: {str(e)}"
+            print(self.last_error)
+            return None
+
+    def load_saved_audience_survivors(self, audience_id: int, options: dict):
+        """Returns the MSISDNs of an audience that pass every enabled check."""
+        conditions = ["audience_id = :audience_id"]
+        if options.get("operator"):
+            conditions.append("operator_ok")
+        for key in self.EXCLUSION_TABLES:
+            if options.get(key):
+                conditions.append(f"NOT in_{key}")
+        rows = self.execute_query(
+            f"SELECT msisdn FROM saved_audience_members WHERE {' AND '.join(conditions)}",
+            {"audience_id": audience_id},
+        )
+        return [r["msisdn"] for r in rows]
+
+    def set_saved_audience_final_count(self, audience_id: int, final_count: int, results_table: str | None = None):
+        """Overwrites the stored final count (after a full recount) and optional results table."""
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(
+                    text("""
+                        UPDATE saved_audiences
+                        SET final_count = :final_count, results_table = COALESCE(:results_table, results_table)
+                        WHERE id = :id
+                    """),
+                    {"id": audience_id, "final_count": int(final_count), "results_table": results_table},
+                )
+                conn.commit()
+                return True
+        except Exception as e:
+            print(f"Saved Audience Count Error: {e}")
+            return False
+
     def list_scrub_jobs(self, username: str, limit: int = 20):
         """Lists recent scrub jobs for a given user."""
         if not self.engine:
@@ -423,37 +756,7 @@ class DatabaseModule:
 
         stats["results_table"] = results_table
 
-        create_query = text("""
-            CREATE TABLE IF NOT EXISTS scrub_history_log (
-                id SERIAL PRIMARY KEY,
-                total_input INT,
-                final_count INT,
-                dnd_removed INT,
-                sub_removed INT,
-                unsub_removed INT,
-                operator_removed INT,
-                results_table VARCHAR(255),
-                logged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # 1. Create the table if it's new
-        try:
-            with self.engine.connect() as conn1:
-                conn1.execute(create_query)
-                conn1.commit()
-        except Exception:
-            pass
-
-        # Make sure the results_table column exists if table is old
-        try:
-            with self.engine.connect() as conn2:
-                conn2.execute(text("ALTER TABLE scrub_history_log ADD COLUMN results_table VARCHAR(255)"))
-                conn2.commit()
-        except Exception:
-            pass
-
-        # 2. Insert the entry
+        # Insert the entry (scrub_history_log is created by migration 0002)
         insert_query = text("""
             INSERT INTO scrub_history_log 
             (total_input, final_count, dnd_removed, sub_removed, unsub_removed, operator_removed, results_table)
@@ -472,16 +775,6 @@ class DatabaseModule:
 
     def get_scrub_history(self):
         """Fetches the last 50 scrub history entries."""
-        try:
-            # Add results_table safely just in case
-            with self.engine.connect() as connection:
-                try:
-                    connection.execute(text("ALTER TABLE scrub_history_log ADD COLUMN results_table VARCHAR(255)"))
-                except Exception:
-                    pass
-        except Exception:
-            pass
-
         query = "SELECT * FROM scrub_history_log ORDER BY logged_at DESC LIMIT 50"
         return self.execute_query(query)
 
@@ -506,30 +799,19 @@ class DatabaseModule:
         """
         Saves MSISDNs into a single dynamically created table: obd_d1_{project_name}
         Internally batches inserts to prevent DB overload.
+        Targets that are already in a result set should go through
+        campaign_launch instead, which copies them database-side.
         """
         if not msisdns:
             return True, "No MSISDNs to save."
-            
-        import re
-        # Sanitize project name to be a valid SQL identifier
-        safe_name = re.sub(r'[^a-zA-Z0-9_]', '_', project_name).lower()
-        if not safe_name: safe_name = "default"
-        
-        table_name = f"obd_d1_{safe_name}"
+
+        table_name = campaign_table_name(project_name)
         print(f"DEBUG: Saving {len(msisdns)} targets into table '{table_name}'")
         
         try:
             with self.engine.connect() as connection:
                 # 1. Create the specific project table
-                create_query = text(f"""
-                    CREATE TABLE IF NOT EXISTS {table_name} (
-                        id SERIAL PRIMARY KEY,
-                        msisdn VARCHAR(20) NOT NULL,
-                        scheduled BOOLEAN DEFAULT TRUE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                connection.execute(create_query)
+                ensure_campaign_table(connection, table_name)
                 
                 # 2. Insert the data in chunks
                 chunk_size = 5000
@@ -549,73 +831,23 @@ class DatabaseModule:
             print(f"ERROR: {err_msg}")
             return False, err_msg
 
-    def save_verified_scrub_results(self, msisdns: list):
+    def save_verified_scrub_results(self, msisdns: list, job_id: int | None = None):
         """
-        Saves verified MSISDNs into a unique timestamped table.
-        Used automatically after each scrub.
+        Saves verified MSISDNs as a new result set in the partitioned
+        scrub_results table. Used automatically after each scrub.
+        Returns (ok, result set reference or error); an empty list still gets
+        an (empty) result set so jobs always have a valid reference.
         """
-        if not msisdns:
-            return True, "No MSISDNs to save."
-
-        from datetime import datetime
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        table_name = f"scrub_results_{timestamp}"
-        
-        # Use smaller chunks for execute_values to stay within query size limits
         chunk_size = 50000
-        msisdn_chunks = [msisdns[i:i + chunk_size] for i in range(0, len(msisdns), chunk_size)]
-        
-        raw_conn = None
         try:
-            raw_conn = self.engine.raw_connection()
-            cursor = raw_conn.cursor()
-            # 1. Create the specific scrub results table
-            cursor.execute(f"""
-                CREATE TABLE IF NOT EXISTS {table_name} (
-                    id SERIAL PRIMARY KEY,
-                    msisdn VARCHAR(20) NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # 2. Incredible fast chunked bulk insertion
-            from psycopg2.extras import execute_values
-            for chunk in msisdn_chunks:
-                data = [(str(m),) for m in chunk]
-                execute_values(
-                    cursor,
-                    f"INSERT INTO {table_name} (msisdn) VALUES %s",
-                    data,
-                    page_size=10000
-                )
-                raw_conn.commit()
-            
-            cursor.close()
-
-            # Invalidate stats cache
-            try:
-                from .cache_engine import cache_engine
-                cache_engine.delete("db_stats")
-            except:
-                pass
-            
-            return True, table_name
+            with ScrubResultsWriter(self, job_id) as writer:
+                for i in range(0, len(msisdns), chunk_size):
+                    writer.write(msisdns[i:i + chunk_size])
+            return True, writer.reference
         except Exception as e:
             err_msg = f"Failed to auto-save scrub results: {str(e)}"
             print(f"ERROR: {err_msg}")
-            if raw_conn:
-                try:
-                    raw_conn.rollback()
-                except:
-                    pass
             return False, err_msg
-        finally:
-            if raw_conn:
-                try:
-                    raw_conn.close()
-                except:
-                    pass
-
 
     def execute_query(self, query, params=None):
         """Executes a raw SQL select query and handles result mapping."""
@@ -654,69 +886,134 @@ class DatabaseModule:
                 expanded.add(m_str[-8:])
         return list(expanded)
 
+    def _small_table_snapshot(self, table_name, extra_params=None):
+        """
+        Returns every msisdn of a small exclusion table (< 50k rows), cached per
+        list version, or None when the table is too large to snapshot.
+        """
+        from .cache_engine import cache_engine
+        # Keyed on the list version so writes invalidate the snapshot immediately
+        version = self.get_exclusion_list_versions([table_name])[table_name]
+        cache_key = f"table_full:{table_name}:{version}:{cache_engine.generate_key('', extra_params)}"
+        cached_data = cache_engine.get(cache_key)
+        if cached_data is not None:
+            return cached_data
+
+        try:
+            with self.engine.connect() as conn:
+                # Trigger-maintained counter; COUNT(*) only for tables without one
+                count = conn.execute(
+                    text("SELECT row_count FROM exclusion_list_counters WHERE list_name = :table"),
+                    {"table": table_name},
+                ).scalar()
+                if count is None:
+                    count = conn.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar()
+                if count < 50000:
+                    q_str = f"SELECT msisdn FROM {table_name}"
+                    if extra_params and "service_id" in extra_params:
+                        q_str += " WHERE service_id = :service_id AND status = 'ACTIVE'"
+
+                    all_res = conn.execute(text(q_str), extra_params or {})
+                    res_list = [row[0] for row in all_res]
+                    cache_engine.set(cache_key, res_list, expire=600)
+                    return res_list
+        except Exception as e:
+            print(f"DEBUG: Optimization check failed: {e}")
+        return None
+
     def _chunked_lookup(self, msisdns, query_template, extra_params=None):
-        """Processes large MSISDN lists in parallel batches for extreme speed."""
+        """Processes large MSISDN lists in batches on the shared lookup scheduler."""
         if not msisdns:
             return []
-            
-        from .cache_engine import cache_engine
-        import concurrent.futures
-        
+
         # 1. OPTIMIZATION: Small table fetch (Table-level caching)
         import re
         table_match = re.search(r'FROM\s+(\w+)', query_template, re.IGNORECASE)
+        table_name = table_match.group(1) if table_match else "unknown"
         if table_match and self.engine:
-            table_name = table_match.group(1)
-            cache_key = f"table_full:{table_name}:{hash(str(extra_params))}"
-            cached_data = cache_engine.get(cache_key)
-            if cached_data is not None:
-                return cached_data
+            snapshot = self._small_table_snapshot(table_name, extra_params)
+            if snapshot is not None:
+                return snapshot
 
-            try:
-                with self.engine.connect() as conn:
-                    count = conn.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar()
-                    if count < 50000:
-                        q_str = f"SELECT msisdn FROM {table_name}"
-                        if extra_params and "service_id" in extra_params:
-                            q_str += " WHERE service_id = :service_id AND status = 'ACTIVE'"
-                        
-                        all_res = conn.execute(text(q_str), extra_params or {})
-                        res_list = [row[0] for row in all_res]
-                        cache_engine.set(cache_key, res_list, expire=600)
-                        return res_list
-            except Exception as e:
-                print(f"DEBUG: Optimization check failed: {e}")
-
-        # 2. PARALLEL CHUNKED LOOKUP
+        # 2. PARALLEL CHUNKED LOOKUP (batch size and concurrency set by the scheduler)
         expanded = self._expand_msisdns(msisdns)
-        results = []
-        chunk_size = 30000 # Larger chunks = fewer calls
-        chunks = [expanded[i:i + chunk_size] for i in range(0, len(expanded), chunk_size)]
         
+        def query_chunk(chunk_list):
+            with self.engine.connect() as connection:
+                params = {"msisdns": chunk_list}
+                if extra_params:
+                    params.update(extra_params)
+                
+                query = text(query_template).bindparams(
+                    bindparam("msisdns", expanding=True)
+                )
+                chunk_results = connection.execute(query, params).mappings()
+                return [row['msisdn'] for row in chunk_results if 'msisdn' in row]
+
         def process_chunk(chunk_list):
-            try:
-                with self.engine.connect() as connection:
-                    params = {"msisdns": chunk_list}
-                    if extra_params:
-                        params.update(extra_params)
-                    
-                    query = text(query_template).bindparams(
-                        bindparam("msisdns", expanding=True)
-                    )
-                    chunk_results = connection.execute(query, params).mappings()
-                    return [row['msisdn'] for row in chunk_results if 'msisdn' in row]
-            except Exception as e:
-                print(f"Chunk Query Error on {table_name}: {e}")
-                return []
-
-        # Utilize ThreadPool to handle parallel network requests to Supabase
-        max_workers = min(10, len(chunks)) if chunks else 1
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_chunk = {executor.submit(process_chunk, c): c for c in chunks}
-            for future in concurrent.futures.as_completed(future_to_chunk):
-                results.extend(future.result())
-            
-        return list(set(results)) # Deduplicate matches
+            return _run_chunk_query(table_name, lambda: query_chunk(chunk_list))
+
+        results = set()
+        for chunk_result in lookup_scheduler.map(table_name, expanded, process_chunk):
+            results.update(chunk_result)
+        return list(results) # Deduplicate matches
+
+    # Per-list branch of the combined lookup; rows are tagged with their list key
+    EXCLUSION_LOOKUPS = {
+        "dnd": "SELECT 'dnd' AS source, msisdn FROM dnd_list WHERE msisdn IN (SELECT msisdn FROM input)",
+        "sub": (
+            "SELECT 'sub' AS source, msisdn FROM subscriptions WHERE service_id = :service_id "
+            "AND status = 'ACTIVE' AND msisdn IN (SELECT msisdn FROM input)"
+        ),
+        "unsub": "SELECT 'unsub' AS source, msisdn FROM unsubscriptions WHERE msisdn IN (SELECT msisdn FROM input)",
+    }
+
+    def check_exclusions_bulk(self, msisdns, lists=None, service_id="PROMO"):
+        """
+        Checks several exclusion lists in one pass: each chunk of the expanded
+        base is sent once, as a single array parameter, and matched against all
+        requested lists by one UNION ALL query whose rows carry their source.
+        Small lists are served from the cached full-table snapshot as before.
+        Returns {list key: [matched msisdn, ...]} for lists in dnd/sub/unsub.
+        """
+        lists = [key for key in (lists or self.EXCLUSION_LOOKUPS) if key in self.EXCLUSION_LOOKUPS]
+        results = {key: [] for key in lists}
+        if not msisdns or not lists or not self.engine:
+            return results
+
+        remote = []
+        for key in lists:
+            extra_params = {"service_id": service_id} if key == "sub" else None
+            snapshot = self._small_table_snapshot(self.EXCLUSION_TABLES[key], extra_params)
+            if snapshot is not None:
+                results[key] = snapshot
+            else:
+                remote.append(key)
+        if not remote:
+            return results
+
+        query = text(
+            "WITH input(msisdn) AS (SELECT unnest(CAST(:msisdns AS text[]))) "
+            + " UNION ALL ".join(self.EXCLUSION_LOOKUPS[key] for key in remote)
+        )
+        expanded = self._expand_msisdns(msisdns)
+
+        def query_chunk(chunk_list):
+            with self.engine.connect() as connection:
+                rows = connection.execute(query, {"msisdns": chunk_list, "service_id": service_id})
+                return rows.fetchall()
+
+        def process_chunk(chunk_list):
+            return _run_chunk_query("/".join(remote), lambda: query_chunk(chunk_list))
+
+        matched = {key: set() for key in remote}
+        # Batches share the process-wide DB budget with every other running lookup
+        for rows in lookup_scheduler.map("exclusions", expanded, process_chunk):
+            for source, msisdn in rows:
+                matched[source].add(msisdn)
+        for key in remote:
+            results[key] = list(matched[key])
+        return results
 
     def check_dnd_bulk(self, msisdns):
         """Checks which given MSISDNs are in the DND list (Batch-Optimized)."""
@@ -739,76 +1036,390 @@ class DatabaseModule:
 
     def save_email_csv_to_new_table(self, uid, filename, msisdns):
         """
-        Saves MSISDNs from an email CSV into a NEW timestamped table.
-        Each scrub creates its own table: email_csv_YYYYMMDD_HHMMSS
-        Uses psycopg2 execute_values for fast bulk insert.
+        Saves MSISDNs from an email CSV as a new result set (source
+        'email_csv') in scrub_results and records the email UID as synced.
+        Returns (ok, result set reference or error).
         """
         if not msisdns:
             return True, "No MSISDNs to save."
 
-        from datetime import datetime
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        table_name = f"email_csv_{timestamp}"
-        
-        # Use smaller chunks for execute_values to stay within query size limits
-        chunk_size = 50000
-        msisdn_chunks = [msisdns[i:i + chunk_size] for i in range(0, len(msisdns), chunk_size)]
-        
-        raw_conn = None
         try:
-            raw_conn = self.engine.raw_connection()
-            cursor = raw_conn.cursor()
-            
-            # 1. Check if UID already processed
-            cursor.execute("SELECT 1 FROM email_sync_log WHERE email_uid = %s", (str(uid),))
-            if cursor.fetchone():
+            with self.raw_connection() as raw_conn:
+                cursor = raw_conn.cursor()
+                # 1. Check if UID already processed
+                cursor.execute("SELECT 1 FROM email_sync_log WHERE email_uid = %s", (str(uid),))
+                already = cursor.fetchone()
                 cursor.close()
+            if already:
                 return False, f"Email UID {uid} already processed."
-            
-            # 2. Create NEW timestamped table
-            cursor.execute(f"""
-                CREATE TABLE IF NOT EXISTS {table_name} (
-                    id SERIAL PRIMARY KEY,
-                    msisdn VARCHAR(20) NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # 3. Fast chunked bulk insert
-            from psycopg2.extras import execute_values
-            print(f"DEBUG: Bulk inserting {len(msisdns)} rows into {table_name} in chunks...")
-            for chunk in msisdn_chunks:
-                data = [(str(m),) for m in chunk]
-                execute_values(
-                    cursor,
-                    f"INSERT INTO {table_name} (msisdn) VALUES %s",
-                    data,
-                    page_size=10000
+
+            # 2. Bulk load into a new result set
+            print(f"DEBUG: Bulk loading {len(msisdns)} email CSV rows into scrub_results...")
+            chunk_size = 50000
+            with ScrubResultsWriter(self, source="email_csv", label=filename) as writer:
+                for i in range(0, len(msisdns), chunk_size):
+                    writer.write(msisdns[i:i + chunk_size])
+
+            # 3. Log the sync
+            with self.raw_connection() as raw_conn:
+                cursor = raw_conn.cursor()
+                cursor.execute(
+                    "INSERT INTO email_sync_log (email_uid, filename) VALUES (%s, %s)",
+                    (str(uid), f"{filename} -> {writer.reference}")
                 )
                 raw_conn.commit()
-            
-            # 4. Log the sync
-            cursor.execute(
-                "INSERT INTO email_sync_log (email_uid, filename) VALUES (%s, %s)",
-                (str(uid), f"{filename} -> {table_name}")
-            )
-            raw_conn.commit()
-            
-            cursor.close()
-            return True, table_name
+                cursor.close()
+            return True, writer.reference
         except Exception as e:
             err_msg = f"Email CSV Sync Error: {str(e)}"
             print(err_msg)
-            if raw_conn:
-                try:
-                    raw_conn.rollback()
-                except:
-                    pass
             return False, err_msg
-        finally:
-            if raw_conn:
+
+    def load_result_set(self, reference, limit: int | None = None):
+        """Returns the MSISDNs of a result set (see result_set_query)."""
+        query, params = result_set_query(reference, limit)
+        return [r["msisdn"] for r in self.execute_query(query, params)]
+
+    def iter_result_set(self, reference, batch_rows: int = 50000):
+        """
+        Yields the MSISDNs of a result set in blocks from a server-side
+        (named) cursor, so memory stays flat whatever the result size.
+        """
+        query, params = result_set_query(reference)
+        # Named cursors run on the DBAPI connection: switch to psycopg2 placeholders
+        query = re.sub(r"(?<!:):(\w+)", r"%(\1)s", query)
+        with self.raw_connection() as raw_conn:
+            cursor = raw_conn.cursor(name=f"results_{os.getpid()}_{threading.get_ident()}")
+            cursor.itersize = batch_rows
+            try:
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(batch_rows)
+                    if not rows:
+                        break
+                    yield [row[0] for row in rows]
+            finally:
+                cursor.close()
+                raw_conn.rollback()
+
+    def list_result_partitions(self):
+        """[(partition name, day, total bytes)] of scrub_results, oldest first."""
+        from datetime import datetime
+        with self.engine.connect() as conn:
+            rows = conn.execute(text("""
+                SELECT c.relname, pg_total_relation_size(c.oid) FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE p.relname = 'scrub_results'
+            """)).fetchall()
+        partitions = []
+        for name, size in rows:
+            match = re.fullmatch(r"scrub_results_p(\d{8})", name)
+            if match:
+                partitions.append((name, datetime.strptime(match.group(1), "%Y%m%d").date(), int(size)))
+        return sorted(partitions, key=lambda partition: partition[1])
+
+    def drop_result_partitions(self, older_than_days: int, lock_timeout: str = "5s"):
+        """
+        Retention for scrub_results: drops whole day partitions older than the
+        cutoff (no row-by-row DELETE) together with their result set rows, one
+        short transaction per day. lock_timeout caps the wait for the parent
+        table's lock so writers of today's results are never held up for long.
+        A partition that cannot be dropped (lock wait timed out, ...) is
+        logged and skipped, together with its result set rows, and retried
+        on the next run. Returns the names of the dropped partitions.
+        """
+        from datetime import date, timedelta
+        cutoff = date.today() - timedelta(days=int(older_than_days))
+        dropped = []
+        skipped = []
+        with self.engine.connect() as conn:
+            for name, day, _ in self.list_result_partitions():
+                if day >= cutoff:
+                    continue
                 try:
-                    raw_conn.close()
-                except:
-                    pass
+                    conn.execute(text("SELECT set_config('lock_timeout', :timeout, true)"), {"timeout": lock_timeout})
+                    conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                    conn.execute(text("DELETE FROM scrub_result_sets WHERE created_on = :day"), {"day": day})
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    print(f"Retention: skipped partition {name}: {e}")
+                    skipped.append(day)
+                    continue
+                _RESULT_PARTITIONS.discard(day)
+                dropped.append(name)
+            conn.execute(
+                text("DELETE FROM scrub_result_sets WHERE created_on < :cutoff AND NOT (created_on = ANY(:skipped))"),
+                {"cutoff": cutoff, "skipped": skipped},
+            )
+            conn.commit()
+        return dropped
+
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def copy_rows(cursor, table_name, columns, rows):
+    """
+    Bulk-loads rows (tuples of str, None for NULL) with COPY ... FROM STDIN
+    in text format, several times faster than multi-row INSERTs. Returns the
+    row count.
+    """
+    import io
+    buf = io.StringIO()
+    count = 0
+    for row in rows:
+        buf.write("\t".join("\\N" if v is None else v.translate(_COPY_ESCAPES) for v in row))
+        buf.write("\n")
+        count += 1
+    if count:
+        buf.seek(0)
+        cursor.copy_expert(f"COPY {table_name} ({', '.join(columns)}) FROM STDIN", buf)
+    return count
+
+
+class ScrubJobInputWriter:
+    """
+    Appends MSISDN blocks to scrub_job_inputs over a single raw connection,
+    committing per block, so callers can stream a base of any size into a job.
+    """
+    def __init__(self, db: DatabaseModule, job_id: int):
+        self.db = db
+        self.job_id = job_id
+        self.count = 0
+        self.raw_conn = db.engine.raw_connection()
+        self.cursor = self.raw_conn.cursor()
+
+    def write(self, msisdns):
+        job_id = str(int(self.job_id))
+        written = copy_rows(
+            self.cursor, "scrub_job_inputs", ("job_id", "msisdn"),
+            ((job_id, str(m)) for m in msisdns if m),
+        )
+        self.raw_conn.commit()
+        self.count += written
+        return written
+
+    def close(self):
+        try:
+            self.cursor.close()
+        finally:
+            self.raw_conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type:
+            try:
+                self.raw_conn.rollback()
+            except:
+                pass
+        self.close()
+        return False
+
+
+RESULT_SET_PREFIX = "result_set_"
+_RESULT_PARTITIONS = set()
+_MSISDN_KEY_STRIP = None
+
+
+def result_set_reference(result_set_id: int) -> str:
+    """The value stored in results_table columns for a result set."""
+    return f"{RESULT_SET_PREFIX}{int(result_set_id)}"
+
+
+def parse_result_set_reference(reference) -> int | None:
+    """Result set id of a results_table value, None for legacy per-run table names."""
+    if isinstance(reference, str) and reference.startswith(RESULT_SET_PREFIX):
+        suffix = reference[len(RESULT_SET_PREFIX):]
+        if suffix.isdigit():
+            return int(suffix)
+    return None
+
+
+def result_set_query(reference, limit: int | None = None, after: str | None = None):
+    """
+    (query, params) selecting `msisdn` and an opaque keyset `cursor` for the
+    rows of a result set, given its id or results_table reference. Rows come
+    in (msisdn_key, msisdn) order; pass the last row's cursor as `after` to
+    get the next page. The set's created_on is looked up in an initplan so
+    only its day partition is scanned (run-time pruning). Legacy per-run
+    tables (scrub_results_* / email_csv_*) are still readable by name and
+    page on their id.
+    """
+    result_set_id = reference if isinstance(reference, int) else parse_result_set_reference(reference)
+    params = {}
+    if result_set_id is not None:
+        query = (
+            "SELECT msisdn, msisdn_key::text || ':' || msisdn AS cursor FROM scrub_results "
+            "WHERE result_set_id = :id "
+            "AND created_on = (SELECT created_on FROM scrub_result_sets WHERE id = :id)"
+        )
+        params["id"] = result_set_id
+        if after:
+            key, _, last = after.partition(":")
+            if not key.isdigit():
+                raise ValueError(f"Invalid cursor: {after}")
+            query += " AND (msisdn_key, msisdn) > (:after_key, :after_msisdn)"
+            params.update(after_key=int(key), after_msisdn=last)
+        query += " ORDER BY msisdn_key, msisdn"
+    elif isinstance(reference, str) and re.fullmatch(r"(scrub_results|email_csv)_[0-9_]+", reference):
+        query = f"SELECT msisdn, id::text AS cursor FROM {reference}"
+        if after:
+            if not after.isdigit():
+                raise ValueError(f"Invalid cursor: {after}")
+            query += " WHERE id > :after_id"
+            params["after_id"] = int(after)
+        query += " ORDER BY id"
+    else:
+        raise ValueError(f"Invalid results reference: {reference}")
+    if limit:
+        query += " LIMIT :limit"
+        params["limit"] = int(limit)
+    return query, params
+
+
+_EXCLUSION_COUNTS_SQL = "SELECT list_name, row_count, active_count FROM exclusion_list_counters"
+
+# Planner estimates: pg_class.reltuples (summed over the hash partitions), with
+# the ACTIVE share of subscriptions taken from the status column's
+# most-common-value statistics
+_EXCLUSION_ESTIMATES_SQL = """
+    SELECT p.relname AS list_name,
+           SUM(GREATEST(c.reltuples, 0))::bigint AS row_count,
+           (SUM(GREATEST(c.reltuples, 0)) * CASE WHEN p.relname = 'subscriptions' THEN COALESCE((
+               SELECT m.freq FROM pg_stats s
+               CROSS JOIN LATERAL unnest(s.most_common_vals::text::text[], s.most_common_freqs) AS m(val, freq)
+               WHERE s.schemaname = current_schema() AND s.tablename = 'subscriptions'
+                 AND s.attname = 'status' AND m.val = 'ACTIVE'
+               ORDER BY s.inherited DESC LIMIT 1
+           ), 1) ELSE 1 END)::bigint AS active_count
+    FROM pg_class p
+    LEFT JOIN pg_inherits i ON i.inhparent = p.oid
+    JOIN pg_class c ON c.oid = COALESCE(i.inhrelid, p.oid)
+    WHERE p.relnamespace = current_schema()::regnamespace
+      AND p.relname IN ('dnd_list', 'subscriptions', 'unsubscriptions')
+    GROUP BY p.relname
+"""
+
+
+def exclusion_counts_query(estimate: bool = False) -> str:
+    """SQL returning (list_name, row_count, active_count) per exclusion list, exact or estimated."""
+    return _EXCLUSION_ESTIMATES_SQL if estimate else _EXCLUSION_COUNTS_SQL
+
+
+def campaign_table_name(project_name) -> str:
+    """obd_d1_<project>, with the project name sanitized to a valid SQL identifier."""
+    safe_name = re.sub(r'[^a-zA-Z0-9_]', '_', project_name or "").lower()
+    return f"obd_d1_{safe_name or 'default'}"
+
+
+def ensure_campaign_table(conn, table_name):
+    """Creates a campaign target table (obd_d1_*) if it does not exist yet."""
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            id SERIAL PRIMARY KEY,
+            msisdn VARCHAR(20) NOT NULL,
+            scheduled BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+
+def msisdn_key(msisdn) -> int:
+    """
+    Compact integer key of an MSISDN: its national number (digits without
+    the 234 / leading 0 prefix), so 234803..., 0803... and 803... share a key.
+    """
+    global _MSISDN_KEY_STRIP
+    if _MSISDN_KEY_STRIP is None:
+        import re
+        _MSISDN_KEY_STRIP = (re.compile(r"\D"), re.compile(r"^(?:234)?0?"))
+    non_digits, prefix = _MSISDN_KEY_STRIP
+    digits = prefix.sub("", non_digits.sub("", str(msisdn)), count=1)
+    return int(digits[:18]) if digits else 0
+
+
+def ensure_results_partition(cursor, day):
+    """
+    Creates the scrub_results partition holding `day` if needed. Cached per
+    process, so this is DDL once per day at most; the advisory lock keeps
+    concurrent writers from racing on CREATE.
+    """
+    from datetime import timedelta
+    if day in _RESULT_PARTITIONS:
+        return
+    name = f"scrub_results_p{day:%Y%m%d}"
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext('scrub_results_partitions'))")
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF scrub_results "
+        f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+    )
+    _RESULT_PARTITIONS.add(day)
+
+
+class ScrubResultsWriter:
+    """
+    Appends survivor blocks to a new result set in the day-partitioned
+    scrub_results table, committing per block, so results become visible
+    while a scrub is still running. `reference` (result_set_<id>) is what
+    goes into results_table columns.
+    """
+    def __init__(self, db: DatabaseModule, job_id: int | None = None, source: str = "scrub", label: str | None = None):
+        self.db = db
+        self.job_id = int(job_id) if job_id else None
+        self.count = 0
+        self.raw_conn = db.engine.raw_connection()
+        self.cursor = self.raw_conn.cursor()
+        try:
+            self.cursor.execute(
+                "INSERT INTO scrub_result_sets (job_id, source, label) VALUES (%s, %s, %s) RETURNING id, created_on",
+                (self.job_id, source, label),
+            )
+            self.result_set_id, self.created_on = self.cursor.fetchone()
+            ensure_results_partition(self.cursor, self.created_on)
+            self.raw_conn.commit()
+        except Exception:
+            self.raw_conn.rollback()
+            self.raw_conn.close()
+            raise
+        self.reference = result_set_reference(self.result_set_id)
+
+    def write(self, msisdns):
+        set_id = str(self.result_set_id)
+        job_id = None if self.job_id is None else str(self.job_id)
+        day = self.created_on.isoformat()
+        written = copy_rows(
+            self.cursor, "scrub_results", ("result_set_id", "job_id", "msisdn_key", "msisdn", "created_on"),
+            ((set_id, job_id, str(msisdn_key(m)), str(m), day) for m in msisdns),
+        )
+        self.raw_conn.commit()
+        self.count += written
+        return written
+
+    def close(self, complete: bool = True):
+        """Records the row count; only a complete set gets closed_at and is served as a whole."""
+        try:
+            self.cursor.execute(
+                "UPDATE scrub_result_sets SET row_count = %s, closed_at = CASE WHEN %s THEN CURRENT_TIMESTAMP END "
+                "WHERE id = %s",
+                (self.count, complete, self.result_set_id),
+            )
+            self.raw_conn.commit()
+            self.cursor.close()
+        finally:
+            self.raw_conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type:
+            try:
+                self.raw_conn.rollback()
+            except:
+                pass
+        self.close(complete=exc_type is None)
+        return False
@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+from typing import Iterator, List, Optional, Tuple
+
+# Rough in-memory cost of one key in a Python set (str object + set slot)
+_BYTES_PER_KEY = 120
+_SPILL_ESCAPE = str.maketrans({"\t": " ", "\n": " "})
+
+
+class SpillingDeduplicator:
+    """
+    Streaming de-duplication with a bounded memory budget.
+
+    Values are de-duplicated on a key (e.g. the normalized MSISDN). While the
+    set of seen keys fits in DEDUP_MEMORY_MB, new values are returned from
+    add() immediately. Once the budget is exceeded the seen keys are spilled,
+    flagged as already emitted, into hash-partitioned files and every further
+    value is appended to its partition; finish() then de-duplicates one
+    partition at a time and yields the remaining unique values.
+    """
+
+    def __init__(self, memory_mb: Optional[int] = None, partitions: Optional[int] = None,
+                 spill_dir: Optional[str] = None, block_rows: int = 50000):
+        memory_mb = memory_mb or int(os.getenv("DEDUP_MEMORY_MB", "256"))
+        self.max_keys = max(1000, memory_mb * 1024 * 1024 // _BYTES_PER_KEY)
+        self.partitions = partitions or int(os.getenv("DEDUP_PARTITIONS", "64"))
+        self.spill_dir = spill_dir or os.getenv("DEDUP_SPILL_DIR") or tempfile.gettempdir()
+        self.block_rows = block_rows
+        self.total = 0
+        self.unique_count = 0
+        self._seen = set()
+        self._tmpdir = None
+        self._files = None
+
+    @property
+    def spilled(self) -> bool:
+        return self._files is not None
+
+    @property
+    def duplicate_count(self) -> int:
+        """Duplicates dropped; only final once finish() is exhausted."""
+        return self.total - self.unique_count
+
+    def add(self, values: List[str], keys: Optional[List[str]] = None) -> Tuple[List[str], List[str]]:
+        """
+        Feeds a block of values (keys default to the values themselves).
+        Returns (values, keys) that are known to be new; after a spill this
+        is empty and the survivors come out of finish().
+        """
+        keys = values if keys is None else keys
+        self.total += len(values)
+        if self.spilled:
+            self._append(keys, values, "0")
+            return [], []
+
+        seen = self._seen
+        fresh_values, fresh_keys = [], []
+        for value, key in zip(values, keys):
+            if key not in seen:
+                seen.add(key)
+                fresh_values.append(value)
+                fresh_keys.append(key)
+        self.unique_count += len(fresh_values)
+        if len(seen) > self.max_keys:
+            self._spill()
+        return fresh_values, fresh_keys
+
+    def finish(self) -> Iterator[Tuple[List[str], List[str]]]:
+        """Yields (values, keys) blocks of the unique values held in spill files."""
+        if not self.spilled:
+            return
+        for f in self._files:
+            f.close()
+        for idx in range(self.partitions):
+            path = self._partition_path(idx)
+            emitted = set()
+            first = {}
+            with open(path, "r") as f:
+                for line in f:
+                    flag, key, value = line.rstrip("\n").split("\t", 2)
+                    if flag == "1":
+                        emitted.add(key)
+                    elif key not in first:
+                        first[key] = value
+            os.remove(path)
+            keys = [k for k in first if k not in emitted]
+            self.unique_count += len(keys)
+            for i in range(0, len(keys), self.block_rows):
+                block_keys = keys[i:i + self.block_rows]
+                yield [first[k] for k in block_keys], block_keys
+        self._files = []
+
+    def close(self):
+        if self._files:
+            for f in self._files:
+                f.close()
+        if self._tmpdir:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+        self._seen = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _partition_path(self, idx: int) -> str:
+        return os.path.join(self._tmpdir, f"part_{idx:04d}.tsv")
+
+    def _spill(self):
+        self._tmpdir = tempfile.mkdtemp(prefix="dedup_", dir=self.spill_dir)
+        self._files = [open(self._partition_path(i), "w") for i in range(self.partitions)]
+        keys = list(self._seen)
+        self._seen = set()
+        self._append(keys, keys, "1")
+        print(f"DEBUG: Dedup memory budget exceeded; spilled {len(keys)} keys to {self._tmpdir}")
+
+    def _append(self, keys, values, flag):
+        files = self._files
+        parts = self.partitions
+        for key, value in zip(keys, values):
+            key = str(key).translate(_SPILL_ESCAPE)
+            files[hash(key) % parts].write(f"{flag}\t{key}\t{str(value).translate(_SPILL_ESCAPE)}\n")
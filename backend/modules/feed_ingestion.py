@@ -0,0 +1,222 @@
+"""
+Bulk ingestion of operator feeds into the exclusion lists.
+
+A feed (the DND register, a subscription snapshot, an unsubscription
+export) is streamed block by block through the upload parsers, cleaned and
+COPYed into a temporary staging table; memory stays bounded by one block.
+One transaction then merges staging into the target list, keyed on the
+canonical MSISDN (the national number, as in ScrubbingEngine.normalize_msisdn)
+so 2348031234567, 08031234567 and 8031234567 are the same subscriber:
+
+    delta    adds numbers not yet listed (subscriptions: also fixes status)
+    replace  additionally removes listed numbers missing from the feed
+             (subscriptions: within the feed's service_id only)
+
+Readers see the old list until the merge commits; the statement triggers
+on the lists then bump their version, record the changes and update the
+counters. Each run is recorded in feed_ingestion_runs.
+
+CLI, from the backend directory:
+
+    python -m modules.feed_ingestion dnd dnd_register.csv.gz --mode replace
+    python -m modules.feed_ingestion sub promo_snapshot.csv --service-id PROMO
+"""
+import io
+import os
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+from .database_module import DatabaseModule
+from .logging_system import logger
+
+FEED_MODES = ("delta", "replace")
+# More memory for the staging sort and the hash anti-joins of the merge
+FEED_WORK_MEM = os.getenv("FEED_WORK_MEM", "256MB")
+
+# SQL twin of ScrubbingEngine.normalize_msisdn for rows already in a list; the
+# lists carry expression indexes on it (migration 15), so keep the two identical
+_CANONICAL = r"regexp_replace(regexp_replace(t.msisdn, '\D', '', 'g'), '^(234)?0?', '')"
+
+
+def _merge_statements(table, mode):
+    """
+    (name, SQL) merge steps for a list (psycopg2 placeholders); all run in one
+    transaction. New rows go in msisdn order, which keeps the list's btree
+    index inserts local.
+    """
+    is_sub = table == "subscriptions"
+    scope = "t.service_id = %(service_id)s AND " if is_sub else ""
+    steps = []
+    if mode == "replace":
+        steps.append(("deleted", f"""
+            DELETE FROM {table} t
+            WHERE {scope}NOT EXISTS (SELECT 1 FROM feed_rows f WHERE f.msisdn_key = {_CANONICAL})
+        """))
+    if is_sub:
+        steps.append(("updated", f"""
+            UPDATE {table} t SET status = %(status)s
+            FROM feed_rows f
+            WHERE {scope}f.msisdn_key = {_CANONICAL} AND t.status IS DISTINCT FROM %(status)s
+        """))
+        steps.append(("inserted", f"""
+            INSERT INTO {table} (msisdn, service_id, status)
+            SELECT f.msisdn, %(service_id)s, %(status)s FROM feed_rows f
+            WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {scope}{_CANONICAL} = f.msisdn_key)
+            ORDER BY f.msisdn
+        """))
+    else:
+        steps.append(("inserted", f"""
+            INSERT INTO {table} (msisdn)
+            SELECT f.msisdn FROM feed_rows f
+            WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {_CANONICAL} = f.msisdn_key)
+            ORDER BY f.msisdn
+        """))
+    return steps
+
+
+def _start_run(db, table, mode, service_id, source, username):
+    with db.engine.connect() as conn:
+        run_id = conn.execute(
+            text("""
+                INSERT INTO feed_ingestion_runs (list_name, mode, service_id, source, username, status)
+                VALUES (:table, :mode, :service_id, :source, :username, 'RUNNING')
+                RETURNING id
+            """),
+            {"table": table, "mode": mode, "service_id": service_id, "source": source, "username": username},
+        ).scalar()
+        conn.commit()
+        return run_id
+
+
+def _finish_run(db, run_id, status, report=None, error_message=None):
+    fields = {k: (report or {}).get(k, 0) for k in ("rows_read", "rows_valid", "rows_unique", "inserted", "updated", "deleted")}
+    with db.engine.connect() as conn:
+        conn.execute(
+            text("""
+                UPDATE feed_ingestion_runs
+                SET status = :status, error_message = :error_message, completed_at = :now,
+                    rows_read = :rows_read, rows_valid = :rows_valid, rows_unique = :rows_unique,
+                    inserted = :inserted, updated = :updated, deleted = :deleted
+                WHERE id = :id
+            """),
+            {**fields, "status": status, "error_message": error_message, "now": datetime.utcnow(), "id": run_id},
+        )
+        conn.commit()
+
+
+def ingest_feed(db, uploads, feed, fileobj, filename, mode="delta", service_id="PROMO", status="ACTIVE", username=None):
+    """
+    Loads a feed file object (.csv / .txt / .xlsx, optionally .gz / .zip, as
+    understood by UploadHandler.iter_blocks) into the exclusion list `feed`
+    (dnd / sub / unsub). Returns the run report. Blocking; call from a
+    worker thread.
+    """
+    table = DatabaseModule.EXCLUSION_TABLES.get(feed)
+    if not table:
+        raise ValueError(f"feed must be one of: {', '.join(DatabaseModule.EXCLUSION_TABLES)}")
+    if mode not in FEED_MODES:
+        raise ValueError(f"mode must be one of: {', '.join(FEED_MODES)}")
+    if table != "subscriptions":
+        service_id = status = None
+
+    run_id = _start_run(db, table, mode, service_id, filename, username)
+    report = {"run_id": run_id, "list": table, "mode": mode, "rows_read": 0, "rows_valid": 0}
+    start = time.perf_counter()
+    try:
+        with db.raw_connection() as raw_conn:
+            cursor = raw_conn.cursor()
+            cursor.execute("SET LOCAL work_mem = %s", (FEED_WORK_MEM,))
+            cursor.execute("CREATE TEMP TABLE feed_staging (msisdn TEXT, msisdn_key TEXT) ON COMMIT DROP")
+            for block in uploads.iter_blocks(fileobj, filename or ""):
+                report["rows_read"] += len(block)
+                valid = uploads.clean_block(block)
+                if valid.empty:
+                    continue
+                keys = valid.str.replace(r'^(?:234)?0?', '', regex=True)
+                # Cleaned values are digits only, so no COPY escaping is needed
+                cursor.copy_expert(
+                    "COPY feed_staging (msisdn, msisdn_key) FROM STDIN",
+                    io.StringIO("\n".join(valid + "\t" + keys) + "\n"),
+                )
+                report["rows_valid"] += len(valid)
+            loaded = time.perf_counter()
+
+            cursor.execute("""
+                CREATE TEMP TABLE feed_rows ON COMMIT DROP AS
+                SELECT DISTINCT ON (msisdn_key) msisdn, msisdn_key FROM feed_staging
+                WHERE msisdn_key <> '' ORDER BY msisdn_key
+            """)
+            report["rows_unique"] = cursor.rowcount
+            if mode == "replace" and not report["rows_unique"]:
+                raise ValueError("Refusing to replace a list with an empty feed")
+            cursor.execute("ANALYZE feed_rows")
+
+            # Serialize merges into the same list; plain reads are not blocked
+            cursor.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+            params = {"service_id": service_id, "status": status}
+            for name, statement in _merge_statements(table, mode):
+                cursor.execute(statement, params)
+                report[name] = cursor.rowcount
+            raw_conn.commit()
+    except Exception as e:
+        _finish_run(db, run_id, "FAILED", report, error_message=str(e))
+        logger.log("backend", "error", f"Feed ingestion {run_id} ({table}, {mode}) failed: {e}", "feed_ingestion")
+        raise
+
+    finished = time.perf_counter()
+    report.update({
+        "status": "COMPLETED",
+        "versions": db.get_exclusion_list_versions([table]),
+        "load_s": round(loaded - start, 3),
+        "merge_s": round(finished - loaded, 3),
+    })
+    _finish_run(db, run_id, "COMPLETED", report)
+    logger.log(
+        "backend",
+        "success",
+        f"Feed ingestion {run_id} into {table} ({mode}): {report['rows_unique']} unique of {report['rows_read']} rows, "
+        f"+{report.get('inserted', 0)} ~{report.get('updated', 0)} -{report.get('deleted', 0)} "
+        f"in {finished - start:.1f}s",
+        "feed_ingestion",
+    )
+    return report
+
+
+def main(argv=None):
+    import argparse
+    from .database_module import get_database
+    from .upload_handler import UploadHandler
+
+    parser = argparse.ArgumentParser(description="Bulk-load an operator feed into an exclusion list.")
+    parser.add_argument("feed", choices=list(DatabaseModule.EXCLUSION_TABLES), help="target list")
+    parser.add_argument("path", help="feed file (.csv/.txt/.xlsx, optionally .gz/.zip); - for stdin")
+    parser.add_argument("--mode", choices=FEED_MODES, default="delta")
+    parser.add_argument("--service-id", default="PROMO", help="subscriptions only")
+    parser.add_argument("--status", default="ACTIVE", help="subscriptions only")
+    parser.add_argument("--format", default=None, help="file name/extension to parse stdin as (e.g. feed.csv.gz)")
+    args = parser.parse_args(argv)
+
+    db = get_database()
+    if not db.engine:
+        print(f"Database unavailable: {db.init_error}")
+        return 1
+    filename = args.format or args.path
+    stream = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+    try:
+        report = ingest_feed(
+            db, UploadHandler(), args.feed, stream, filename,
+            mode=args.mode, service_id=args.service_id, status=args.status, username="cli",
+        )
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
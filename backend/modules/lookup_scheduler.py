@@ -0,0 +1,169 @@
+import os
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, List, Optional, Sequence
+
+# Engine pool sizing shared with DatabaseModule so the scheduler never asks
+# for more connections than a pool can hand out.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
+
+class BatchSizeController:
+    """
+    AIMD batch sizing: grow additively while queries finish under the target
+    latency, halve as soon as one is slower.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, step: int, target_ms: float):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step
+        self.target_ms = target_ms
+        self.last_latency_ms = 0.0
+
+    def observe(self, latency_ms: float, batch_len: int):
+        self.last_latency_ms = latency_ms
+        if latency_ms > self.target_ms:
+            self.size = max(self.minimum, self.size // 2)
+        elif batch_len >= self.size:
+            # Only full batches say anything about whether bigger ones would fit
+            self.size = min(self.maximum, self.size + self.step)
+
+
+class _Lookup:
+    """One caller's lookup: items are sliced lazily as workers pick it."""
+
+    def __init__(self, kind: str, items: Sequence[Any], fn: Callable[[list], Any]):
+        self.kind = kind
+        self.items = items
+        self.fn = fn
+        self.pos = 0
+        self.pending = 0
+        self.results: List[Any] = []
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+    @property
+    def exhausted(self) -> bool:
+        return self.error is not None or self.pos >= len(self.items)
+
+
+class LookupScheduler:
+    """
+    Process-wide executor for chunked DB lookups.
+
+    Concurrency is the configured DB budget (DB_LOOKUP_BUDGET) capped by the
+    engine pool capacity minus a reserve left for the rest of the app. Active
+    lookups are served round-robin, one batch at a time, so a huge scrub does
+    not starve a small concurrent one; batch sizes adapt per lookup kind.
+    """
+
+    def __init__(self, budget: Optional[int] = None, reserve: Optional[int] = None):
+        budget = budget or int(os.getenv("DB_LOOKUP_BUDGET", "8"))
+        reserve = reserve if reserve is not None else int(os.getenv("DB_LOOKUP_RESERVE", "2"))
+        self.concurrency = max(1, min(budget, DB_POOL_SIZE + DB_MAX_OVERFLOW - reserve))
+        self.initial_batch = int(os.getenv("DB_LOOKUP_BATCH", "30000"))
+        self.min_batch = int(os.getenv("DB_LOOKUP_MIN_BATCH", "2000"))
+        self.max_batch = int(os.getenv("DB_LOOKUP_MAX_BATCH", "100000"))
+        self.target_ms = float(os.getenv("DB_LOOKUP_TARGET_MS", "750"))
+        self._cond = threading.Condition()
+        self._active: deque = deque()
+        self._controllers = {}
+        self._workers: List[threading.Thread] = []
+        self._busy = 0
+        self._queries = 0
+
+    def controller(self, kind: str) -> BatchSizeController:
+        with self._cond:
+            if kind not in self._controllers:
+                self._controllers[kind] = BatchSizeController(
+                    self.initial_batch, self.min_batch, self.max_batch,
+                    step=max(1, self.initial_batch // 6), target_ms=self.target_ms,
+                )
+            return self._controllers[kind]
+
+    def map(self, kind: str, items: Sequence[Any], fn: Callable[[list], Any]) -> List[Any]:
+        """
+        Runs fn over consecutive batches of items on the shared workers and
+        returns the per-batch results (in completion order). Blocks the caller.
+        """
+        if not items:
+            return []
+        self.controller(kind)
+        lookup = _Lookup(kind, items, fn)
+        with self._cond:
+            self._ensure_workers()
+            self._active.append(lookup)
+            self._cond.notify_all()
+        lookup.done.wait()
+        if lookup.error is not None:
+            raise lookup.error
+        return lookup.results
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "concurrency": self.concurrency,
+                "busy": self._busy,
+                "active_lookups": len(self._active),
+                "queries": self._queries,
+                "batch_sizes": {
+                    kind: {"size": c.size, "last_latency_ms": round(c.last_latency_ms, 1)}
+                    for kind, c in self._controllers.items()
+                },
+            }
+
+    def _ensure_workers(self):
+        while len(self._workers) < self.concurrency:
+            worker = threading.Thread(
+                target=self._work, name=f"lookup-{len(self._workers)}", daemon=True
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_batch(self):
+        # Caller holds the lock. Round-robin: take the head, rotate it to the back.
+        while not self._active:
+            self._cond.wait()
+        lookup = self._active[0]
+        size = self._controllers[lookup.kind].size
+        batch = lookup.items[lookup.pos:lookup.pos + size]
+        lookup.pos += len(batch)
+        lookup.pending += 1
+        self._active.popleft()
+        if not lookup.exhausted:
+            self._active.append(lookup)
+        return lookup, batch
+
+    def _work(self):
+        while True:
+            with self._cond:
+                lookup, batch = self._next_batch()
+                self._busy += 1
+            start = time.perf_counter()
+            result, error = None, None
+            try:
+                result = lookup.fn(list(batch))
+            except BaseException as e:
+                error = e
+            latency_ms = (time.perf_counter() - start) * 1000
+            with self._cond:
+                self._busy -= 1
+                self._queries += 1
+                self._controllers[lookup.kind].observe(latency_ms, len(batch))
+                lookup.pending -= 1
+                if error is not None and lookup.error is None:
+                    lookup.error = error
+                    if lookup in self._active:
+                        self._active.remove(lookup)
+                elif error is None:
+                    lookup.results.append(result)
+                if lookup.exhausted and lookup.pending == 0:
+                    lookup.done.set()
+
+
+# Shared instance
+lookup_scheduler = LookupScheduler()
@@ -0,0 +1,657 @@
+"""
+Versioned schema migrations.
+
+Every schema change is an entry in MIGRATIONS with a strictly increasing
+version. Applied versions are recorded in schema_migrations; migrate() runs
+the pending ones in order, each in its own transaction, while holding a
+Postgres advisory lock so that concurrent processes (gunicorn workers, the
+scrub worker) never race: the first one applies, the others wait and then
+find nothing left to do.
+
+Run as a deploy step from the backend directory:
+
+    python -m modules.migrations            # apply pending migrations
+    python -m modules.migrations --status   # show applied / pending
+
+Versions in DEPLOY_ONLY_VERSIONS rewrite or index large tables; startup
+auto-migration stops before them and leaves them to the deploy step.
+
+Migrations are append-only. Never edit an applied entry; add a new one.
+"""
+import sys
+from sqlalchemy import text
+
+# Arbitrary but fixed key for pg_advisory_lock
+MIGRATION_LOCK_KEY = 727_000_001
+
+# Exclusion list tables as of the migrations below (kept literal on purpose)
+_EXCLUSION_TABLES = ("dnd_list", "subscriptions", "unsubscriptions")
+# Hash partitions per exclusion list (migration 12)
+_EXCLUSION_PARTITIONS = 16
+# Canonical (national) MSISDN, exactly as modules.feed_ingestion._CANONICAL
+# computes it, so merges can probe the expression indexes of migration 15
+_CANONICAL_MSISDN = r"regexp_replace(regexp_replace(msisdn, '\D', '', 'g'), '^(234)?0?', '')"
+
+
+def _create_trigger(name, definition):
+    """CREATE TRIGGER has no IF NOT EXISTS before PG 14; guard it for baselined databases."""
+    return f"""
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = '{name}') THEN
+            CREATE TRIGGER {name}
+            {definition};
+        END IF;
+    END
+    $$
+    """
+
+
+def _version_triggers():
+    return [
+        _create_trigger(
+            f"trg_{table}_version",
+            f"AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table} "
+            "FOR EACH STATEMENT EXECUTE FUNCTION bump_exclusion_list_version()",
+        )
+        for table in _EXCLUSION_TABLES
+    ]
+
+
+def _change_triggers():
+    events = {
+        "ins": "AFTER INSERT ON {table} REFERENCING NEW TABLE AS new_rows",
+        "upd": "AFTER UPDATE ON {table} REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows",
+        "del": "AFTER DELETE ON {table} REFERENCING OLD TABLE AS old_rows",
+        "trunc": "AFTER TRUNCATE ON {table}",
+    }
+    return [
+        _create_trigger(
+            f"trg_{table}_changes_{suffix}",
+            event.format(table=table) + " FOR EACH STATEMENT EXECUTE FUNCTION log_exclusion_list_changes()",
+        )
+        for table in _EXCLUSION_TABLES
+        for suffix, event in events.items()
+    ]
+
+
+def _counter_triggers():
+    events = {
+        "ins": "AFTER INSERT ON {table} REFERENCING NEW TABLE AS new_rows",
+        "upd": "AFTER UPDATE ON {table} REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows",
+        "del": "AFTER DELETE ON {table} REFERENCING OLD TABLE AS old_rows",
+        "trunc": "AFTER TRUNCATE ON {table}",
+    }
+    return [
+        _create_trigger(
+            f"trg_{table}_counts_{suffix}",
+            event.format(table=table) + " FOR EACH STATEMENT EXECUTE FUNCTION count_exclusion_list_rows()",
+        )
+        for table in _EXCLUSION_TABLES
+        for suffix, event in events.items()
+    ]
+
+
+def _hash_partition(table, indexes):
+    """
+    Rebuilds an exclusion list as PARTITION BY HASH (msisdn): rows are copied
+    into the new partitions, the id sequence moves over, and indexes are
+    built once the data is in. Dropping the old table drops its triggers;
+    the caller recreates them on the partitioned table.
+    """
+    old = f"{table}_unpartitioned"
+    return [
+        f"ALTER TABLE {table} RENAME TO {old}",
+        f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY HASH (msisdn)",
+        *[
+            f"CREATE TABLE {table}_p{r:02d} PARTITION OF {table} "
+            f"FOR VALUES WITH (MODULUS {_EXCLUSION_PARTITIONS}, REMAINDER {r})"
+            for r in range(_EXCLUSION_PARTITIONS)
+        ],
+        f"INSERT INTO {table} SELECT * FROM {old}",
+        f"""
+        DO $$
+        BEGIN
+            EXECUTE format('ALTER SEQUENCE %s OWNED BY {table}.id', pg_get_serial_sequence('{old}', 'id'));
+        END
+        $$
+        """,
+        f"DROP TABLE {old}",
+        # Unique constraints on a partitioned table must include the partition key
+        f"ALTER TABLE {table} ADD PRIMARY KEY (id, msisdn)",
+        *indexes,
+        f"ANALYZE {table}",
+    ]
+
+
+# (version, name, statements). Early entries use IF NOT EXISTS so databases
+# created by the old startup DDL are adopted without changes.
+MIGRATIONS = [
+    (1, "core_tables", [
+        """
+        CREATE TABLE IF NOT EXISTS obdscheduling_details (
+            id SERIAL PRIMARY KEY,
+            obd_name VARCHAR(255) NOT NULL,
+            flow_name VARCHAR(255) NOT NULL,
+            msc_ip VARCHAR(50) NOT NULL,
+            cli VARCHAR(50) NOT NULL,
+            scheduled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS dnd_list (
+            id SERIAL PRIMARY KEY,
+            msisdn VARCHAR(20) UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            id SERIAL PRIMARY KEY,
+            msisdn VARCHAR(20) NOT NULL,
+            service_id VARCHAR(50) NOT NULL,
+            status VARCHAR(20) DEFAULT 'ACTIVE',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS unsubscriptions (
+            id SERIAL PRIMARY KEY,
+            msisdn VARCHAR(20) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS campaign_targets (
+            id SERIAL PRIMARY KEY,
+            msisdn VARCHAR(20) NOT NULL,
+            status VARCHAR(20) DEFAULT 'scheduled',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_details (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_dnd_msisdn ON dnd_list(msisdn)",
+        "CREATE INDEX IF NOT EXISTS idx_subs_msisdn ON subscriptions(msisdn)",
+        "CREATE INDEX IF NOT EXISTS idx_unsubs_msisdn ON unsubscriptions(msisdn)",
+        "CREATE INDEX IF NOT EXISTS idx_camp_msisdn ON campaign_targets(msisdn)",
+        """
+        CREATE TABLE IF NOT EXISTS email_sync_log (
+            id SERIAL PRIMARY KEY,
+            email_uid VARCHAR(255) UNIQUE NOT NULL,
+            filename VARCHAR(255),
+            synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS email_sourced_targets (
+            id SERIAL PRIMARY KEY,
+            msisdn VARCHAR(20) NOT NULL,
+            email_uid VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (2, "history_logs", [
+        """
+        CREATE TABLE IF NOT EXISTS scrub_history_log (
+            id SERIAL PRIMARY KEY,
+            total_input INT,
+            final_count INT,
+            dnd_removed INT,
+            sub_removed INT,
+            unsub_removed INT,
+            operator_removed INT,
+            results_table VARCHAR(255),
+            logged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Older deployments created scrub_history_log without this column
+        "ALTER TABLE scrub_history_log ADD COLUMN IF NOT EXISTS results_table VARCHAR(255)",
+        """
+        CREATE TABLE IF NOT EXISTS upload_history (
+            id SERIAL PRIMARY KEY,
+            account VARCHAR(100) NOT NULL,
+            filename VARCHAR(255),
+            msisdn_count INT DEFAULT 0,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (3, "scrub_jobs", [
+        """
+        CREATE TABLE IF NOT EXISTS scrub_jobs (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(50) NOT NULL,
+            status VARCHAR(20) DEFAULT 'PENDING',
+            operator VARCHAR(50),
+            options_json TEXT,
+            total_input BIGINT DEFAULT 0,
+            final_count BIGINT DEFAULT 0,
+            results_table VARCHAR(255),
+            error_message TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            completed_at TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS scrub_job_inputs (
+            id SERIAL PRIMARY KEY,
+            job_id INTEGER REFERENCES scrub_jobs(id) ON DELETE CASCADE,
+            msisdn VARCHAR(20) NOT NULL
+        )
+        """,
+        # Content-addressed reuse: identical jobs point at the same results
+        "ALTER TABLE scrub_jobs ADD COLUMN IF NOT EXISTS fingerprint VARCHAR(64)",
+        "ALTER TABLE scrub_jobs ADD COLUMN IF NOT EXISTS source_job_id INTEGER",
+        "ALTER TABLE scrub_jobs ADD COLUMN IF NOT EXISTS duplicate_count INTEGER DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS idx_scrub_jobs_fingerprint ON scrub_jobs(fingerprint) WHERE status = 'COMPLETED'",
+    ]),
+    (4, "exclusion_list_versions", [
+        """
+        CREATE TABLE IF NOT EXISTS exclusion_list_versions (
+            list_name VARCHAR(50) PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 1,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE OR REPLACE FUNCTION bump_exclusion_list_version() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO exclusion_list_versions (list_name, version, updated_at)
+            VALUES (TG_TABLE_NAME, 1, CURRENT_TIMESTAMP)
+            ON CONFLICT (list_name) DO UPDATE
+            SET version = exclusion_list_versions.version + 1, updated_at = CURRENT_TIMESTAMP;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        # Any write to an exclusion list (including external SQL) bumps its version
+        *_version_triggers(),
+    ]),
+    (5, "exclusion_list_changes", [
+        # Row-level change log feeding incremental (delta) re-scrubs of saved audiences
+        """
+        CREATE TABLE IF NOT EXISTS exclusion_list_changes (
+            id BIGSERIAL PRIMARY KEY,
+            list_name VARCHAR(50) NOT NULL,
+            msisdn VARCHAR(20) NOT NULL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE OR REPLACE FUNCTION log_exclusion_list_changes() RETURNS trigger AS $$
+        BEGIN
+            -- Shared lock: readers take it exclusively to get a gap-free watermark
+            PERFORM pg_advisory_xact_lock_shared(hashtext('exclusion_list_changes'));
+            IF TG_OP = 'TRUNCATE' THEN
+                INSERT INTO exclusion_list_changes (list_name, msisdn) VALUES (TG_TABLE_NAME, '*');
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO exclusion_list_changes (list_name, msisdn)
+                SELECT TG_TABLE_NAME, msisdn FROM new_rows;
+            END IF;
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                INSERT INTO exclusion_list_changes (list_name, msisdn)
+                SELECT TG_TABLE_NAME, msisdn FROM old_rows;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        *_change_triggers(),
+    ]),
+    (6, "saved_audiences", [
+        """
+        CREATE TABLE IF NOT EXISTS saved_audiences (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(50) NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            operator VARCHAR(50),
+            options_json TEXT,
+            total_input BIGINT DEFAULT 0,
+            final_count BIGINT DEFAULT 0,
+            change_watermark BIGINT DEFAULT 0,
+            results_table VARCHAR(255),
+            last_scrubbed_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS saved_audience_members (
+            audience_id INTEGER NOT NULL REFERENCES saved_audiences(id) ON DELETE CASCADE,
+            msisdn VARCHAR(20) NOT NULL,
+            suffix VARCHAR(8) NOT NULL,
+            operator_ok BOOLEAN DEFAULT TRUE,
+            in_dnd BOOLEAN DEFAULT FALSE,
+            in_sub BOOLEAN DEFAULT FALSE,
+            in_unsub BOOLEAN DEFAULT FALSE,
+            PRIMARY KEY (audience_id, msisdn)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_audience_members_suffix ON saved_audience_members(audience_id, suffix)",
+    ]),
+    (7, "scrub_results_store", [
+        # One row per result set (a scrub run, a re-scrub, an email CSV import)
+        """
+        CREATE TABLE IF NOT EXISTS scrub_result_sets (
+            id BIGSERIAL PRIMARY KEY,
+            job_id INTEGER,
+            source VARCHAR(50) NOT NULL DEFAULT 'scrub',
+            label VARCHAR(255),
+            row_count BIGINT DEFAULT 0,
+            created_on DATE NOT NULL DEFAULT CURRENT_DATE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_result_sets_job ON scrub_result_sets(job_id)",
+        # All result rows in one table, range-partitioned by day so retention
+        # is a partition DROP; partitions are created on demand by the writer.
+        """
+        CREATE TABLE IF NOT EXISTS scrub_results (
+            result_set_id BIGINT NOT NULL,
+            job_id INTEGER,
+            msisdn_key BIGINT NOT NULL,
+            msisdn VARCHAR(20) NOT NULL,
+            created_on DATE NOT NULL DEFAULT CURRENT_DATE
+        ) PARTITION BY RANGE (created_on)
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_scrub_results_set_key ON scrub_results(result_set_id, msisdn_key)",
+    ]),
+    (8, "campaign_launches", [
+        # Server-side campaign launches (results -> obd_d1_* via INSERT ... SELECT)
+        """
+        CREATE TABLE IF NOT EXISTS campaign_launches (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(50),
+            project_name VARCHAR(255) NOT NULL,
+            target_table VARCHAR(255) NOT NULL,
+            source_reference VARCHAR(255) NOT NULL,
+            job_id INTEGER,
+            status VARCHAR(20) DEFAULT 'PENDING',
+            total_rows BIGINT DEFAULT 0,
+            copied_rows BIGINT DEFAULT 0,
+            error_message TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            completed_at TIMESTAMP
+        )
+        """,
+    ]),
+    (9, "exclusion_list_counters", [
+        # Exact row counts kept by statement triggers, so /db-stats never scans.
+        # active_count is the ACTIVE rows of subscriptions (all rows elsewhere).
+        """
+        CREATE TABLE IF NOT EXISTS exclusion_list_counters (
+            list_name VARCHAR(50) PRIMARY KEY,
+            row_count BIGINT NOT NULL DEFAULT 0,
+            active_count BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE OR REPLACE FUNCTION count_exclusion_list_rows() RETURNS trigger AS $$
+        DECLARE
+            added BIGINT := 0;
+            removed BIGINT := 0;
+            active_delta BIGINT := 0;
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                UPDATE exclusion_list_counters
+                SET row_count = 0, active_count = 0, updated_at = CURRENT_TIMESTAMP
+                WHERE list_name = TG_TABLE_NAME;
+                RETURN NULL;
+            END IF;
+            IF TG_OP = 'INSERT' THEN
+                SELECT COUNT(*) INTO added FROM new_rows;
+            ELSIF TG_OP = 'DELETE' THEN
+                SELECT COUNT(*) INTO removed FROM old_rows;
+            END IF;
+            IF TG_TABLE_NAME = 'subscriptions' THEN
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    active_delta := active_delta + (SELECT COUNT(*) FROM new_rows WHERE status = 'ACTIVE');
+                END IF;
+                IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                    active_delta := active_delta - (SELECT COUNT(*) FROM old_rows WHERE status = 'ACTIVE');
+                END IF;
+            ELSE
+                active_delta := added - removed;
+            END IF;
+            IF added <> removed OR active_delta <> 0 THEN
+                UPDATE exclusion_list_counters
+                SET row_count = row_count + added - removed,
+                    active_count = active_count + active_delta,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE list_name = TG_TABLE_NAME;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        # Seed from one exact count; SHARE locks keep writers out until the triggers are live
+        f"LOCK TABLE {', '.join(_EXCLUSION_TABLES)} IN SHARE MODE",
+        """
+        INSERT INTO exclusion_list_counters (list_name, row_count, active_count)
+        SELECT 'dnd_list', COUNT(*), COUNT(*) FROM dnd_list
+        UNION ALL
+        SELECT 'subscriptions', COUNT(*), COUNT(*) FILTER (WHERE status = 'ACTIVE') FROM subscriptions
+        UNION ALL
+        SELECT 'unsubscriptions', COUNT(*), COUNT(*) FROM unsubscriptions
+        ON CONFLICT (list_name) DO UPDATE
+        SET row_count = EXCLUDED.row_count, active_count = EXCLUDED.active_count, updated_at = CURRENT_TIMESTAMP
+        """,
+        *_counter_triggers(),
+    ]),
+    (10, "feed_ingestion_runs", [
+        # One row per bulk feed load into an exclusion list (modules.feed_ingestion)
+        """
+        CREATE TABLE IF NOT EXISTS feed_ingestion_runs (
+            id SERIAL PRIMARY KEY,
+            list_name VARCHAR(50) NOT NULL,
+            mode VARCHAR(20) NOT NULL,
+            service_id VARCHAR(50),
+            source VARCHAR(255),
+            username VARCHAR(50),
+            status VARCHAR(20) DEFAULT 'RUNNING',
+            rows_read BIGINT DEFAULT 0,
+            rows_valid BIGINT DEFAULT 0,
+            rows_unique BIGINT DEFAULT 0,
+            inserted BIGINT DEFAULT 0,
+            updated BIGINT DEFAULT 0,
+            deleted BIGINT DEFAULT 0,
+            error_message TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP
+        )
+        """,
+    ]),
+    (11, "data_migration_checkpoints", [
+        # Resume points of migrate_data.py: last source key copied per table
+        """
+        CREATE TABLE IF NOT EXISTS data_migration_checkpoints (
+            table_name VARCHAR(255) PRIMARY KEY,
+            last_key BIGINT,
+            rows_copied BIGINT DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (12, "partition_exclusion_lists", [
+        # Hash partitions keep each msisdn index small and let a partition be
+        # vacuumed on its own; lookups and writes still go through the parent
+        # (its statement triggers keep versions, changes and counters).
+        *_hash_partition("dnd_list", [
+            # Replaces both the old UNIQUE constraint and idx_dnd_msisdn
+            "ALTER TABLE dnd_list ADD CONSTRAINT dnd_list_msisdn_key UNIQUE (msisdn)",
+        ]),
+        *_hash_partition("subscriptions", [
+            "CREATE INDEX idx_subs_msisdn ON subscriptions(msisdn)",
+            # Scrub lookups: service_id = :service_id AND status = 'ACTIVE' AND msisdn IN (...)
+            "CREATE INDEX idx_subs_active_service ON subscriptions(service_id, msisdn) WHERE status = 'ACTIVE'",
+        ]),
+        *_hash_partition("unsubscriptions", [
+            "CREATE INDEX idx_unsubs_msisdn ON unsubscriptions(msisdn)",
+        ]),
+        *_version_triggers(),
+        *_change_triggers(),
+        *_counter_triggers(),
+    ]),
+    (13, "retention", [
+        # Batched input purges and load_scrub_job_inputs walk a job's rows by id
+        "CREATE INDEX IF NOT EXISTS idx_scrub_job_inputs_job ON scrub_job_inputs(job_id, id)",
+        "ALTER TABLE scrub_jobs ADD COLUMN IF NOT EXISTS inputs_purged_at TIMESTAMP",
+        # Where expired result sets and per-run tables were archived (modules.retention)
+        """
+        CREATE TABLE IF NOT EXISTS retention_archives (
+            reference VARCHAR(255) PRIMARY KEY,
+            path TEXT NOT NULL,
+            row_count BIGINT DEFAULT 0,
+            bytes BIGINT DEFAULT 0,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (14, "result_set_closed_at", [
+        # Set by ScrubResultsWriter only when every block was written; open
+        # (still running) and abandoned (failed) sets are never served whole
+        "ALTER TABLE scrub_result_sets ADD COLUMN IF NOT EXISTS closed_at TIMESTAMP",
+        """
+        UPDATE scrub_result_sets SET closed_at = COALESCE(created_at, CURRENT_TIMESTAMP)
+        WHERE closed_at IS NULL
+          AND (job_id IS NULL OR job_id IN (SELECT id FROM scrub_jobs WHERE status = 'COMPLETED'))
+        """,
+    ]),
+    (15, "exclusion_list_canonical_keys", [
+        # Feed merges match list rows on the canonical key; without these a
+        # 1k-row delta scanned (and ran two regexes over) the whole list
+        *[
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_canonical ON {table} (({_CANONICAL_MSISDN}))"
+            for table in _EXCLUSION_TABLES
+        ],
+        # Expression statistics for the planner's probe-vs-hash choice
+        *[f"ANALYZE {table}" for table in _EXCLUSION_TABLES],
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Copy or index whole exclusion lists under long locks: never applied by a
+# serving process at startup, only by `python -m modules.migrations`
+DEPLOY_ONLY_VERSIONS = {12, 15}
+
+_CREATE_MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def current_version(engine):
+    """Highest applied version, 0 for an unmanaged database. One cheap query."""
+    with engine.connect() as conn:
+        exists = conn.execute(text("SELECT to_regclass('schema_migrations')")).scalar()
+        if not exists:
+            return 0
+        return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar()
+
+
+def is_current(engine):
+    return current_version(engine) >= LATEST_VERSION
+
+
+def migrate(engine, verbose=False, deploy_only=True):
+    """
+    Applies pending migrations under the advisory lock and returns the list
+    of (version, name) applied by this call (empty when already current).
+    With deploy_only=False it stops at the first pending version in
+    DEPLOY_ONLY_VERSIONS, so later migrations never run ahead of it.
+    """
+    applied_now = []
+    with engine.connect() as conn:
+        # Session-level lock: held across the per-migration transactions below
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        conn.commit()
+        try:
+            conn.execute(text(_CREATE_MIGRATIONS_TABLE))
+            conn.commit()
+            applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+            conn.commit()
+            for version, name, statements in MIGRATIONS:
+                if version in applied:
+                    continue
+                if version in DEPLOY_ONLY_VERSIONS and not deploy_only:
+                    print(f"⚠️ Migration {version:04d}_{name} is a deploy step: run `python -m modules.migrations`")
+                    break
+                if verbose:
+                    print(f"Applying migration {version:04d}_{name} ({len(statements)} statements)...")
+                try:
+                    for statement in statements:
+                        conn.execute(text(statement))
+                    conn.execute(
+                        text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                        {"version": version, "name": name},
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                applied_now.append((version, name))
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            conn.commit()
+    return applied_now
+
+
+def status(engine):
+    """Returns [(version, name, applied_at or None)] for every known migration."""
+    applied = {}
+    if current_version(engine):
+        with engine.connect() as conn:
+            applied = {
+                row[0]: row[1]
+                for row in conn.execute(text("SELECT version, applied_at FROM schema_migrations"))
+            }
+    return [(version, name, applied.get(version)) for version, name, _ in MIGRATIONS]
+
+
+def main(argv=None):
+    import os
+    argv = sys.argv[1:] if argv is None else argv
+    # This process applies migrations itself; skip the implicit startup check
+    os.environ["SCHEMA_AUTO_MIGRATE"] = "0"
+    from .database_module import get_database
+
+    db = get_database()
+    if not db.engine:
+        print(f"❌ No database engine: {db.init_error}")
+        return 1
+    if "--status" in argv:
+        for version, name, applied_at in status(db.engine):
+            state = f"applied {applied_at}" if applied_at else "pending"
+            print(f"{version:04d}_{name}: {state}")
+        return 0
+    try:
+        applied = migrate(db.engine, verbose=True)
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        return 1
+    db.ensure_default_users()
+    if applied:
+        print(f"✅ Applied {len(applied)} migration(s); schema at version {LATEST_VERSION}.")
+    else:
+        print(f"✅ Schema already at version {LATEST_VERSION}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
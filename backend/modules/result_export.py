@@ -0,0 +1,174 @@
+"""
+Columnar exports of final scrub bases for the dialer and BI teams.
+
+Each result set can be written once as a compressed Parquet file or an
+Arrow IPC (Feather v2) file with two columns:
+
+    msisdn    int64, international form (234XXXXXXXXXX)
+    operator  dictionary<int8, string> (MTN / Airtel / Glo / 9mobile / null)
+
+Rows come from the result set's server-side cursor, already ordered by
+number, so the sorted int64 column delta-encodes to a few bytes per row.
+Both formats open with memory mapping:
+
+    pq.read_table(path, memory_map=True)
+    pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+Set EXPORT_ARROW_COMPRESSION=none for zero-copy Arrow files.
+"""
+import os
+import threading
+
+from sqlalchemy import text
+
+from .database_module import parse_result_set_reference, result_set_query
+from .scrubbing_engine import OPERATOR_SERIES
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # optional: exports are unavailable without pyarrow
+    pa = None
+    pc = None
+    pq = None
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "/tmp/obd_exports")
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "500000"))
+EXPORT_ARROW_COMPRESSION = os.getenv("EXPORT_ARROW_COMPRESSION", "zstd")
+# Formats the worker writes as soon as a job completes (others are built on first download)
+EXPORT_FORMATS = [f for f in os.getenv("RESULT_EXPORT_FORMATS", "parquet").split(",") if f]
+
+EXPORT_EXTENSIONS = {"parquet": "parquet", "arrow": "arrow"}
+EXPORT_MEDIA_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+OPERATORS = list(OPERATOR_SERIES)
+# National prefix without the trunk zero ("803") -> index into OPERATORS
+_PREFIX_OPERATOR = {}
+for _index, _name in enumerate(OPERATORS):
+    for _prefix in OPERATOR_SERIES[_name]:
+        _PREFIX_OPERATOR.setdefault(_prefix[1:], _index)
+
+
+def available() -> bool:
+    return pa is not None
+
+
+def export_schema():
+    return pa.schema([
+        ("msisdn", pa.int64()),
+        ("operator", pa.dictionary(pa.int8(), pa.string())),
+    ])
+
+
+def export_path(reference, fmt="parquet"):
+    """Location of a result set's export; raises ValueError for unknown formats or references."""
+    if fmt not in EXPORT_EXTENSIONS:
+        raise ValueError(f"format must be one of: {', '.join(EXPORT_EXTENSIONS)}")
+    result_set_query(reference)
+    return os.path.join(EXPORT_DIR, f"{reference}.{EXPORT_EXTENSIONS[fmt]}")
+
+
+def to_record_batch(msisdns):
+    """
+    Vectorized: MSISDN strings -> (int64 international number, operator).
+    Values that do not reduce to a national number give null rows.
+    """
+    values = pa.array(msisdns, type=pa.string())
+    digits = pc.replace_substring_regex(values, r"\D", "")
+    national = pc.replace_substring_regex(digits, r"^(?:234)?0?", "")
+    length = pc.utf8_length(national)
+    valid = pc.and_(pc.greater(length, 0), pc.less_equal(length, 15))
+    national = pc.if_else(valid, national, pa.scalar(None, pa.string()))
+    number = pc.cast(pc.binary_join_element_wise("234", national, ""), pa.int64())
+
+    prefixes = pa.array(list(_PREFIX_OPERATOR), type=pa.string())
+    prefix_index = pc.index_in(pc.utf8_slice_codeunits(national, 0, 3), value_set=prefixes)
+    operator_index = pc.take(pa.array(list(_PREFIX_OPERATOR.values()), type=pa.int8()), prefix_index)
+    operator = pa.DictionaryArray.from_arrays(operator_index, pa.array(OPERATORS, type=pa.string()))
+    return pa.RecordBatch.from_arrays([number, operator], schema=export_schema())
+
+
+def write_export(blocks, path, fmt="parquet"):
+    """
+    Writes blocks of MSISDN strings to path (atomically, via a temp file).
+    Returns the number of rows written.
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed; columnar exports are unavailable")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    schema = export_schema()
+    rows = 0
+    try:
+        if fmt == "parquet":
+            writer = pq.ParquetWriter(
+                tmp_path, schema,
+                compression="zstd",
+                use_dictionary=["operator"],
+                column_encoding={"msisdn": "DELTA_BINARY_PACKED"},
+            )
+        else:
+            compression = None if EXPORT_ARROW_COMPRESSION in ("", "none") else EXPORT_ARROW_COMPRESSION
+            writer = pa.ipc.new_file(tmp_path, schema, options=pa.ipc.IpcWriteOptions(compression=compression))
+        with writer:
+            for block in blocks:
+                if not block:
+                    continue
+                batch = to_record_batch(block)
+                if fmt == "parquet":
+                    writer.write_batch(batch, row_group_size=len(block))
+                else:
+                    writer.write_batch(batch)
+                rows += len(block)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return rows
+
+
+def closed_row_count(db, reference):
+    """
+    Row count of a closed result set; None while it is still being written
+    or if its writer failed. Legacy per-run tables are written in one go and
+    count as closed (-1: no recorded count).
+    """
+    result_set_id = parse_result_set_reference(reference)
+    if result_set_id is None:
+        return -1
+    with db.engine.connect() as conn:
+        row = conn.execute(
+            text("SELECT row_count, closed_at FROM scrub_result_sets WHERE id = :id"), {"id": result_set_id}
+        ).first()
+    if not row:
+        raise ValueError(f"Unknown result set: {reference}")
+    return row[0] if row[1] is not None else None
+
+
+def export_result_set(db, reference, fmt="parquet"):
+    """
+    (Re)writes the export of a closed result set from the database; returns
+    {path, rows, bytes}. An export that does not match the recorded row count
+    is removed rather than cached.
+    """
+    expected = closed_row_count(db, reference)
+    if expected is None:
+        raise ValueError(f"Result set {reference} is incomplete (still running or failed)")
+    path = export_path(reference, fmt)
+    rows = write_export(db.iter_result_set(reference, batch_rows=EXPORT_BATCH_ROWS), path, fmt)
+    if expected >= 0 and rows != expected:
+        os.remove(path)
+        raise RuntimeError(f"Export of {reference} has {rows} rows, expected {expected}")
+    return {"format": fmt, "path": path, "rows": rows, "bytes": os.path.getsize(path)}
+
+
+def ensure_export(db, reference, fmt="parquet"):
+    """Path of a result set's export, building it on first use. Closed result sets never change."""
+    path = export_path(reference, fmt)
+    if not os.path.exists(path):
+        export_result_set(db, reference, fmt)
+    return path
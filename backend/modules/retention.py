@@ -0,0 +1,338 @@
+"""
+Retention and compaction of scrub artefacts.
+
+Four policies, each in small batches / short transactions so hot tables
+are never locked for long:
+
+    inputs   scrub_job_inputs rows of jobs finished more than
+             RETENTION_INPUT_DAYS ago are deleted RETENTION_BATCH_ROWS at a
+             time, then the table is VACUUMed so the space is reused.
+    results  result sets older than RETENTION_RESULT_DAYS are archived to a
+             compressed file (Parquet via result_export, gzip CSV without
+             pyarrow) and their day partitions dropped.
+    legacy   per-run scrub_results_YYYYMMDD_HHMMSS / email_csv_* tables older
+             than RETENTION_LEGACY_DAYS are archived the same way and dropped.
+    changes  exclusion_list_changes rows no saved audience still needs (at or
+             below the lowest audience watermark, all of them without
+             audiences) and older than RETENTION_CHANGES_SETTLE_HOURS are
+             deleted RETENTION_BATCH_ROWS at a time, then VACUUMed.
+
+Expired references lose their job fingerprints so they are never handed
+out for reuse again; archive locations are kept in retention_archives,
+where the results endpoints look them up to answer 410 Gone instead of an
+empty result.
+Every run returns (and logs) a report including the bytes reclaimed.
+
+Run as a separate process from the backend directory:
+
+    python -m modules.retention             # every RETENTION_INTERVAL seconds
+    python -m modules.retention --once --dry-run
+"""
+import os
+import re
+import sys
+import gzip
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+from .database_module import get_database, result_set_reference
+from .logging_system import logger
+from . import result_export
+
+RETENTION_INPUT_DAYS = int(os.getenv("RETENTION_INPUT_DAYS", "7"))
+RETENTION_RESULT_DAYS = int(os.getenv("RETENTION_RESULT_DAYS", "30"))
+RETENTION_LEGACY_DAYS = int(os.getenv("RETENTION_LEGACY_DAYS", str(RETENTION_RESULT_DAYS)))
+# Longer than any saved-audience creation: its delta starts at a watermark read before its row exists
+RETENTION_CHANGES_SETTLE_HOURS = int(os.getenv("RETENTION_CHANGES_SETTLE_HOURS", "24"))
+RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "/tmp/obd_archive")
+RETENTION_BATCH_ROWS = int(os.getenv("RETENTION_BATCH_ROWS", "20000"))
+# Breather between delete batches so autovacuum and live writers keep up
+RETENTION_BATCH_PAUSE = float(os.getenv("RETENTION_BATCH_PAUSE", "0.05"))
+RETENTION_LOCK_TIMEOUT = os.getenv("RETENTION_LOCK_TIMEOUT", "5s")
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", "3600"))
+
+# Arbitrary but fixed key: one retention run at a time across processes
+RETENTION_LOCK_KEY = 727_000_002
+
+_LEGACY_TABLE = re.compile(r"(scrub_results|email_csv)_(\d{8})_(\d{6})")
+
+
+def _cutoff(days):
+    return datetime.utcnow() - timedelta(days=int(days))
+
+
+def _row_bytes(conn, table):
+    """Average on-disk row size, to turn deleted rows into an estimate of bytes freed."""
+    size, tuples = conn.execute(
+        text("SELECT pg_total_relation_size(oid), reltuples FROM pg_class WHERE oid = CAST(:table AS regclass)"),
+        {"table": table},
+    ).first()
+    if tuples <= 0:  # never analyzed
+        tuples = conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+    return size / tuples if tuples else 0
+
+
+# --- job inputs ---
+
+def purge_job_inputs(db, days=RETENTION_INPUT_DAYS, dry_run=False):
+    """Deletes the stored inputs of jobs finished more than `days` ago, batch by batch."""
+    report = {"jobs": 0, "rows": 0, "bytes_estimate": 0}
+    with db.engine.connect() as conn:
+        jobs = conn.execute(
+            text("""
+                SELECT id, total_input FROM scrub_jobs
+                WHERE status IN ('COMPLETED', 'FAILED') AND inputs_purged_at IS NULL
+                  AND completed_at < :cutoff
+                ORDER BY id
+            """),
+            {"cutoff": _cutoff(days)},
+        ).fetchall()
+        row_bytes = _row_bytes(conn, "scrub_job_inputs")
+
+        delete_batch = text("""
+            DELETE FROM scrub_job_inputs WHERE id IN (
+                SELECT id FROM scrub_job_inputs WHERE job_id = :job_id ORDER BY id LIMIT :limit
+            )
+        """)
+        for job_id, total_input in jobs:
+            report["jobs"] += 1
+            if dry_run:
+                report["rows"] += int(total_input or 0)
+                continue
+            while True:
+                deleted = conn.execute(delete_batch, {"job_id": job_id, "limit": RETENTION_BATCH_ROWS}).rowcount
+                conn.commit()
+                report["rows"] += deleted
+                if deleted < RETENTION_BATCH_ROWS:
+                    break
+                time.sleep(RETENTION_BATCH_PAUSE)
+            conn.execute(
+                text("UPDATE scrub_jobs SET inputs_purged_at = :now WHERE id = :id"),
+                {"now": datetime.utcnow(), "id": job_id},
+            )
+            conn.commit()
+    report["bytes_estimate"] = int(report["rows"] * row_bytes)
+
+    if report["rows"] and not dry_run:
+        # Plain VACUUM: no exclusive lock, makes the freed pages reusable
+        with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM scrub_job_inputs"))
+    return report
+
+
+# --- archives ---
+
+def archive_reference(db, reference):
+    """
+    Writes a results reference (result set or legacy table) to a compressed
+    file in RETENTION_ARCHIVE_DIR and records it. An existing Parquet export
+    is moved there instead of being rebuilt. Returns (path, rows, bytes).
+    """
+    with db.engine.connect() as conn:
+        row = conn.execute(
+            text("SELECT path, row_count, bytes FROM retention_archives WHERE reference = :ref"), {"ref": reference}
+        ).first()
+    if row and os.path.exists(row[0]):
+        return row[0], row[1], row[2]
+
+    os.makedirs(RETENTION_ARCHIVE_DIR, exist_ok=True)
+    if result_export.available():
+        path = os.path.join(RETENTION_ARCHIVE_DIR, f"{reference}.parquet")
+        export = result_export.export_path(reference, "parquet")
+        if os.path.exists(export):
+            os.replace(export, path)
+            rows = None
+        else:
+            rows = result_export.write_export(db.iter_result_set(reference), path, "parquet")
+    else:
+        path = os.path.join(RETENTION_ARCHIVE_DIR, f"{reference}.csv.gz")
+        rows = 0
+        with gzip.open(f"{path}.tmp", "wt", compresslevel=6) as f:
+            f.write("msisdn\n")
+            for block in db.iter_result_set(reference):
+                f.write("\n".join(block) + "\n")
+                rows += len(block)
+        os.replace(f"{path}.tmp", path)
+    if rows is None:
+        import pyarrow.parquet as pq
+        rows = pq.ParquetFile(path).metadata.num_rows
+    size = os.path.getsize(path)
+
+    with db.engine.connect() as conn:
+        conn.execute(
+            text("""
+                INSERT INTO retention_archives (reference, path, row_count, bytes)
+                VALUES (:ref, :path, :rows, :bytes)
+                ON CONFLICT (reference) DO UPDATE
+                SET path = EXCLUDED.path, row_count = EXCLUDED.row_count, bytes = EXCLUDED.bytes, archived_at = CURRENT_TIMESTAMP
+            """),
+            {"ref": reference, "path": path, "rows": rows, "bytes": size},
+        )
+        conn.commit()
+    return path, rows, size
+
+
+def _retire_references(db, references):
+    """Expired results must not be reused by fingerprint, and their exports go with them."""
+    if not references:
+        return
+    with db.engine.connect() as conn:
+        conn.execute(
+            text("UPDATE scrub_jobs SET fingerprint = NULL WHERE results_table = ANY(:refs)"),
+            {"refs": list(references)},
+        )
+        conn.commit()
+    for reference in references:
+        for fmt in result_export.EXPORT_EXTENSIONS:
+            path = result_export.export_path(reference, fmt)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# --- result sets ---
+
+def expire_result_sets(db, days=RETENTION_RESULT_DAYS, dry_run=False):
+    """Archives result sets older than `days`, then drops their day partitions."""
+    cutoff = date.today() - timedelta(days=int(days))
+    report = {"result_sets": 0, "partitions": [], "archived_bytes": 0, "bytes": 0}
+    expired = [p for p in db.list_result_partitions() if p[1] < cutoff]
+    report["bytes"] = sum(size for _, _, size in expired)
+    with db.engine.connect() as conn:
+        set_ids = conn.execute(
+            text("SELECT id FROM scrub_result_sets WHERE created_on < :cutoff ORDER BY id"), {"cutoff": cutoff}
+        ).scalars().all()
+    references = [result_set_reference(set_id) for set_id in set_ids]
+    report["result_sets"] = len(references)
+    if dry_run:
+        report["partitions"] = [name for name, _, _ in expired]
+        return report
+
+    for reference in references:
+        report["archived_bytes"] += archive_reference(db, reference)[2]
+    _retire_references(db, references)
+    report["partitions"] = db.drop_result_partitions(days, lock_timeout=RETENTION_LOCK_TIMEOUT)
+    dropped = set(report["partitions"])
+    report["bytes"] = sum(size for name, _, size in expired if name in dropped)
+    return report
+
+
+# --- legacy per-run tables ---
+
+def expire_legacy_tables(db, days=RETENTION_LEGACY_DAYS, dry_run=False):
+    """Archives and drops per-run scrub_results_* / email_csv_* tables older than `days`."""
+    cutoff = _cutoff(days)
+    report = {"tables": [], "archived_bytes": 0, "bytes": 0}
+    with db.engine.connect() as conn:
+        tables = conn.execute(text("""
+            SELECT c.relname, pg_total_relation_size(c.oid) FROM pg_class c
+            WHERE c.relkind = 'r' AND c.relnamespace = current_schema()::regnamespace
+              AND (c.relname LIKE 'scrub\\_results\\_%' OR c.relname LIKE 'email\\_csv\\_%')
+        """)).fetchall()
+    for name, size in sorted(tables):
+        match = _LEGACY_TABLE.fullmatch(name)
+        if not match or datetime.strptime(match.group(2) + match.group(3), "%Y%m%d%H%M%S") >= cutoff:
+            continue
+        if dry_run:
+            report["tables"].append(name)
+            report["bytes"] += int(size)
+            continue
+        report["archived_bytes"] += archive_reference(db, name)[2]
+        _retire_references(db, [name])
+        try:
+            with db.engine.connect() as conn:
+                conn.execute(text("SELECT set_config('lock_timeout', :timeout, true)"), {"timeout": RETENTION_LOCK_TIMEOUT})
+                conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                conn.commit()
+        except Exception as e:
+            # Busy table: it stays archived and is dropped on a later run
+            print(f"Retention: could not drop {name}: {e}")
+            continue
+        report["tables"].append(name)
+        report["bytes"] += int(size)
+    return report
+
+
+# --- exclusion change log ---
+
+def compact_exclusion_changes(db, settle_hours=RETENTION_CHANGES_SETTLE_HOURS, dry_run=False):
+    """Deletes exclusion_list_changes rows below every saved-audience watermark (see DatabaseModule)."""
+    with db.engine.connect() as conn:
+        row_bytes = _row_bytes(conn, "exclusion_list_changes")
+    report = db.compact_exclusion_changes(
+        datetime.utcnow() - timedelta(hours=int(settle_hours)),
+        batch_rows=RETENTION_BATCH_ROWS,
+        pause=RETENTION_BATCH_PAUSE,
+        dry_run=dry_run,
+    )
+    report["bytes_estimate"] = int(report["rows"] * row_bytes)
+
+    if report["rows"] and not dry_run:
+        with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM exclusion_list_changes"))
+    return report
+
+
+# --- runs ---
+
+def run_retention(db=None, dry_run=False):
+    """One pass over every policy. Returns the report; None if another process holds the run lock."""
+    db = db or get_database()
+    start = time.perf_counter()
+    with db.engine.connect() as lock_conn:
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": RETENTION_LOCK_KEY}).scalar():
+            return None
+        try:
+            report = {"dry_run": dry_run}
+            for name, policy in (
+                ("inputs", purge_job_inputs),
+                ("results", expire_result_sets),
+                ("legacy", expire_legacy_tables),
+                ("changes", compact_exclusion_changes),
+            ):
+                try:
+                    report[name] = policy(db, dry_run=dry_run)
+                except Exception as e:
+                    report[name] = {"error": str(e)}
+                    logger.log("backend", "error", f"Retention {name} policy failed: {e}", "retention")
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": RETENTION_LOCK_KEY})
+            lock_conn.commit()
+
+    report["bytes_reclaimed"] = (
+        report["inputs"].get("bytes_estimate", 0) + report["results"].get("bytes", 0) + report["legacy"].get("bytes", 0)
+        + report["changes"].get("bytes_estimate", 0)
+    )
+    report["archived_bytes"] = report["results"].get("archived_bytes", 0) + report["legacy"].get("archived_bytes", 0)
+    report["duration_s"] = round(time.perf_counter() - start, 3)
+    logger.log(
+        "backend",
+        "info" if dry_run else "success",
+        f"Retention{' (dry run)' if dry_run else ''}: "
+        f"{report['inputs'].get('rows', 0)} input rows of {report['inputs'].get('jobs', 0)} jobs, "
+        f"{report['results'].get('result_sets', 0)} result sets, {len(report['legacy'].get('tables', []))} legacy tables, "
+        f"{report['changes'].get('rows', 0)} exclusion change rows; "
+        f"{report['bytes_reclaimed'] / 1e6:.1f} MB reclaimed, {report['archived_bytes'] / 1e6:.1f} MB archived",
+        "retention",
+    )
+    return report
+
+
+def run_forever(interval: int = RETENTION_INTERVAL):
+    logger.log("backend", "info", "Retention service started", "retention")
+    db = get_database()
+    while True:
+        try:
+            run_retention(db)
+        except Exception as e:
+            logger.log("backend", "error", f"Retention run failed: {e}", "retention")
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    if "--once" in sys.argv[1:]:
+        result = run_retention(dry_run="--dry-run" in sys.argv[1:])
+        print(result if result is not None else "Another retention run is in progress.")
+    else:
+        run_forever()
@@ -0,0 +1,208 @@
+"""
+Scrub job submission helpers shared by the API endpoints.
+Jobs are persisted in scrub_jobs / scrub_job_inputs and handed to the
+scrub worker through a lightweight queue kept in CacheEngine.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache_engine import cache_engine, UnorderedDigest
+from .database_module import ScrubJobInputWriter, ScrubResultsWriter
+from .dedup import SpillingDeduplicator
+from .logging_system import logger
+
+SCRUB_QUEUE_KEY = "scrub_jobs_queue"
+
+
+def enqueue_scrub_job(job_id: int):
+    """Appends a job id to the worker queue."""
+    try:
+        existing = cache_engine.get(SCRUB_QUEUE_KEY) or []
+        existing.append(job_id)
+        cache_engine.set(SCRUB_QUEUE_KEY, existing, expire=None)
+    except Exception as qe:
+        print(f"Queue Enqueue Warning: {qe}")
+
+
+def submit_scrub_job_stream(db, engine, username, blocks, operator=None, options=None):
+    """
+    Creates a scrub job from an iterable of MSISDN blocks without ever holding
+    the whole base: blocks are de-duplicated on their normalized form (spilling
+    to disk past the memory budget) and written straight into scrub_job_inputs
+    while an incremental fingerprint is built. If an identical job already
+    completed, the new job is finished on its results and the inputs dropped.
+    Blocking; call from a worker thread.
+    """
+    job_id = db.create_scrub_job(username=username, total_input=0, operator=operator, options=options or {})
+    if not job_id:
+        raise RuntimeError(db.last_error or "Failed to create scrub job")
+
+    digest = UnorderedDigest()
+    preview = []
+
+    def emit(writer, unique, keys):
+        if not unique:
+            return
+        writer.write(unique)
+        digest.update([k for k in keys if k])
+        if len(preview) < 10:
+            preview.extend(unique[:10 - len(preview)])
+
+    try:
+        with ScrubJobInputWriter(db, job_id) as writer, SpillingDeduplicator() as dedup:
+            for block in blocks:
+                if not block:
+                    continue
+                keys = [engine.normalize_msisdn(m) or m for m in block]
+                emit(writer, *dedup.add(block, keys))
+            for unique, keys in dedup.finish():
+                emit(writer, unique, keys)
+            total = writer.count
+            duplicates = dedup.duplicate_count
+    except Exception as e:
+        db.update_scrub_job_status(job_id, status="FAILED", error_message=f"Failed to persist job inputs: {e}")
+        raise
+
+    if not total:
+        db.update_scrub_job_status(job_id, status="FAILED", error_message="Empty MSISDN list")
+        raise ValueError("Empty MSISDN list")
+
+    fingerprint = engine.fingerprint_digest(digest, operator, options)
+    previous = db.find_completed_scrub_job(fingerprint)
+    response = {"job_id": job_id, "total_input": total, "duplicate_count": duplicates, "preview": preview}
+    if previous:
+        db.update_scrub_job_status(
+            job_id,
+            status="COMPLETED",
+            total_input=total,
+            duplicate_count=duplicates,
+            final_count=previous.get("final_count") or 0,
+            results_table=previous.get("results_table"),
+            fingerprint=fingerprint,
+            source_job_id=previous.get("source_job_id") or previous["id"],
+            mark_started=True,
+        )
+        db.delete_scrub_job_inputs(job_id)
+        logger.log("backend", "success", f"Scrub job {job_id} reused results of job {previous['id']}", "scrub")
+        response.update({
+            "status": "COMPLETED",
+            "final_count": previous.get("final_count"),
+            "results_table": previous.get("results_table"),
+            "reused_from": previous.get("source_job_id") or previous["id"],
+        })
+        return response
+
+    db.update_scrub_job_status(
+        job_id, status="PENDING", total_input=total, duplicate_count=duplicates, fingerprint=fingerprint
+    )
+    enqueue_scrub_job(job_id)
+    logger.log("backend", "info", f"Scrub job {job_id} created for user {username} with {total} records ({duplicates} duplicates removed)", "scrub")
+    response["status"] = "QUEUED"
+    return response
+
+
+def run_streaming_scrub_job(db, engine, uploads, username, fileobj, filename, operator=None, options=None):
+    """
+    Scrub-while-uploading. fileobj (typically a BodyPipe fed by the request
+    body) is parsed block by block; each block is cleaned, de-duplicated,
+    recorded as job input and scrubbed right away on a second thread while
+    the next block is parsed. Survivors are appended to the job's results
+    table as they are found, so the job completes shortly after the last
+    byte arrives without going through the queue and worker.
+    Blocking; call from a worker thread.
+    """
+    options = engine.resolve_options(options)
+    job_id = db.create_scrub_job(username=username, total_input=0, operator=operator, options=options)
+    if not job_id:
+        raise RuntimeError(db.last_error or "Failed to create scrub job")
+
+    start = time.perf_counter()
+    versions = engine.exclusion_versions(options)
+    digest = UnorderedDigest()
+    report = {
+        "raw_count": 0, "invalid_count": 0,
+        "operator_removed": 0, "dnd_removed": 0, "sub_removed": 0, "unsub_removed": 0,
+    }
+    try:
+        with ScrubJobInputWriter(db, job_id) as inputs, \
+                ScrubResultsWriter(db, job_id) as results, \
+                SpillingDeduplicator(block_rows=uploads.block_rows) as dedup, \
+                ThreadPoolExecutor(max_workers=1) as scrubber:
+            db.update_scrub_job_status(job_id, status="RUNNING", results_table=results.reference, mark_started=True)
+            pending = None
+
+            def scrub(unique, keys):
+                survivors, stats = engine.scrub_block(unique, operator, options, normalized=keys)
+                results.write(survivors)
+                for key, removed in stats.items():
+                    report[key] += removed
+                # Progress for pollers of /scrub-jobs
+                db.update_scrub_job_status(job_id, status="RUNNING", total_input=inputs.count, final_count=results.count)
+
+            def submit(unique, keys):
+                nonlocal pending
+                if not unique:
+                    return
+                inputs.write(unique)
+                digest.update([k for k in keys if k])
+                if pending:
+                    pending.result()
+                pending = scrubber.submit(scrub, unique, keys)
+
+            for block in uploads.iter_blocks(fileobj, filename or ""):
+                report["raw_count"] += len(block)
+                valid = uploads.clean_block(block)
+                report["invalid_count"] += len(block) - len(valid)
+                valid = valid.drop_duplicates()
+                # Cleaned values are 7+ digits, so normalized keys are never empty
+                submit(*dedup.add(valid.tolist(), engine.normalize_series(valid).tolist()))
+            received = time.perf_counter()
+            # Values held back after a dedup spill to disk
+            for unique, keys in dedup.finish():
+                submit(unique, keys)
+            if pending:
+                pending.result()
+            total = inputs.count
+            final_count = results.count
+            results_table = results.reference
+    except Exception as e:
+        db.update_scrub_job_status(job_id, status="FAILED", error_message=f"Streaming scrub failed: {e}")
+        raise
+
+    if not total:
+        db.update_scrub_job_status(job_id, status="FAILED", error_message="Empty MSISDN list")
+        raise ValueError("Empty MSISDN list")
+
+    # Only claim the results for the list versions they were computed against
+    fingerprint = None
+    if engine.exclusion_versions(options) == versions:
+        fingerprint = engine.fingerprint_digest(digest, operator, options, versions=versions)
+    duplicates = report["raw_count"] - report["invalid_count"] - total
+    db.update_scrub_job_status(
+        job_id,
+        status="COMPLETED",
+        total_input=total,
+        duplicate_count=duplicates,
+        final_count=final_count,
+        results_table=results_table,
+        fingerprint=fingerprint,
+    )
+    finished = time.perf_counter()
+    logger.log(
+        "backend",
+        "success",
+        f"Streaming scrub job {job_id} completed {finished - received:.2f}s after upload end. "
+        f"Final count: {final_count}/{total} (table: {results_table})",
+        "scrub",
+    )
+    report.update({
+        "job_id": job_id,
+        "status": "COMPLETED",
+        "total_input": total,
+        "duplicate_count": duplicates,
+        "final_count": final_count,
+        "results_table": results_table,
+        "duration_s": round(finished - start, 3),
+        "after_upload_s": round(finished - received, 3),
+    })
+    return report
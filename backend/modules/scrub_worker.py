@@ -2,10 +2,11 @@ import time
 import os
 from typing import Optional
 
-from .database_module import DatabaseModule
+from .database_module import get_database
 from .scrubbing_engine import ScrubbingEngine
 from .cache_engine import cache_engine
 from .logging_system import logger
+from . import result_export
 
 
 def _pop_next_job_id() -> Optional[int]:
@@ -14,7 +15,8 @@ def _pop_next_job_id() -> Optional[int]:
     Prefer Redis list semantics when available via CacheEngine,
     but fall back to an in-memory list stored in cache.
     """
-    queue_key = "scrub_jobs_queue"
+    from .scrub_jobs import SCRUB_QUEUE_KEY
+    queue_key = SCRUB_QUEUE_KEY
     try:
         queue = cache_engine.get(queue_key) or []
         if not queue:
@@ -27,16 +29,19 @@ def _pop_next_job_id() -> Optional[int]:
         return None
 
 
-def process_job(job_id: int):
+def process_job(job_id: int, db=None, engine=None):
     """
     Processes a single scrub job:
     - Loads MSISDN inputs in chunks
     - Runs ScrubbingEngine.perform_full_scrub
     - Persists results via DatabaseModule.save_verified_scrub_results
+    - Writes the columnar export(s) of the final base (result_export)
     - Updates job status and metrics
+    The worker loop passes its long-lived db/engine so jobs reuse the
+    process-wide connection pool.
     """
-    db = DatabaseModule()
-    engine = ScrubbingEngine()
+    db = db or get_database()
+    engine = engine or ScrubbingEngine(db=db)
 
     job = db.get_scrub_job(job_id)
     if not job:
@@ -58,6 +63,28 @@ def process_job(job_id: int):
 
         options = json.loads(job.get("options_json") or "{}")
 
+        # Content-addressed reuse: an identical job may have completed while
+        # this one was queued. Versions are read now, just before scrubbing.
+        versions = engine.exclusion_versions(options)
+        fingerprint = engine.fingerprint_job(all_msisdns, target_operator=operator, options=options, versions=versions)
+        previous = db.find_completed_scrub_job(fingerprint)
+        if previous and previous["id"] != job_id:
+            db.update_scrub_job_status(
+                job_id,
+                status="COMPLETED",
+                final_count=previous.get("final_count") or 0,
+                results_table=previous.get("results_table"),
+                fingerprint=fingerprint,
+                source_job_id=previous.get("source_job_id") or previous["id"],
+            )
+            logger.log(
+                "backend",
+                "success",
+                f"Scrub job {job_id} reused results of job {previous['id']} (table: {previous.get('results_table')})",
+                "scrub_worker",
+            )
+            return
+
         # Run full scrub (async method invoked via asyncio.run)
         import asyncio
 
@@ -69,15 +96,21 @@ def process_job(job_id: int):
         loop.close()
 
         # Persist results
-        save_ok, table_name = db.save_verified_scrub_results(final_base)
+        save_ok, table_name = db.save_verified_scrub_results(final_base, job_id=job_id)
         if not save_ok:
             raise RuntimeError(f"Failed to save scrub results: {table_name}")
 
+        # Only claim the results for the list versions they were computed
+        # against; a list changed mid-run leaves the job unfingerprinted
+        if engine.exclusion_versions(options) != versions:
+            fingerprint = None
         db.update_scrub_job_status(
             job_id,
             status="COMPLETED",
             final_count=len(final_base),
             results_table=table_name,
+            fingerprint=fingerprint,
+            clear_fingerprint=fingerprint is None,
         )
         logger.log(
             "backend",
@@ -85,6 +118,7 @@ def process_job(job_id: int):
             f"Scrub job {job_id} completed. Final count: {len(final_base)} (table: {table_name})",
             "scrub_worker",
         )
+        _write_exports(db, job_id, table_name)
     except Exception as e:
         err_msg = str(e)
         logger.log(
@@ -100,6 +134,23 @@ def process_job(job_id: int):
         )
 
 
+def _write_exports(db, job_id: int, reference: str):
+    """Columnar exports are a convenience: failures are logged, the job stays COMPLETED."""
+    if not result_export.available():
+        return
+    for fmt in result_export.EXPORT_FORMATS:
+        try:
+            export = result_export.export_result_set(db, reference, fmt)
+            logger.log(
+                "backend",
+                "info",
+                f"Scrub job {job_id} {fmt} export: {export['rows']} rows, {export['bytes']} bytes",
+                "scrub_worker",
+            )
+        except Exception as e:
+            logger.log("backend", "warn", f"Scrub job {job_id} {fmt} export failed: {e}", "scrub_worker")
+
+
 def run_forever(poll_interval: int = 5):
     """
     Long-running worker loop.
@@ -108,12 +159,14 @@ def run_forever(poll_interval: int = 5):
         python -m modules.scrub_worker
     """
     logger.log("backend", "info", "Scrub worker started", "scrub_worker")
+    db = get_database()
+    engine = ScrubbingEngine(db=db)
     while True:
         job_id = _pop_next_job_id()
         if job_id is None:
             time.sleep(poll_interval)
             continue
-        process_job(job_id)
+        process_job(job_id, db=db, engine=engine)
 
 
 if __name__ == "__main__":
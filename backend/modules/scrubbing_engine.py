@@ -1,7 +1,6 @@
-import pandas as pd
-from sqlalchemy import text, bindparam
-from .database_module import DatabaseModule
+from .database_module import get_database
 from .load_distributor import load_distributor
+from .cache_engine import content_digest
 import asyncio
 from functools import partial
 
@@ -21,21 +20,26 @@ def _normalize_batch(chunk):
 
 def _filter_operator_batch(chunk, allowed_prefixes):
     """Worker for operator prefix filtering."""
-    return [m for m, norm in chunk if any(norm.startswith(p) for p in allowed_prefixes)]
+    # Keep (original, normalized) pairs: the exclusion stage consumes them next
+    return [(m, norm) for m, norm in chunk if any(norm.startswith(p) for p in allowed_prefixes)]
 
-def _filter_exclusions_batch(chunk, exclude_suffixes):
-    """Worker for exclusion list filtering."""
-    return [m for m, norm in chunk if (norm[-8:] if len(norm) >= 8 else norm) not in exclude_suffixes]
+DEFAULT_SCRUB_OPTIONS = {"dnd": True, "sub": True, "unsub": True, "operator": True}
+
+# Bump when scrub semantics change so old fingerprints stop matching
+SCRUB_LOGIC_VERSION = 1
+
+# Local number prefixes per network
+OPERATOR_SERIES = {
+    "MTN": ["0803", "0806", "0703", "0706", "0810", "0813", "0814", "0816", "0903", "0906"],
+    "Airtel": ["0802", "0808", "0701", "0708", "0812", "0902", "0901", "0907"],
+    "Glo": ["0805", "0807", "0705", "0811", "0815", "0905"],
+    "9mobile": ["0809", "0817", "0818", "0909", "0809"]
+}
 
 class ScrubbingEngine:
-    def __init__(self):
-        self.db = DatabaseModule()
-        self.operator_series = {
-            "MTN": ["0803", "0806", "0703", "0706", "0810", "0813", "0814", "0816", "0903", "0906"],
-            "Airtel": ["0802", "0808", "0701", "0708", "0812", "0902", "0901", "0907"],
-            "Glo": ["0805", "0807", "0705", "0811", "0815", "0905"],
-            "9mobile": ["0809", "0817", "0818", "0909", "0809"]
-        }
+    def __init__(self, db=None):
+        self.db = db or get_database()
+        self.operator_series = {name: list(prefixes) for name, prefixes in OPERATOR_SERIES.items()}
         self.subscription_data = {} # MSISDN: Status
 
     def normalize_msisdn(self, msisdn):
@@ -50,6 +54,238 @@ class ScrubbingEngine:
             m = m[1:]
         return m
 
+    @staticmethod
+    def normalize_series(digits):
+        """
+        Vectorized normalize_msisdn for a pandas Series of digit-only strings
+        (as produced by UploadHandler.clean_block).
+        """
+        return digits.str.replace(r'^(?:234)?0?', '', regex=True)
+
+    def resolve_options(self, options):
+        """Canonical option dict: missing options default to the full pipeline."""
+        if not options:
+            return dict(DEFAULT_SCRUB_OPTIONS)
+        return {k: bool(options.get(k)) for k in DEFAULT_SCRUB_OPTIONS}
+
+    def fingerprint_job(self, msisdns, target_operator=None, options=None, versions=None):
+        """
+        Content-addressed job fingerprint: digest of the normalized input set,
+        the options, the operator and the current version (or the given
+        versions) of every exclusion list the job checks. Equal fingerprints
+        produce equal scrub results.
+        """
+        normalized = {self.normalize_msisdn(m) for m in msisdns if m}
+        normalized.discard("")
+        return self.fingerprint_digest(normalized, target_operator, options, versions=versions)
+
+    def exclusion_versions(self, options=None):
+        """Current versions of the exclusion lists a job with these options checks."""
+        options = self.resolve_options(options)
+        tables = [t for key, t in self.db.EXCLUSION_TABLES.items() if options.get(key)]
+        return self.db.get_exclusion_list_versions(tables)
+
+    def fingerprint_digest(self, normalized, target_operator=None, options=None, versions=None):
+        """
+        Fingerprint from an already-normalized set, or from an UnorderedDigest
+        accumulated over a unique block stream (same result for the same set).
+        versions pins the list versions the results were computed against.
+        """
+        options = self.resolve_options(options)
+        if versions is None:
+            versions = self.exclusion_versions(options)
+        operator = target_operator if options.get("operator") else None
+        return content_digest("scrub_job", SCRUB_LOGIC_VERSION, normalized, operator, options, versions)
+
+    @staticmethod
+    def _suffix(normalized):
+        """Matching key used across the pipeline: last 8 digits of the normalized MSISDN."""
+        return normalized[-8:] if len(normalized) >= 8 else normalized
+
+    @staticmethod
+    def _match_suffixes(raw_matches):
+        """Builds the bad-suffix set from raw DB matches (any stored format)."""
+        return {str(m).strip()[-8:] for m in raw_matches if len(str(m).strip()) >= 8}
+
+    def _exclusion_suffixes(self, msisdns, keys):
+        """
+        Bad-suffix set per exclusion list for the given keys (dnd/sub/unsub),
+        from a single multi-list lookup.
+        """
+        keys = [key for key in self.db.EXCLUSION_TABLES if key in keys]
+        if not keys or not msisdns:
+            return {key: set() for key in self.db.EXCLUSION_TABLES}
+        matches = self.db.check_exclusions_bulk(msisdns, keys)
+        return {key: self._match_suffixes(matches.get(key, [])) for key in self.db.EXCLUSION_TABLES}
+
+    @staticmethod
+    def _attribute_exclusions(pairs, bad):
+        """
+        Drops (msisdn, normalized) pairs whose suffix is on any list and counts
+        each removal once, for the first list in dnd -> sub -> unsub order.
+        """
+        counts = {"dnd_removed": 0, "sub_removed": 0, "unsub_removed": 0}
+        dnd, sub, unsub = bad["dnd"], bad["sub"], bad["unsub"]
+        if not (dnd or sub or unsub):
+            return pairs, counts
+        kept = []
+        for m, n in pairs:
+            suffix = n[-8:]
+            if suffix in dnd:
+                counts["dnd_removed"] += 1
+            elif suffix in sub:
+                counts["sub_removed"] += 1
+            elif suffix in unsub:
+                counts["unsub_removed"] += 1
+            else:
+                kept.append((m, n))
+        return kept, counts
+
+    def scrub_block(self, msisdns, target_operator=None, options=None, normalized=None):
+        """
+        Synchronous scrub of one block (pipelined scrub-while-uploading).
+        Same matching rules as perform_full_scrub; removals are attributed
+        exactly, in operator -> dnd -> sub -> unsub order. normalized may
+        carry precomputed normalize_msisdn values.
+        Returns (survivors, removal counts).
+        """
+        options = self.resolve_options(options)
+        stats = {"operator_removed": 0, "dnd_removed": 0, "sub_removed": 0, "unsub_removed": 0}
+        if normalized is None:
+            normalized = [self.normalize_msisdn(m) for m in msisdns]
+        pairs = list(zip(msisdns, normalized))
+
+        if options.get("operator") and target_operator:
+            allowed_prefixes = tuple(p[1:] if p.startswith("0") else p for p in self.operator_series.get(target_operator, []))
+            kept = [(m, n) for m, n in pairs if n.startswith(allowed_prefixes)]
+            stats["operator_removed"] = len(pairs) - len(kept)
+            pairs = kept
+
+        keys = [key for key in self.db.EXCLUSION_TABLES if options.get(key)]
+        bad = self._exclusion_suffixes([m for m, _ in pairs], keys)
+        pairs, counts = self._attribute_exclusions(pairs, bad)
+        stats.update(counts)
+        return [m for m, _ in pairs], stats
+
+    def create_saved_audience(self, username, name, msisdns, target_operator=None, options=None):
+        """
+        Stores a base once in normalized form together with its per-member scrub
+        outcome and the exclusion-list change watermark it reflects.
+        """
+        options = self.resolve_options(options)
+        # Read the watermark first: changes racing the full check are re-applied
+        # by the next delta, which is idempotent.
+        watermark = self.db.get_exclusion_change_watermark()
+        normalized = sorted({self.normalize_msisdn(m) for m in msisdns if m} - {""})
+
+        filter_operator = options.get("operator") and target_operator
+        allowed_prefixes = [p[1:] if p.startswith("0") else p for p in self.operator_series.get(target_operator, [])]
+
+        bad = self._exclusion_suffixes(normalized, [key for key in self.db.EXCLUSION_TABLES if options.get(key)])
+
+        members = []
+        final_count = 0
+        for n in normalized:
+            suffix = self._suffix(n)
+            operator_ok = not filter_operator or any(n.startswith(p) for p in allowed_prefixes)
+            flags = (suffix in bad["dnd"], suffix in bad["sub"], suffix in bad["unsub"])
+            members.append((n, suffix, operator_ok) + flags)
+            if operator_ok and not any(flags):
+                final_count += 1
+
+        audience_id = self.db.create_saved_audience(
+            username, name, target_operator, options, members, watermark
+        )
+        if not audience_id:
+            raise RuntimeError(self.db.last_error or "Failed to create saved audience")
+        self.db.set_saved_audience_final_count(audience_id, final_count)
+        return {
+            "audience_id": audience_id,
+            "total_input": len(msisdns),
+            "unique_count": len(normalized),
+            "final_count": final_count,
+            "change_watermark": watermark,
+        }
+
+    def rescrub_saved_audience(self, audience_id, username=None, save_results=False):
+        """
+        Incremental re-scrub: only exclusion rows added/removed since the
+        audience watermark are examined, and only members sharing a suffix with
+        them are re-checked. Cost scales with the list delta, not the base.
+        """
+        import json
+        audience = self.db.get_saved_audience(audience_id, username=username)
+        if not audience:
+            return None
+        options = self.resolve_options(json.loads(audience.get("options_json") or "{}"))
+        tables = {key: t for key, t in self.db.EXCLUSION_TABLES.items() if options.get(key)}
+
+        since = int(audience.get("change_watermark") or 0)
+        upto = self.db.get_exclusion_change_watermark()
+        changes = self.db.get_exclusion_changes(since, upto, list(tables.values()))
+        full_recheck = any(changes[t] is None for t in tables.values())
+
+        report = {
+            "audience_id": audience_id,
+            "since_watermark": since,
+            "change_watermark": upto,
+            "changed_suffixes": {key: (None if changes[t] is None else len(changes[t])) for key, t in tables.items()},
+            "members_checked": 0,
+            "members_updated": 0,
+        }
+
+        touched = set()
+        for t in tables.values():
+            if changes[t]:
+                touched |= changes[t]
+        if full_recheck:
+            rows = self.db.get_saved_audience_members(audience_id)
+        elif touched:
+            rows = self.db.get_saved_audience_members(audience_id, touched)
+        else:
+            rows = []
+        report["members_checked"] = len(rows)
+
+        new_flags = {r["msisdn"]: {key: bool(r[f"in_{key}"]) for key in self.db.EXCLUSION_TABLES} for r in rows}
+        # Candidates per list; one combined lookup covers all of them
+        candidates = {}
+        for key, table in tables.items():
+            changed = changes[table]
+            if changed is not None and not changed:
+                continue
+            candidates[key] = [r for r in rows if changed is None or r["suffix"] in changed]
+        lookup = {r["msisdn"] for members in candidates.values() for r in members}
+        bad = self._exclusion_suffixes(sorted(lookup), [key for key, members in candidates.items() if members])
+        for key, members in candidates.items():
+            for r in members:
+                new_flags[r["msisdn"]][key] = r["suffix"] in bad[key]
+
+        updates = []
+        delta = 0
+        for r in rows:
+            flags = new_flags[r["msisdn"]]
+            before = (bool(r["in_dnd"]), bool(r["in_sub"]), bool(r["in_unsub"]))
+            after = (flags["dnd"], flags["sub"], flags["unsub"])
+            if before == after:
+                continue
+            updates.append((r["msisdn"],) + after)
+            if r["operator_ok"]:
+                delta += int(not any(after)) - int(not any(before))
+        report["members_updated"] = len(updates)
+
+        final_count = self.db.apply_saved_audience_delta(audience_id, updates, delta, upto)
+        if final_count is None:
+            raise RuntimeError(self.db.last_error or "Failed to update saved audience")
+        report["final_count"] = final_count
+
+        if save_results:
+            survivors = self.db.load_saved_audience_survivors(audience_id, options)
+            save_ok, table_name = self.db.save_verified_scrub_results(survivors)
+            if save_ok and survivors:
+                self.db.set_saved_audience_final_count(audience_id, len(survivors), results_table=table_name)
+                report["results_table"] = table_name
+        return report
+
     def scrub_dnd(self, msisdns):
         """Removes numbers present in the DND list (via Optimized Batch SQL)."""
         if not msisdns:
@@ -107,7 +343,7 @@ class ScrubbingEngine:
         """
         Executes the full scrubbing pipeline with massive parallelism.
         """
-        options = options or {"dnd": True, "sub": True, "unsub": True, "operator": True}
+        options = self.resolve_options(options)
         initial_count = len(msisdns)
         print(f"DEBUG: Starting Optimized Parallel Scrub. Count: {initial_count}")
         
@@ -128,36 +364,11 @@ class ScrubbingEngine:
         # m_map: {normalized_8: original_m}
         # Actually, multiple msisdns could have same suffix, but we just need a lookup set
         
-        # 2. Parallel Database Checks
-        tasks = []
-        task_names = []
-        
-        if options.get("dnd"):
-            tasks.append(asyncio.to_thread(self.db.check_dnd_bulk, msisdns))
-            task_names.append("dnd")
-        
-        if options.get("sub"):
-            tasks.append(asyncio.to_thread(self.db.check_subscriptions_bulk, msisdns))
-            task_names.append("sub")
-            
-        if options.get("unsub"):
-            tasks.append(asyncio.to_thread(self.db.check_unsubscriptions_bulk, msisdns))
-            task_names.append("unsub")
+        # 2. Single multi-list Database Check (each chunk goes over the wire once)
+        keys = [key for key in self.db.EXCLUSION_TABLES if options.get(key)]
+        bad = await asyncio.to_thread(self._exclusion_suffixes, msisdns, keys)
 
-        # Execute DB checks concurrently
-        db_results = await asyncio.gather(*tasks) if tasks else []
-        results_map = dict(zip(task_names, db_results))
-        
-        # 3. Build Global Exclusion Suffix Set
-        exclude_suffixes = set()
-        for res_list in db_results:
-            for m in res_list:
-                m_str = str(m).strip()
-                if len(m_str) >= 8:
-                    exclude_suffixes.add(m_str[-8:])
-
-        # 4. Operator Filtering (Sequential but fast)
-        current_base = msisdns
+        # 3. Operator Filtering (Sequential but fast)
         if options.get("operator") and target_operator:
             allowed_prefixes = [p[1:] if p.startswith("0") else p for p in self.operator_series.get(target_operator, [])]
             
@@ -171,16 +382,10 @@ class ScrubbingEngine:
         else:
             current_base_with_norm = normalized_data
 
-        # 5. Final Exclusion Merge (Remove DND/Sub/Unsub)
-        final_base = await load_distributor.distribute_task(
-            partial(_filter_exclusions_batch, exclude_suffixes=exclude_suffixes), 
-            current_base_with_norm
-        )
-        
-        # Calculate individual removals for report (approximation since they were parallel)
-        report["dnd_removed"] = len([m for m in results_map.get("dnd", [])])
-        report["sub_removed"] = len([m for m in results_map.get("sub", [])])
-        report["unsub_removed"] = len([m for m in results_map.get("unsub", [])])
+        # 4. Final Exclusion Merge (Remove DND/Sub/Unsub) with exact per-list removals
+        kept, counts = self._attribute_exclusions(current_base_with_norm, bad)
+        final_base = [m for m, _ in kept]
+        report.update(counts)
         
         report["stages"].append({"stage": "Final Scrubbed Base", "count": len(final_base), "removed": initial_count - len(final_base)})
         
@@ -1,46 +1,525 @@
-import pandas as pd
 import io
+import os
+import csv
+import sys
+import gzip
+import json
+import time
+import uuid
+import queue
+import zipfile
+from array import array
+
+import pandas as pd
+
+from .dedup import SpillingDeduplicator
+
+try:
+    import ijson
+except ImportError:  # optional: streaming JSON bodies fall back to json.load
+    ijson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # optional: CSV parsing falls back to pandas' C engine
+    pa = None
+    pa_csv = None
+
+# Trailing ".0" of numeric spreadsheet cells, or any non-digit character
+_NON_DIGITS = r'\.0+$|\D'
+
+
+class BodyPipe(io.RawIOBase):
+    """
+    Read-only, non-seekable stream fed chunk by chunk from another thread
+    (e.g. an async request body). The bounded queue applies backpressure to
+    the producer while the parser is busy.
+    """
+
+    def __init__(self, max_chunks=64):
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self._buffer = b''
+        self._eof = False
+        self.aborted = False
+
+    def feed(self, chunk):
+        """Blocking put; b'' or None marks the end. Returns False once the reader gave up."""
+        while not self.aborted:
+            try:
+                self._queue.put(chunk or None, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def abort(self):
+        self.aborted = True
+
+    def fail(self, exc):
+        """Makes the reader raise instead of seeing a (truncated) end of stream."""
+        self.feed(exc)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer and not self._eof:
+            chunk = self._queue.get()
+            if chunk is None:
+                self._eof = True
+            elif isinstance(chunk, BaseException):
+                raise IOError(f"Upload stream interrupted: {chunk}")
+            else:
+                self._buffer = chunk
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+class _ReplayStream(io.RawIOBase):
+    """Re-emits already consumed bytes before the rest of a non-seekable stream."""
+
+    def __init__(self, prefix, fileobj):
+        self._prefix = prefix
+        self._fileobj = fileobj
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._prefix:
+            n = min(len(b), len(self._prefix))
+            b[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            return n
+        data = self._fileobj.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
 
 class UploadHandler:
+    # Header names recognised as the MSISDN column
+    MSISDN_COLUMNS = ['msisdn', 'phone', 'number', 'mobile', 'msisdn_list']
+
     def __init__(self):
-        pass
+        self.upload_dir = os.getenv("UPLOAD_DIR", "/tmp/obd_uploads")
+        self.block_rows = int(os.getenv("UPLOAD_BLOCK_ROWS", "50000"))
+        self.upload_ttl = int(os.getenv("UPLOAD_TTL_SECONDS", str(24 * 3600)))
+        # Accepted MSISDN length after digit stripping (E.164 allows up to 15)
+        self.min_digits = int(os.getenv("MSISDN_MIN_DIGITS", "7"))
+        self.max_digits = int(os.getenv("MSISDN_MAX_DIGITS", "15"))
+        os.makedirs(self.upload_dir, exist_ok=True)
 
     def process_file(self, file_content, file_extension):
         """
         Parses uploaded file content and extracts MSISDNs.
         Supports .csv, .txt, .xlsx
+        Legacy in-memory entry point; large files should go through ingest_file.
         """
-        msisdns = []
-        ext = file_extension.lower()
-        print(f"DEBUG: Processing file with extension: {ext}")
+        print(f"DEBUG: Processing file with extension: {file_extension.lower()}")
         try:
-            if ext == '.csv':
-                df = pd.read_csv(io.BytesIO(file_content))
-                msisdns = self._extract_from_df(df)
-            elif ext == '.txt':
-                content = file_content.decode('utf-8')
-                msisdns = [line.strip() for line in content.split('\n') if line.strip()]
-            elif ext in ['.xlsx', '.xls']:
-                print("DEBUG: Reading Excel file...")
-                df = pd.read_excel(io.BytesIO(file_content), engine='openpyxl')
-                msisdns = self._extract_from_df(df)
-            
-            print(f"DEBUG: Extracted {len(msisdns)} raw items from dataframe.")
-            # Basic validation: remove duplicates and non-numeric chars
-            # More robust: keep only digits
-            msisdns = list(set([''.join(filter(str.isdigit, str(m))) for m in msisdns if str(m).strip()]))
-            msisdns = [m for m in msisdns if m] # filter empty
+            cleaned = [self.clean_block(block) for block in self.iter_blocks(io.BytesIO(file_content), file_extension)]
+            if not cleaned:
+                return []
+            msisdns = pd.concat(cleaned, ignore_index=True).drop_duplicates()
             print(f"DEBUG: Validated {len(msisdns)} MSISDNs.")
-            return msisdns
+            return msisdns.tolist()
         except Exception as e:
             print(f"Error processing file in UploadHandler: {e}")
             return []
 
-    def _extract_from_df(self, df):
-        """Look for common phone number column names."""
-        potential_cols = ['msisdn', 'phone', 'number', 'mobile', 'msisdn_list']
-        for col in df.columns:
-            if col.lower() in potential_cols:
-                return df[col].astype(str).tolist()
-        # If no matching column, take the first column
-        return df.iloc[:, 0].astype(str).tolist()
+    # --- STREAMING INGESTION ---
+
+    # Compressed containers understood by iter_blocks
+    COMPRESSED_EXTENSIONS = ('.gz', '.gzip', '.zip')
+
+    def iter_blocks(self, fileobj, file_extension):
+        """
+        Yields pandas Series of raw MSISDN cells, at most block_rows at a time,
+        from a binary file object (zip and xlsx need it seekable; everything
+        else is read strictly forward). file_extension may also be a full
+        filename such as 'base.csv.gz'. Only the MSISDN column is read:
+        CSV goes through pyarrow's streaming reader (pandas' C engine with
+        usecols/dtype=str otherwise), TXT is split in byte blocks and XLSX
+        rows are iterated in read-only mode restricted to that column.
+        .gz and .zip (every supported member) are decompressed as a stream
+        into the same parsers.
+        """
+        ext, compression = self._split_extension(file_extension)
+        if (compression == '.zip' or ext in ('.xlsx', '.xls')) and not fileobj.seekable():
+            raise ValueError(f"{compression or ext} files cannot be streamed; upload them via /upload instead")
+        if compression in ('.gz', '.gzip'):
+            print(f"DEBUG: Streaming gzip-compressed {ext} upload...")
+            with gzip.GzipFile(fileobj=fileobj, mode='rb') as stream:
+                yield from self._iter_plain_blocks(stream, ext)
+        elif compression == '.zip':
+            yield from self._iter_zip_blocks(fileobj)
+        else:
+            yield from self._iter_plain_blocks(fileobj, ext)
+
+    def _split_extension(self, name):
+        """Returns (format extension, compression extension or None)."""
+        name = (name or "").lower()
+        for compression in self.COMPRESSED_EXTENSIONS:
+            if name.endswith(compression):
+                # bare 'base.gz' is assumed to hold a CSV/line-per-number file
+                return os.path.splitext(name[:-len(compression)])[1] or '.csv', compression
+        return os.path.splitext(name)[1] or name, None
+
+    def _iter_plain_blocks(self, fileobj, ext):
+        if ext == '.csv':
+            yield from self._iter_csv_blocks(fileobj)
+        elif ext == '.txt':
+            yield from self._iter_txt_blocks(fileobj)
+        elif ext in ['.xlsx', '.xls']:
+            print("DEBUG: Reading Excel file (read-only stream)...")
+            yield from self._iter_xlsx_blocks(fileobj)
+        else:
+            raise ValueError(f"Unsupported file type: {ext}")
+
+    def _iter_zip_blocks(self, fileobj):
+        """Streams every CSV/TXT/XLSX member of a zip archive, in archive order."""
+        with zipfile.ZipFile(fileobj) as archive:
+            members = [
+                info for info in archive.infolist()
+                if not info.is_dir()
+                and not info.filename.startswith('__MACOSX/')
+                and not os.path.basename(info.filename).startswith('.')
+            ]
+            supported = [
+                info for info in members
+                if self._split_extension(info.filename) in (('.csv', None), ('.txt', None), ('.xlsx', None), ('.xls', None))
+            ]
+            if not supported:
+                raise ValueError("Zip archive contains no .csv, .txt or .xlsx files")
+            for info in supported:
+                print(f"DEBUG: Streaming zip member '{info.filename}' ({info.file_size} bytes)")
+                with archive.open(info) as stream:
+                    yield from self._iter_plain_blocks(stream, self._split_extension(info.filename)[0])
+
+    def _sniff_header(self, first_row):
+        """
+        Returns (col_idx, has_header) from the first row: a known header name
+        selects the column, otherwise the first column is used and the row is
+        only treated as a header if it contains no digits.
+        """
+        header = [str(c).strip().lower() if c is not None else "" for c in first_row]
+        matches = [i for i, name in enumerate(header) if name in self.MSISDN_COLUMNS]
+        if matches:
+            return matches[0], True
+        return 0, not any(ch.isdigit() for ch in (header[0] if header else ""))
+
+    def _iter_csv_blocks(self, fileobj):
+        first_bytes = fileobj.readline()
+        first_line = first_bytes.decode('utf-8', errors='replace')
+        if not first_line.strip():
+            return
+        first_row = next(csv.reader([first_line]))
+        col_idx, has_header = self._sniff_header(first_row)
+        names = [f"c{i}" for i in range(len(first_row))]
+        if not has_header:
+            # The sniffed line is data; replay it (works on non-seekable streams)
+            fileobj = io.BufferedReader(_ReplayStream(first_bytes, fileobj), buffer_size=1 << 20)
+
+        if pa_csv is not None:
+            reader = pa_csv.open_csv(
+                fileobj,
+                read_options=pa_csv.ReadOptions(
+                    column_names=names,
+                    block_size=max(1 << 20, self.block_rows * 32),
+                ),
+                parse_options=pa_csv.ParseOptions(invalid_row_handler=lambda row: 'skip'),
+                convert_options=pa_csv.ConvertOptions(
+                    include_columns=[names[col_idx]],
+                    column_types={names[col_idx]: pa.string()},
+                    strings_can_be_null=True,
+                ),
+            )
+            for batch in reader:
+                if batch.num_rows:
+                    yield batch.column(0).to_pandas()
+            return
+
+        reader = pd.read_csv(
+            fileobj,
+            header=None,
+            names=names,
+            usecols=[col_idx],
+            dtype=str,
+            chunksize=self.block_rows,
+            on_bad_lines='skip',
+            encoding_errors='replace',
+        )
+        for chunk in reader:
+            yield chunk.iloc[:, 0]
+
+    def _iter_txt_blocks(self, fileobj):
+        # One MSISDN per line: split raw byte blocks instead of iterating lines
+        chunk_bytes = max(1 << 20, self.block_rows * 16)
+        pending = b''
+        while True:
+            data = fileobj.read(chunk_bytes)
+            if not data:
+                break
+            lines = (pending + data).split(b'\n')
+            pending = lines.pop()
+            block = pd.Series(lines).str.decode('utf-8', errors='replace').str.strip()
+            yield block[block != '']
+        if pending.strip():
+            yield pd.Series([pending]).str.decode('utf-8', errors='replace').str.strip()
+
+    def _iter_xlsx_blocks(self, fileobj):
+        from openpyxl import load_workbook
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+        try:
+            sheet = workbook.active
+            first_row = next(sheet.iter_rows(max_row=1, values_only=True), None)
+            if not first_row:
+                return
+            col_idx, has_header = self._sniff_header(first_row)
+            rows = sheet.iter_rows(
+                min_row=2 if has_header else 1,
+                min_col=col_idx + 1,
+                max_col=col_idx + 1,
+                values_only=True,
+            )
+            block = []
+            for row in rows:
+                if row and row[0] is not None:
+                    block.append(row[0])
+                    if len(block) >= self.block_rows:
+                        yield pd.Series(block, dtype=object)
+                        block = []
+            if block:
+                yield pd.Series(block, dtype=object)
+        finally:
+            workbook.close()
+
+    def clean_block(self, block):
+        """
+        Vectorized cleaning of a block of raw cells: keeps digits only and
+        drops values outside MSISDN_MIN_DIGITS..MSISDN_MAX_DIGITS.
+        Returns a Series of digit strings.
+        """
+        if not isinstance(block, pd.Series):
+            block = pd.Series(block, dtype=object)
+        digits = block.dropna().astype(str).str.replace(_NON_DIGITS, '', regex=True)
+        lengths = digits.str.len()
+        return digits[(lengths >= self.min_digits) & (lengths <= self.max_digits)]
+
+    def _upload_path(self, upload_id):
+        if not upload_id or not all(c in "0123456789abcdef" for c in upload_id):
+            raise ValueError("Invalid upload id")
+        return os.path.join(self.upload_dir, f"{upload_id}.txt")
+
+    def ingest_file(self, fileobj, filename, preview_size=100):
+        """
+        Streams an uploaded file through parsing, cleaning and de-duplication
+        into a parsed spool file (one MSISDN per line) identified by upload_id.
+        Returns counts, per-phase timings and a small preview instead of the
+        whole base.
+        """
+        self.purge_expired_uploads()
+        upload_id = uuid.uuid4().hex
+        path = self._upload_path(upload_id)
+        start = time.perf_counter()
+        timings = {"parse": 0.0, "clean": 0.0, "dedupe": 0.0, "write": 0.0}
+        raw_count = 0
+        invalid_count = 0
+        preview = []
+
+        def emit(out, unique):
+            out.write("\n".join(unique))
+            out.write("\n")
+            if len(preview) < preview_size:
+                preview.extend(unique[:preview_size - len(preview)])
+
+        try:
+            with open(path, "w") as out, SpillingDeduplicator(block_rows=self.block_rows) as dedup:
+                blocks = self.iter_blocks(fileobj, filename or "")
+                while True:
+                    t0 = time.perf_counter()
+                    block = next(blocks, None)
+                    t1 = time.perf_counter()
+                    timings["parse"] += t1 - t0
+                    if block is None:
+                        break
+                    raw_count += len(block)
+
+                    valid = self.clean_block(block)
+                    invalid_count += len(block) - len(valid)
+                    t2 = time.perf_counter()
+                    timings["clean"] += t2 - t1
+
+                    # In-block duplicates go vectorized; the cross-block check
+                    # only sees the (usually much smaller) block-unique list
+                    unique, _ = dedup.add(valid.drop_duplicates().tolist())
+                    t3 = time.perf_counter()
+                    timings["dedupe"] += t3 - t2
+
+                    if unique:
+                        emit(out, unique)
+                    timings["write"] += time.perf_counter() - t3
+
+                # Values held back after a spill to disk
+                t0 = time.perf_counter()
+                for unique, _ in dedup.finish():
+                    emit(out, unique)
+                timings["dedupe"] += time.perf_counter() - t0
+                count = dedup.unique_count
+        except Exception:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        duration = time.perf_counter() - start
+        timings = {phase: round(secs, 3) for phase, secs in timings.items()}
+        duplicate_count = raw_count - invalid_count - count
+        print(
+            f"DEBUG: Ingested '{filename}' -> {count} unique of {raw_count} rows "
+            f"({invalid_count} invalid, {duplicate_count} duplicates) in {duration:.2f}s {timings}"
+        )
+        return {
+            "upload_id": upload_id,
+            "count": count,
+            "raw_count": raw_count,
+            "invalid_count": invalid_count,
+            "duplicate_count": duplicate_count,
+            "preview": preview,
+            "duration_s": round(duration, 3),
+            "timings": timings,
+        }
+
+    def iter_upload(self, upload_id, block_rows=None):
+        """
+        Returns an iterator of MSISDN blocks from a previously ingested upload.
+        The spool is opened eagerly so unknown ids fail before any job exists.
+        """
+        f = open(self._upload_path(upload_id), "r")
+        return self._iter_spool(f, block_rows or self.block_rows)
+
+    def _iter_spool(self, f, block_rows):
+        block = []
+        with f:
+            for line in f:
+                line = line.rstrip("\n")
+                if line:
+                    block.append(line)
+                    if len(block) >= block_rows:
+                        yield block
+                        block = []
+        if block:
+            yield block
+
+    # --- /scrub REQUEST BODIES ---
+
+    # Content types accepted by /scrub besides the legacy JSON shape
+    TEXT_BODY_TYPES = ('text/plain', 'text/csv', 'application/x-ndjson', 'application/jsonl')
+    INT64_BODY_TYPES = ('application/octet-stream', 'application/x-msisdn-int64')
+
+    def open_request_body(self, fileobj, content_type, content_encoding=None):
+        """
+        Interprets a spooled /scrub request body. Returns (meta, blocks) where
+        meta holds the non-list JSON fields (operator, options, upload_id) and
+        blocks lazily yields MSISDN lists of at most block_rows items:
+        - application/json: {"msisdn_list": [...], ...}, parsed with ijson
+          when available so the list is never materialised
+        - text/plain, NDJSON: one MSISDN per line (optionally quoted)
+        - application/octet-stream: packed little-endian int64 array
+        Content-Encoding: gzip is decompressed on the fly.
+        """
+        media_type = (content_type or 'application/json').split(';')[0].strip().lower()
+        if (content_encoding or '').strip().lower() in ('gzip', 'x-gzip'):
+            fileobj = gzip.GzipFile(fileobj=fileobj, mode='rb')
+        elif content_encoding and content_encoding.strip().lower() != 'identity':
+            raise ValueError(f"Unsupported content encoding: {content_encoding}")
+
+        if media_type in self.TEXT_BODY_TYPES:
+            return {}, self._iter_text_body(fileobj)
+        if media_type in self.INT64_BODY_TYPES:
+            return {}, self._iter_int64_body(fileobj)
+        if media_type == 'application/json' or media_type.endswith('+json'):
+            return self._open_json_body(fileobj)
+        raise ValueError(f"Unsupported content type: {media_type}")
+
+    def _iter_text_body(self, fileobj):
+        block = []
+        for line in io.TextIOWrapper(fileobj, encoding='utf-8', errors='replace'):
+            line = line.strip().strip('"').strip()
+            if line:
+                block.append(line)
+                if len(block) >= self.block_rows:
+                    yield block
+                    block = []
+        if block:
+            yield block
+
+    def _iter_int64_body(self, fileobj):
+        chunk_bytes = self.block_rows * 8
+        pending = b''
+        while True:
+            data = fileobj.read(chunk_bytes)
+            if not data:
+                break
+            data = pending + data
+            usable = len(data) - len(data) % 8
+            pending = data[usable:]
+            values = array('q')
+            values.frombytes(data[:usable])
+            if sys.byteorder != 'little':
+                values.byteswap()
+            if values:
+                yield [str(v) for v in values if v > 0]
+        if pending:
+            raise ValueError("Packed MSISDN body length is not a multiple of 8 bytes")
+
+    def _open_json_body(self, fileobj):
+        if ijson is None:
+            payload = json.load(fileobj)
+            if not isinstance(payload, dict):
+                raise ValueError("JSON body must be an object")
+            msisdns = payload.pop('msisdn_list', None) or []
+            return payload, self._iter_list_blocks(msisdns)
+
+        # First pass collects the small fields, second streams the list items
+        meta = {}
+        builder = None
+        for prefix, event, value in ijson.parse(fileobj):
+            if prefix == 'msisdn_list' or prefix.startswith('msisdn_list.'):
+                continue
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == builder_key and event in ('end_map', 'end_array'):
+                    meta[builder_key] = builder.value
+                    builder = None
+            elif prefix in ('operator', 'upload_id', 'email_context', 'username') and event in ('string', 'null'):
+                meta[prefix] = value
+            elif prefix == 'options' and event == 'start_map':
+                builder_key = prefix
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+        fileobj.seek(0)
+        items = (str(v) for v in ijson.items(fileobj, 'msisdn_list.item'))
+        return meta, self._iter_list_blocks(items)
+
+    def _iter_list_blocks(self, items):
+        block = []
+        for m in items:
+            block.append(m)
+            if len(block) >= self.block_rows:
+                yield block
+                block = []
+        if block:
+            yield block
+
+    def purge_expired_uploads(self):
+        """Removes parsed uploads older than UPLOAD_TTL_SECONDS."""
+        cutoff = time.time() - self.upload_ttl
+        try:
+            for name in os.listdir(self.upload_dir):
+                path = os.path.join(self.upload_dir, name)
+                if name.endswith(".txt") and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+        except Exception as e:
+            print(f"DEBUG: Upload purge warning: {e}")
@@ -0,0 +1,54 @@
+from modules.cache_engine import UnorderedDigest, content_digest
+
+
+def test_lists_are_order_insensitive():
+    assert content_digest(["2348031", "2348032", "2348033"]) == content_digest(["2348033", "2348031", "2348032"])
+
+
+def test_duplicates_count():
+    assert content_digest(["a", "a", "b"]) != content_digest(["a", "b"])
+    assert content_digest(["a", "a", "b"]) != content_digest(["a", "b", "b"])
+
+
+def test_sets_and_lists_of_the_same_items_match():
+    assert content_digest({"a", "b"}) == content_digest(["b", "a"])
+
+
+def test_tuples_keep_their_order():
+    assert content_digest(("a", "b")) != content_digest(("b", "a"))
+
+
+def test_types_are_tagged():
+    assert content_digest(["1"]) != content_digest([1])
+    assert content_digest("1") != content_digest(1)
+
+
+def test_dicts_are_order_insensitive():
+    assert content_digest({"a": 1, "b": [1, 2]}) == content_digest({"b": [2, 1], "a": 1})
+
+
+def test_unordered_digest_matches_the_whole_list():
+    items = [f"23480{i:08d}" for i in range(10000)]
+    digest = UnorderedDigest()
+    for i in range(0, len(items), 3000):
+        digest.update(items[i:i + 3000])
+    assert content_digest(digest) == content_digest(list(reversed(items)))
+
+
+def test_mixed_lists_match_their_str_only_parts():
+    # The all-str fast path and the per-item path must agree
+    assert content_digest(["x", 1]) == content_digest([1, "x"])
+    digest = UnorderedDigest()
+    digest.update(["x"])
+    digest.update([1])
+    assert content_digest(digest) == content_digest(["x", 1])
+
+
+def test_lone_surrogates_hash_on_every_path():
+    short, long = ["\ud800"] * 3, ["\ud800"] * 5000
+    assert content_digest("p", (short,), {}) != content_digest("p", (long,), {})
+    assert content_digest(["\ud800", 1]) == content_digest([1, "\ud800"])
+    digest = UnorderedDigest()
+    digest.update(["\ud800"])
+    digest.update([1])
+    assert content_digest(digest) == content_digest(["\ud800", 1])
@@ -0,0 +1,73 @@
+import os
+
+from modules.dedup import SpillingDeduplicator
+
+
+def _drain(dedup, blocks):
+    """All (value, key) pairs dedup lets through, from add() and finish()."""
+    out = []
+    for values, keys in blocks:
+        out += zip(*dedup.add(values, keys))
+    for values, keys in dedup.finish():
+        out += zip(values, keys)
+    return out
+
+
+def test_in_memory_dedup_keeps_first_occurrence():
+    with SpillingDeduplicator() as dedup:
+        assert dedup.add(["a", "b", "a"]) == (["a", "b"], ["a", "b"])
+        assert dedup.add(["b", "c"]) == (["c"], ["c"])
+        assert list(dedup.finish()) == []
+        assert not dedup.spilled
+        assert (dedup.total, dedup.unique_count, dedup.duplicate_count) == (5, 3, 2)
+
+
+def test_dedup_on_keys():
+    with SpillingDeduplicator() as dedup:
+        values, keys = dedup.add(["2348031", "08031", "8031", "8032"], ["8031", "8031", "8031", "8032"])
+        assert values == ["2348031", "8032"]
+        assert keys == ["8031", "8032"]
+
+
+def test_spill_emits_every_key_exactly_once(tmp_path):
+    dedup = SpillingDeduplicator(partitions=4, spill_dir=str(tmp_path), block_rows=3)
+    dedup.max_keys = 5
+    blocks = [
+        ([f"v{i}" for i in range(8)], [f"k{i}" for i in range(8)]),            # spills after this block
+        ([f"w{i}" for i in range(4, 12)], [f"k{i}" for i in range(4, 12)]),     # k4..k7 already emitted
+        ([f"x{i}" for i in range(10, 14)], [f"k{i}" for i in range(10, 14)]),   # k10, k11 repeat after spill
+    ]
+    with dedup:
+        out = _drain(dedup, blocks)
+        assert dedup.spilled
+        assert sorted(k for _, k in out) == sorted(f"k{i}" for i in range(14))
+        # The first value seen for a key wins, before and after the spill
+        assert dict((k, v) for v, k in out) == {
+            **{f"k{i}": f"v{i}" for i in range(8)},
+            **{f"k{i}": f"w{i}" for i in range(8, 12)},
+            **{f"k{i}": f"x{i}" for i in range(12, 14)},
+        }
+        assert (dedup.total, dedup.unique_count, dedup.duplicate_count) == (20, 14, 6)
+        spill_dirs = os.listdir(tmp_path)
+        assert len(spill_dirs) == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_finish_blocks_respect_block_rows(tmp_path):
+    dedup = SpillingDeduplicator(partitions=1, spill_dir=str(tmp_path), block_rows=3)
+    dedup.max_keys = 2
+    with dedup:
+        dedup.add(["a", "b", "c"])
+        dedup.add([str(i) for i in range(10)])
+        blocks = list(dedup.finish())
+        assert all(len(values) <= 3 for values, _ in blocks)
+        assert sum(len(values) for values, _ in blocks) == 10
+
+
+def test_spill_escapes_separators(tmp_path):
+    dedup = SpillingDeduplicator(partitions=2, spill_dir=str(tmp_path))
+    dedup.max_keys = 1
+    with dedup:
+        dedup.add(["a", "b"])
+        out = _drain(dedup, [(["x\ty", "line\nbreak"], ["k\t1", "k\n2"])])
+        assert sorted(v for v, _ in out) == ["line break", "x y"]
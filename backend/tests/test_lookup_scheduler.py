@@ -0,0 +1,123 @@
+import threading
+import time
+
+import pytest
+
+from modules.lookup_scheduler import BatchSizeController, LookupScheduler
+
+
+def test_controller_grows_additively_on_fast_full_batches():
+    c = BatchSizeController(initial=100, minimum=10, maximum=130, step=20, target_ms=50)
+    c.observe(10, 100)
+    assert c.size == 120
+    c.observe(10, 120)
+    assert c.size == 130  # capped at maximum
+
+
+def test_controller_ignores_partial_batches():
+    c = BatchSizeController(initial=100, minimum=10, maximum=1000, step=20, target_ms=50)
+    c.observe(10, 40)
+    assert c.size == 100
+
+
+def test_controller_halves_on_slow_batches():
+    c = BatchSizeController(initial=100, minimum=30, maximum=1000, step=20, target_ms=50)
+    c.observe(80, 100)
+    assert c.size == 50
+    c.observe(80, 50)
+    assert c.size == 30  # floored at minimum
+    assert c.last_latency_ms == 80
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setenv("DB_LOOKUP_BATCH", "10")
+    monkeypatch.setenv("DB_LOOKUP_MIN_BATCH", "1")
+    monkeypatch.setenv("DB_LOOKUP_TARGET_MS", "60000")
+    return LookupScheduler(budget=1, reserve=0)
+
+
+def test_map_covers_every_item_in_batches(scheduler):
+    seen = []
+    results = scheduler.map("dnd", list(range(35)), lambda batch: seen.append(batch) or len(batch))
+    assert sorted(x for batch in seen for x in batch) == list(range(35))
+    assert sum(results) == 35
+    assert scheduler.stats()["queries"] == len(seen)
+
+
+def test_map_of_nothing_runs_nothing(scheduler):
+    assert scheduler.map("dnd", [], lambda batch: 1 / 0) == []
+
+
+def test_errors_reach_the_caller(scheduler):
+    def lookup(batch):
+        if 25 in batch:
+            raise RuntimeError("connection lost")
+        return batch
+
+    with pytest.raises(RuntimeError, match="connection lost"):
+        scheduler.map("dnd", list(range(50)), lookup)
+    # The worker survives the failure
+    assert scheduler.map("dnd", [1, 2], lambda batch: batch) == [[1, 2]]
+
+
+def test_chunk_queries_retry_then_raise(monkeypatch):
+    from modules import database_module
+
+    monkeypatch.setattr(database_module, "CHUNK_QUERY_ATTEMPTS", 3)
+    monkeypatch.setattr(database_module.time, "sleep", lambda seconds: None)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise RuntimeError("connection reset")
+        return ["8031234567"]
+
+    assert database_module._run_chunk_query("dnd", flaky) == ["8031234567"]
+
+    def down():
+        raise RuntimeError("database down")
+
+    # A chunk that never ran must fail the lookup, not read as "no matches"
+    with pytest.raises(RuntimeError, match="database down"):
+        database_module._run_chunk_query("dnd", down)
+
+
+def test_concurrency_is_capped_by_the_pool():
+    assert LookupScheduler(budget=1000, reserve=1).concurrency < LookupScheduler(budget=1000, reserve=0).concurrency
+    assert LookupScheduler(budget=3, reserve=0).concurrency == 3
+
+
+def test_small_lookup_is_not_starved_by_a_large_one(scheduler):
+    calls = []
+    gate = threading.Event()
+
+    def big(batch):
+        if not calls:
+            gate.wait(5)  # hold the only worker until the small lookup is queued
+        calls.append("big")
+        time.sleep(0.001)
+        return batch
+
+    def small(batch):
+        calls.append("small")
+        return batch
+
+    big_thread = threading.Thread(target=scheduler.map, args=("sub", list(range(200)), big))
+    big_thread.start()
+    small_thread = threading.Thread(target=scheduler.map, args=("unsub", list(range(20)), small))
+    deadline = time.time() + 5
+    while scheduler.stats()["busy"] == 0 and time.time() < deadline:
+        time.sleep(0.001)
+    small_thread.start()
+    while scheduler.stats()["active_lookups"] < 2 and time.time() < deadline:
+        time.sleep(0.001)
+    gate.set()
+    small_thread.join(5)
+    big_thread.join(5)
+
+    assert calls.count("small") == 2
+    # Round-robin: the small lookup's batches interleave with the big one's
+    last_small = len(calls) - 1 - calls[::-1].index("small")
+    assert last_small <= 4 < calls.count("big")
@@ -0,0 +1,63 @@
+import pytest
+
+from modules.database_module import (
+    msisdn_key,
+    parse_result_set_reference,
+    result_set_query,
+    result_set_reference,
+)
+
+
+@pytest.mark.parametrize("msisdn", ["2348031234567", "08031234567", "8031234567", "+234 803 123 4567"])
+def test_msisdn_key_is_the_national_number(msisdn):
+    assert msisdn_key(msisdn) == 8031234567
+
+
+def test_msisdn_key_of_nothing():
+    assert msisdn_key("") == 0
+    assert msisdn_key("+") == 0
+
+
+def test_result_set_references_round_trip():
+    assert result_set_reference(42) == "result_set_42"
+    assert parse_result_set_reference("result_set_42") == 42
+    assert parse_result_set_reference("result_set_x") is None
+    assert parse_result_set_reference("scrub_results_20240101_120000") is None
+    assert parse_result_set_reference(None) is None
+
+
+def test_result_set_first_page():
+    query, params = result_set_query("result_set_7", limit=100)
+    assert params == {"id": 7, "limit": 100}
+    assert "WHERE result_set_id = :id" in query
+    # Only the set's own day partition is scanned
+    assert "created_on = (SELECT created_on FROM scrub_result_sets WHERE id = :id)" in query
+    assert query.endswith("ORDER BY msisdn_key, msisdn LIMIT :limit")
+
+
+def test_result_set_keyset_cursor():
+    query, params = result_set_query(7, limit=100, after="8031234567:2348031234567")
+    assert "(msisdn_key, msisdn) > (:after_key, :after_msisdn)" in query
+    assert params == {"id": 7, "limit": 100, "after_key": 8031234567, "after_msisdn": "2348031234567"}
+
+
+def test_result_set_cursor_keeps_colons_in_the_msisdn():
+    _, params = result_set_query(7, after="803:a:b")
+    assert (params["after_key"], params["after_msisdn"]) == (803, "a:b")
+
+
+def test_legacy_table_pages_on_id():
+    query, params = result_set_query("scrub_results_20240101_120000", limit=10, after="500")
+    assert query == "SELECT msisdn, id::text AS cursor FROM scrub_results_20240101_120000 WHERE id > :after_id ORDER BY id LIMIT :limit"
+    assert params == {"after_id": 500, "limit": 10}
+
+
+@pytest.mark.parametrize("reference, after", [
+    ("result_set_7", "not-a-key:1"),
+    ("scrub_results_20240101_120000", "abc"),
+    ("users; DROP TABLE users", None),
+    ("scrub_jobs", None),
+])
+def test_invalid_references_and_cursors(reference, after):
+    with pytest.raises(ValueError):
+        result_set_query(reference, after=after)
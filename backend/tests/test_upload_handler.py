@@ -0,0 +1,127 @@
+import pandas as pd
+import pytest
+
+from modules.upload_handler import UploadHandler
+
+
+@pytest.fixture
+def handler(tmp_path, monkeypatch):
+    monkeypatch.setenv("UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setenv("UPLOAD_BLOCK_ROWS", "4")
+    return UploadHandler()
+
+
+def test_clean_block_keeps_digits_only(handler):
+    cleaned = handler.clean_block(pd.Series(["+234 803-123-4567", "(0803) 1234567"]))
+    assert cleaned.tolist() == ["2348031234567", "08031234567"]
+
+
+def test_clean_block_strips_spreadsheet_float_suffix(handler):
+    cleaned = handler.clean_block(pd.Series([2348031234567.0, "2348031234568.0", "2348031234569.00"], dtype=object))
+    assert cleaned.tolist() == ["2348031234567", "2348031234568", "2348031234569"]
+
+
+def test_clean_block_filters_by_length(handler):
+    cleaned = handler.clean_block(["123456", "1234567", "123456789012345", "1234567890123456", "abc", ""])
+    assert cleaned.tolist() == ["1234567", "123456789012345"]
+
+
+def test_clean_block_drops_missing_cells(handler):
+    cleaned = handler.clean_block(pd.Series([None, "08031234567", float("nan")], dtype=object))
+    assert cleaned.tolist() == ["08031234567"]
+
+
+NUMBERS = [f"23480312345{i:02d}" for i in range(10)]
+
+
+def _csv(numbers, header="msisdn"):
+    return ("\n".join(([header] if header else []) + numbers) + "\n").encode()
+
+
+def _read(handler, data, name):
+    import io
+    return [str(v) for block in handler.iter_blocks(io.BytesIO(data), name) for v in block]
+
+
+def test_iter_blocks_csv_picks_the_msisdn_column(handler):
+    data = ("name,msisdn\n" + "\n".join(f"n{i},{m}" for i, m in enumerate(NUMBERS)) + "\n").encode()
+    assert _read(handler, data, "base.csv") == NUMBERS
+
+
+def test_iter_blocks_headerless_csv_keeps_the_first_row(handler):
+    assert _read(handler, _csv(NUMBERS, header=None), "base.csv") == NUMBERS
+
+
+def test_iter_blocks_txt(handler):
+    assert _read(handler, ("\n".join(NUMBERS) + "\n\n").encode(), "base.txt") == NUMBERS
+
+
+def test_iter_blocks_gzip(handler):
+    import gzip
+    assert _read(handler, gzip.compress(_csv(NUMBERS)), "base.csv.gz") == NUMBERS
+    # bare .gz holds a CSV / one number per line
+    assert _read(handler, gzip.compress(_csv(NUMBERS)), "base.gz") == NUMBERS
+
+
+def test_iter_blocks_multi_member_zip(handler):
+    import io
+    import zipfile
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("part1.csv", _csv(NUMBERS[:6]))
+        archive.writestr("nested/part2.txt", "\n".join(NUMBERS[6:]))
+        archive.writestr("__MACOSX/._part1.csv", b"junk")
+        archive.writestr("readme.md", b"ignored")
+    assert _read(handler, buf.getvalue(), "bases.zip") == NUMBERS
+
+
+def test_iter_blocks_zip_without_supported_members(handler):
+    import io
+    import zipfile
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as archive:
+        archive.writestr("readme.md", b"nothing here")
+    with pytest.raises(ValueError):
+        _read(handler, buf.getvalue(), "bases.zip")
+
+
+def test_iter_blocks_xlsx(handler):
+    import io
+    from openpyxl import Workbook
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["name", "Phone"])
+    for i, number in enumerate(NUMBERS):
+        sheet.append([f"n{i}", int(number)])
+    buf = io.BytesIO()
+    workbook.save(buf)
+    blocks = list(handler.iter_blocks(io.BytesIO(buf.getvalue()), "base.xlsx"))
+    assert max(len(b) for b in blocks) <= handler.block_rows
+    cleaned = pd.concat([handler.clean_block(b) for b in blocks]).tolist()
+    assert cleaned == NUMBERS
+
+
+def test_iter_blocks_txt_without_trailing_newline(handler):
+    import io
+    numbers = [f"2348031{i:06d}" for i in range(1000)]
+    blocks = list(handler.iter_blocks(io.BytesIO("\n".join(numbers).encode()), "base.txt"))
+    assert [v for b in blocks for v in b] == numbers
+
+
+def test_iter_blocks_rejects_unseekable_zip(handler):
+    import io
+
+    class Forward(io.RawIOBase):
+        def readable(self):
+            return True
+
+        def seekable(self):
+            return False
+
+    with pytest.raises(ValueError):
+        list(handler.iter_blocks(Forward(), "bases.zip"))
+
+
+def test_iter_blocks_unsupported_extension(handler):
+    with pytest.raises(ValueError):
+        _read(handler, b"x", "base.pdf")
@@ -75,6 +75,7 @@ export default function Dashboard() {
   const [flowError, setFlowError] = useState('');
 
   const [msisdnList, setMsisdnList] = useState([]);
+  const [uploadId, setUploadId] = useState(null);
   const [cleanedMsisdns, setCleanedMsisdns] = useState([]);
   const [loading, setLoading] = useState(false);
   const [xmlContent, setXmlContent] = useState('');
@@ -267,6 +268,8 @@ export default function Dashboard() {
 
   const [scrubJobs, setScrubJobs] = useState([]);
   const [activeJobId, setActiveJobId] = useState(null);
+  // Completed job whose results a campaign launch copies server-side
+  const [resultsJobId, setResultsJobId] = useState(null);
 
   const pollJobStatus = async (jobId) => {
     try {
@@ -286,6 +289,7 @@ export default function Dashboard() {
       });
       if (job.status === 'COMPLETED') {
         setActiveJobId(null);
+        setResultsJobId(job.results_table ? job.id : null);
         setCounts(prev => ({
           ...prev,
           scrubbed: job.final_count || 0,
@@ -295,7 +299,7 @@ export default function Dashboard() {
         // Fetch the actual results to show in terminal
         if (job.results_table) {
           try {
-            const resultsRes = await fetch(`${API_BASE}/scrub-results/${job.results_table}`, {
+            const resultsRes = await fetch(`${API_BASE}/scrub-job/${job.id}/results`, {
               headers: getAuthHeaders()
             });
             if (resultsRes.ok) {
@@ -314,11 +318,14 @@ export default function Dashboard() {
     }
   };
 
-  const performScrub = async (listToScrub) => {
+  const performScrub = async (listToScrub, uploadRef) => {
     const targetList = listToScrub || msisdnList;
-    if (!targetList.length) return;
+    // Parsed uploads stay on the server; only their id is sent back
+    const targetUpload = listToScrub ? uploadRef : (uploadRef || uploadId);
+    if (!targetUpload && !targetList.length) return;
 
     setLoading(true);
+    setResultsJobId(null);
     try {
       const res = await fetch(`${API_BASE}/scrub`, {
         method: 'POST',
@@ -326,7 +333,10 @@ export default function Dashboard() {
           'Content-Type': 'application/json',
           ...getAuthHeaders()
         },
-        body: JSON.stringify({
+        body: JSON.stringify(targetUpload ? {
+          upload_id: targetUpload,
+          options: scrubOptions
+        } : {
           msisdn_list: targetList,
           options: scrubOptions
         }),
@@ -403,11 +413,13 @@ export default function Dashboard() {
     try {
       const res = await fetch(`${API_BASE}/launch-campaign`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          msisdn_list: cleanedMsisdns,
-          chunk_size: chunkSize
-        }),
+        headers: {
+          'Content-Type': 'application/json',
+          ...getAuthHeaders()
+        },
+        body: JSON.stringify(resultsJobId
+          ? { job_id: resultsJobId, chunk_size: chunkSize }
+          : { msisdn_list: cleanedMsisdns, chunk_size: chunkSize }),
       });
 
       if (!res.ok) {
@@ -430,14 +442,18 @@ export default function Dashboard() {
     setLoading(true);
     setSessionStats({ dnd: 0, sub: 0, unsub: 0, operator: 0 });
     setCleanedMsisdns([]);
+    setResultsJobId(null);
     if (data.account) setSelectedAccount(data.account);
 
     const newList = data.msisdns || [];
     setMsisdnList(newList);
+    setUploadId(data.upload_id || null);
     setCounts({ total: data.total, scrubbed: 0, final: 0 });
 
-    // Auto-trigger scrubbing after setting the list
-    if (newList.length > 0) {
+    // Auto-trigger scrubbing from the server-side upload
+    if (data.upload_id && data.total > 0) {
+      performScrub(null, data.upload_id);
+    } else if (newList.length > 0) {
       performScrub(newList);
     } else {
       setLoading(false);
@@ -2160,11 +2176,10 @@ export default function Dashboard() {
                         // 2. Trigger Launch
                         const launchRes = await fetch(`${API_BASE}/launch-campaign`, {
                           method: 'POST',
-                          headers: { 'Content-Type': 'application/json' },
-                          body: JSON.stringify({
-                            msisdn_list: cleanedMsisdns,
-                            project_name: scheduleData.obd_name
-                          })
+                          headers: { 'Content-Type': 'application/json', ...getAuthHeaders() },
+                          body: JSON.stringify(resultsJobId
+                            ? { job_id: resultsJobId, project_name: scheduleData.obd_name }
+                            : { msisdn_list: cleanedMsisdns, project_name: scheduleData.obd_name })
                         });
 
                         if (launchRes.ok) {
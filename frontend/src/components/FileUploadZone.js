@@ -57,6 +57,7 @@ export default function FileUploadZone({ onUploadSuccess, apiBase }) {
         const formData = new FormData();
         formData.append('file', file);
         formData.append('account', selectedAccount);
+        formData.append('include_msisdns', 'false');
 
         try {
             const res = await fetch(`${apiBase}/upload`, {
@@ -228,7 +229,7 @@ export default function FileUploadZone({ onUploadSuccess, apiBase }) {
                                 maxWidth: '200px',
                                 lineHeight: '1.4'
                             }}>
-                                Upload <span style={{ color: 'var(--accent-cyan)', fontFamily: 'JetBrains Mono, monospace' }}>CSV</span> or <span style={{ color: 'var(--accent-cyan)', fontFamily: 'JetBrains Mono, monospace' }}>XLSX</span>
+                                Upload <span style={{ color: 'var(--accent-cyan)', fontFamily: 'JetBrains Mono, monospace' }}>CSV</span> or <span style={{ color: 'var(--accent-cyan)', fontFamily: 'JetBrains Mono, monospace' }}>XLSX</span>, optionally as <span style={{ color: 'var(--accent-cyan)', fontFamily: 'JetBrains Mono, monospace' }}>ZIP</span>/<span style={{ color: 'var(--accent-cyan)', fontFamily: 'JetBrains Mono, monospace' }}>GZ</span>
                             </p>
 
                             <label className="btn-primary"